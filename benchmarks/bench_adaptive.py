@@ -0,0 +1,110 @@
+import argparse
+import itertools
+import json
+import random
+import statistics
+
+from langchain_core.documents import Document
+
+from benchmarks.bench_rerank import load_dataset, recall_at
+from rowdy.adaptive import AdaptiveRetriever, Page
+from rowdy.text import estimate_tokens
+
+# ------------------------------------------------------
+# Tune adaptive retrieval depth offline: replays recorded score curves
+# through AdaptiveRetriever for a grid of (drop_off, min_score) and reports
+# the mean k, pages fetched, chunk tokens and - where the relevant urls are
+# known - recall against always fetching max_k.
+#
+#   python -m benchmarks.bench_adaptive
+#   python -m benchmarks.bench_adaptive --data recorded.jsonl
+#   python -m benchmarks.bench_adaptive --log depth.jsonl
+#
+# --data is the bench_rerank format (documents with scores, relevant
+# urls). --log is ADAPTIVE_LOG_PATH output; record it with
+# ADAPTIVE_INITIAL_K equal to KB_NUMBER_OF_RESULTS so every line holds the
+# whole curve (scores only, so no recall).
+
+
+def synthetic_dataset(queries, seed=7):
+    rng = random.Random(seed)
+    rows = []
+    for q in range(queries):
+        kind = rng.random()
+        if kind < 0.6:
+            # A few strong hits, then weak ones
+            strong = rng.randint(1, 3)
+            scores = [rng.gauss(0.75, 0.04) for _ in range(strong)] + [rng.gauss(0.42, 0.04) for _ in range(12 - strong)]
+            relevant = rng.randrange(strong)
+        elif kind < 0.85:
+            scores = [rng.gauss(0.56, 0.02) for _ in range(12)]
+            relevant = rng.randrange(12)
+        else:
+            scores = [rng.gauss(0.40, 0.03) for _ in range(12)]
+            relevant = rng.randrange(12)
+        documents = [
+            Document(page_content=f"UMass Lowell page {q}-{i}. " * 12,
+                     metadata={"score": s, "source_metadata": {"url": f"https://www.uml.edu/{q}-{i}"}})
+            for i, s in enumerate(sorted(scores, reverse=True))
+        ]
+        rows.append({"question": f"question {q}", "documents": documents,
+                     "relevant": [f"https://www.uml.edu/{q}-{relevant}"]})
+    return rows
+
+
+def load_log(path):
+    with open(path) as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    return [{"question": r["query"], "relevant": None,
+             "documents": [Document(page_content="", metadata={"score": s}) for s in r["scores"]]} for r in records]
+
+
+def list_pager(rows):
+    documents = {row["question"]: row["documents"] for row in rows}
+
+    def fetch(query, offset, size, next_token):
+        return Page(documents[query][offset:offset + size], None)
+    return fetch
+
+
+def evaluate(rows, initial_k, max_k, drop_off, min_score):
+    retriever = AdaptiveRetriever(pager=list_pager(rows), initial_k=initial_k, max_k=max_k,
+                                  drop_off=drop_off, min_score=min_score, max_latency=float("inf"))
+    ks, pages, tokens, recalls = [], [], [], []
+    for row in rows:
+        documents, record = retriever.retrieve(row["question"])
+        ks.append(record["k"])
+        pages.append(record["pages"])
+        tokens.append(sum(estimate_tokens(d.page_content) for d in documents))
+        if row["relevant"]:
+            recalls.append(recall_at(documents, row["relevant"], len(documents)))
+    result = {
+        "drop_off": drop_off,
+        "min_score": min_score,
+        "mean_k": round(statistics.mean(ks), 2),
+        "mean_pages": round(statistics.mean(pages), 2),
+        "chunk_tokens": round(statistics.mean(tokens), 1),
+    }
+    if recalls:
+        result["recall"] = round(statistics.mean(recalls), 3)
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tune adaptive retrieval depth on recorded score curves.")
+    parser.add_argument("--data", help="Recorded queries with relevance (bench_rerank format)")
+    parser.add_argument("--log", help="ADAPTIVE_LOG_PATH output (scores only)")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--initial-k", type=int, default=4)
+    parser.add_argument("--max-k", type=int, default=12)
+    args = parser.parse_args()
+
+    if args.log:
+        rows = load_log(args.log)
+    else:
+        rows = load_dataset(args.data) if args.data else synthetic_dataset(args.queries)
+    baseline = evaluate(rows, args.max_k, args.max_k, float("inf"), float("-inf"))
+    baseline.update(drop_off=None, min_score=None)
+    grid = [evaluate(rows, args.initial_k, args.max_k, d, m)
+            for d, m in itertools.product((0.05, 0.1, 0.15, 0.2), (0.4, 0.5, 0.6))]
+    print(json.dumps({"fixed": baseline, "adaptive": grid}, indent=2))
@@ -0,0 +1,148 @@
+import argparse
+import json
+import random
+import statistics
+import tempfile
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from rowdy.condense import QueryCondenser
+from rowdy.local_index import HashingEmbeddings, LocalIndex, LocalKnowledgeBaseRetriever, build_index
+from rowdy.packing import document_url
+from rowdy.text import estimate_tokens
+
+# ------------------------------------------------------
+# Retrieval quality of follow-up questions: the raw question, the raw
+# question with the last N history turns pasted in front of it, and the
+# condensed standalone query. For each, recall and precision at several
+# numberOfResults, and the prompt tokens spent on chunks plus history.
+# A precise query reaches the same recall with fewer chunks and a shorter
+# history window.
+#
+#   python -m benchmarks.bench_condense
+#   python -m benchmarks.bench_condense --conversations 400 --chunks-per-page 4
+#
+# The corpus is synthetic: one page per (topic, audience), so a follow-up
+# such as "what about for graduate students?" only has one right answer.
+
+TOPICS = [
+    ("apply for on-campus housing", "housing application"),
+    ("request an official transcript", "transcript request"),
+    ("buy a parking permit", "parking permit"),
+    ("apply for financial aid", "financial aid"),
+    ("pay the tuition bill", "tuition payment"),
+    ("register for classes", "course registration"),
+    ("get a student ID card", "UCard student ID"),
+    ("book a tutoring appointment", "tutoring appointment"),
+    ("find health insurance coverage", "student health insurance"),
+    ("get a campus job", "student employment"),
+]
+AUDIENCES = ["undergraduate", "graduate", "transfer", "international", "commuter", "online", "veteran"]
+FILLER = [
+    "Office hours are posted on the department page.",
+    "Questions can be sent to the help desk.",
+    "Deadlines may change between semesters.",
+    "Forms are available in SIS under Student Center.",
+]
+
+
+def corpus(chunks_per_page):
+    texts, columns = [], []
+    for _, subject in TOPICS:
+        for audience in AUDIENCES:
+            url = f"https://www.uml.edu/{subject.replace(' ', '-')}/{audience}"
+            for part in range(chunks_per_page):
+                texts.append(f"{subject.capitalize()} for {audience} students, part {part + 1}. "
+                             f"{audience.capitalize()} students complete the {subject} step by step. "
+                             f"{FILLER[part % len(FILLER)]}")
+                columns.append({"url": url, "uri": f"s3://kb/{subject}/{audience}/{part}.txt"})
+    return texts, columns
+
+
+# Each conversation: a few unrelated turns, the topic question, then an
+# elliptical follow-up about another audience
+def conversations(count, seed=7):
+    rng = random.Random(seed)
+    rows = []
+    for _ in range(count):
+        (ask, subject), first, second = rng.choice(TOPICS), *rng.sample(AUDIENCES, 2)
+        history = []
+        for other, _ in rng.sample([t for t in TOPICS if t[1] != subject], rng.randint(0, 3)):
+            history += [HumanMessage(f"How do I {other}?"), AIMessage(f"To {other}, see the office page.")]
+        history += [HumanMessage(f"How do I {ask} as a {first} student?"),
+                    AIMessage(f"{first.capitalize()} students {ask} online through SIS.")]
+        rows.append({
+            "question": f"what about for {second} students?",
+            "history": history,
+            "relevant": f"https://www.uml.edu/{subject.replace(' ', '-')}/{second}",
+        })
+    return rows
+
+
+def with_history(turns):
+    def query(question, history):
+        recent = [m.content for m in history if isinstance(m, HumanMessage)][-turns:]
+        return " ".join(recent + [question])
+    return query
+
+
+def evaluate(name, make_query, history_turns, rows, retriever, ks):
+    hits = {k: [] for k in ks}
+    precision = {k: [] for k in ks}
+    ranks = []
+    history_tokens = []
+    for row in rows:
+        urls = [document_url(d) for d in retriever.invoke(make_query(row["question"], row["history"]))]
+        ranks.append(1 / (urls.index(row["relevant"]) + 1) if row["relevant"] in urls else 0.0)
+        for k in ks:
+            hits[k].append(float(row["relevant"] in urls[:k]))
+            precision[k].append(urls[:k].count(row["relevant"]) / k)
+        window = row["history"][-2 * history_turns:] if history_turns else []
+        history_tokens.append(sum(estimate_tokens(m.content) for m in window))
+    return {
+        "mode": name,
+        "history_turns": history_turns,
+        **{f"hit@{k}": round(statistics.mean(v), 3) for k, v in hits.items()},
+        **{f"precision@{k}": round(statistics.mean(v), 3) for k, v in precision.items()},
+        "mrr": round(statistics.mean(ranks), 3),
+        "history_tokens": round(statistics.mean(history_tokens), 1),
+    }
+
+
+# The cheapest (numberOfResults, history window) reaching the recall the
+# raw question gets with the largest k
+def recommend(results, ks, chunk_tokens):
+    target = next(r for r in results if r["mode"] == "raw")[f"hit@{max(ks)}"]
+    options = [
+        (k * chunk_tokens + r["history_tokens"], r["mode"], k, r["history_turns"])
+        for r in results for k in ks if r[f"hit@{k}"] >= target
+    ]
+    tokens, mode, k, turns = min(options)
+    return {"target_hit": target, "mode": mode, "number_of_results": k, "history_turns": turns,
+            "prompt_tokens": round(tokens, 1),
+            "baseline_prompt_tokens": round(max(ks) * chunk_tokens + max(r["history_tokens"] for r in results), 1)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark follow-up question condensation for retrieval.")
+    parser.add_argument("--conversations", type=int, default=200)
+    parser.add_argument("--chunks-per-page", type=int, default=3)
+    args = parser.parse_args()
+
+    texts, columns = corpus(args.chunks_per_page)
+    rows = conversations(args.conversations)
+    ks = [1, 3, 6, 12]
+    chunk_tokens = statistics.mean(estimate_tokens(t) for t in texts)
+    condenser = QueryCondenser(history_turns=1)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        embeddings = HashingEmbeddings()
+        build_index(texts, columns, embeddings, tmp)
+        retriever = LocalKnowledgeBaseRetriever(index=LocalIndex(tmp), embeddings=embeddings, k=max(ks))
+        results = [evaluate("raw", lambda q, h: q, 0, rows, retriever, ks)]
+        for turns in (1, 2, 4):
+            results.append(evaluate("raw+history", with_history(turns), turns, rows, retriever, ks))
+        # The rewrite needs one turn of history; the answer prompt can drop it
+        results.append(evaluate("condensed", condenser.condense, 0, rows, retriever, ks))
+
+    print(json.dumps({"results": results, "recommendation": recommend(results, ks, chunk_tokens)}, indent=2))
@@ -0,0 +1,114 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# ------------------------------------------------------
+# Cold-start and warm latency of the Lambda chat handler
+# (tests/old_src/app/main.py) with a stubbed agent runtime. Each cold start
+# is a fresh interpreter: import time (from `python -X importtime`), then
+# the first invocation (which builds the pooled client), then warm
+# invocations that reuse it. Nothing is sent over the network.
+#
+#   python -m benchmarks.bench_lambda --cold-starts 5 --warm 50
+#   python -m benchmarks.bench_lambda --init-type provisioned-concurrency
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tests", "old_src", "app")
+
+# Runs inside the fresh interpreter
+BOOTSTRAP = r"""
+import json, sys, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+
+import agent_client
+
+def invoke_agent(**kwargs):
+    def completion():
+        time.sleep(AGENT_MS / 1000)
+        for part in ("The Registrar's Office ", "is in University Crossing."):
+            yield {"chunk": {"bytes": part.encode()}}
+    return {"completion": completion(), "sessionId": kwargs["sessionId"]}
+
+# Stub the call, not the client: building the client is part of a cold start
+build = agent_client.runtime_client
+def runtime_client(*args, **kwargs):
+    client = build(*args, **kwargs)
+    client.invoke_agent = invoke_agent
+    return client
+agent_client.runtime_client = runtime_client
+main.llm.runtime_client = runtime_client
+if main.llm._agent is not None:
+    main.llm._agent.client.invoke_agent = invoke_agent
+
+event = {"body": json.dumps({"user_message": "Where is the registrar?", "session_id": "bench"})}
+main.handler(event, None)
+first = time.perf_counter()
+warm = []
+for i in range(WARM):
+    t = time.perf_counter()
+    main.handler(event, None)
+    warm.append(time.perf_counter() - t)
+print(json.dumps({"import": imported - start, "first": first - imported, "warm": warm}))
+"""
+
+
+def cold_start(warm, agent_ms, init_type, importtime=False):
+    env = {
+        **os.environ,
+        "AWS_LAMBDA_FUNCTION_NAME": "rowdy-bench",
+        "AGENT_ID": "BENCHAGENT",
+        "AGENT_ALIAS": "BENCHALIAS",
+        "AWS_ACCESS_KEY_ID": "AKIABENCHMARK",
+        "AWS_SECRET_ACCESS_KEY": "benchmark",
+        "AWS_DEFAULT_REGION": "us-east-1",
+    }
+    if init_type:
+        env["AWS_LAMBDA_INITIALIZATION_TYPE"] = init_type
+    code = f"WARM = {warm}\nAGENT_MS = {agent_ms}\n" + BOOTSTRAP
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", code]
+    result = subprocess.run(command, cwd=APP_DIR, env=env, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+
+# Largest cumulative import times, from -X importtime output
+def slowest_imports(stderr, top):
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if cumulative.strip().isdigit():
+            rows.append((int(cumulative), name.strip()))
+    return {name: round(us / 1000, 1) for us, name in sorted(rows, reverse=True)[:top]}
+
+
+def run(cold_starts, warm, agent_ms, init_type, top):
+    samples = [cold_start(warm, agent_ms, init_type)[0] for _ in range(cold_starts)]
+    _, stderr = cold_start(0, agent_ms, init_type, importtime=True)
+    warm_samples = [s for sample in samples for s in sample["warm"]]
+    ms = lambda values: round(statistics.median(values) * 1000, 2)
+    return {
+        "init_type": init_type or "on-demand",
+        "import_p50_ms": ms([s["import"] for s in samples]),
+        "first_invoke_p50_ms": ms([s["first"] for s in samples]),
+        "cold_total_p50_ms": ms([s["import"] + s["first"] for s in samples]),
+        "warm_p50_ms": ms(warm_samples) if warm_samples else None,
+        "warm_p95_ms": round(sorted(warm_samples)[int(len(warm_samples) * 0.95) - 1] * 1000, 2) if warm_samples else None,
+        "slowest_imports": slowest_imports(stderr, top),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark Lambda handler cold and warm latency.")
+    parser.add_argument("--cold-starts", type=int, default=5)
+    parser.add_argument("--warm", type=int, default=50, help="Warm invocations per cold start")
+    parser.add_argument("--agent-ms", type=float, default=0, help="Simulated agent latency")
+    parser.add_argument("--init-type", choices=["on-demand", "provisioned-concurrency", "snap-start"])
+    parser.add_argument("--top", type=int, default=8, help="Slowest imports to list")
+    args = parser.parse_args()
+    init_type = None if args.init_type in (None, "on-demand") else args.init_type
+    print(json.dumps(run(args.cold_starts, args.warm, args.agent_ms, init_type, args.top), indent=2))
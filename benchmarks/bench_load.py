@@ -0,0 +1,205 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+import numpy as np
+from langchain_core.runnables.history import RunnableWithMessageHistory
+
+from rowdy.fakes import sample_documents
+from rowdy.replay import Cassette, install_recorder, install_replay, retrieval_results, synthetic_cassette
+from rowdy.resources import Resources, Settings
+from rowdy.text import estimate_tokens
+
+# ------------------------------------------------------
+# Latency and throughput of the app's chain (Resources.chain with session
+# history, as in rowdy_stream.py) at N concurrent sessions, against
+# recorded Bedrock / OpenAI responses replayed with their original timing.
+#
+# Record once against the real services (settings from the environment):
+#   python -m benchmarks.bench_load --record cassette.json
+# Replay, save results and compare with an earlier run:
+#   python -m benchmarks.bench_load --cassette cassette.json --sessions 1 8 32 --output new.json --compare old.json
+# Without --cassette, a synthetic cassette with --retrieval-ms / --first-token-ms / --token-ms is used.
+
+QUESTIONS = [
+    "Where is the Registrar's Office?",
+    "When is the add/drop deadline?",
+    "How do I get a parking permit?",
+    "What dining options are on East Campus?",
+    "How do I apply for on-campus housing?",
+]
+
+# Relative increase of a p95 over the baseline that counts as a regression
+REGRESSION_THRESHOLD = 0.10
+
+
+def percentiles(samples):
+    if not samples:
+        return {}
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+    return {"p50": round(p50 * 1000, 1), "p95": round(p95 * 1000, 1), "p99": round(p99 * 1000, 1)}
+
+
+def make_resources(model, settings=None, cassette=None, speed=1.0, async_mode=False):
+    values = {
+        "MODEL": model,
+        "KB_ID": "BENCHKBID",
+        "OPENAI_API_KEY": "sk-benchmark",
+        # Exact matches only: the semantic cache embeds every question with Titan, which is not recorded
+        "ANSWER_CACHE": "true",
+        "ASYNC_MODE": str(async_mode),
+        **(settings or {}),
+    }
+    resources = Resources(Settings(values))
+    if cassette is not None:
+        install_replay(resources, cassette, speed)
+    return resources
+
+
+def chat_turn(resources, chain, session_id, question):
+    config = {"configurable": {"session_id": session_id}}
+    if resources.async_mode:
+        stream = resources.async_runner.stream(chain, {"question": question}, config)
+    else:
+        stream = chain.stream({"question": question}, config)
+    start = time.perf_counter()
+    first = None
+    text = ""
+    for chunk in stream:
+        if "response" in chunk:
+            first = first or time.perf_counter()
+            text += chunk["response"]
+    end = time.perf_counter()
+    return {
+        "ttft": (first or end) - start,
+        "total": end - start,
+        "tokens": estimate_tokens(text),
+        "tokens_per_sec": estimate_tokens(text) / (end - first) if first and end > first else 0.0,
+    }
+
+
+def run_level(resources, chain, sessions, turns):
+    samples = []
+    lock = threading.Lock()
+
+    def session(index):
+        session_id = uuid.uuid4().hex
+        for turn in range(turns):
+            # Unique questions, so the answer and retrieval caches never hit
+            question = f"{QUESTIONS[(index + turn) % len(QUESTIONS)]} ({session_id[:8]}-{turn})"
+            result = chat_turn(resources, chain, session_id, question)
+            with lock:
+                samples.append(result)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=session, args=(i,)) for i in range(sessions)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - start
+    return {
+        "sessions": sessions,
+        "turns": len(samples),
+        "ttft_ms": percentiles([s["ttft"] for s in samples]),
+        "total_ms": percentiles([s["total"] for s in samples]),
+        "tokens_per_sec_p50": round(float(np.median([s["tokens_per_sec"] for s in samples])), 1),
+        "throughput_turns_per_sec": round(len(samples) / wall, 2),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(model, cassette, sessions, turns, speed, async_mode):
+    resources = make_resources(model, cassette=cassette, speed=speed, async_mode=async_mode)
+    chain = RunnableWithMessageHistory(
+        resources.warm().chain,
+        resources.session_history,
+        input_messages_key="question",
+        history_messages_key="history",
+        output_messages_key="response",
+    )
+    # One untimed turn so lazy imports and client setup are not measured
+    chat_turn(resources, chain, "warmup", "warmup")
+    return {
+        "commit": git_commit(),
+        "model": model,
+        "async_mode": async_mode,
+        "speed": speed,
+        "levels": [run_level(resources, chain, n, turns) for n in sessions],
+    }
+
+
+def compare(results, baseline):
+    regressions = []
+    previous = {level["sessions"]: level for level in baseline["levels"]}
+    for level in results["levels"]:
+        before = previous.get(level["sessions"])
+        if before is None:
+            continue
+        for metric in ("ttft_ms", "total_ms"):
+            old, new = before[metric].get("p95"), level[metric].get("p95")
+            if old and new > old * (1 + REGRESSION_THRESHOLD):
+                regressions.append(f"{level['sessions']} sessions: {metric} p95 {old} -> {new}")
+    return regressions
+
+
+def record(path, model, questions):
+    cassette = Cassette()
+    resources = make_resources(model, settings=dict(os.environ))
+    install_recorder(resources, cassette)
+    for question in questions:
+        for chunk in resources.chain.stream({"question": question, "history": []}):
+            pass
+    cassette.save(path)
+    return {k: len(v) for k, v in cassette.data.items()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the chat chain against replayed backends.")
+    parser.add_argument("--model", default="ANTHROPIC", choices=["ANTHROPIC", "OPENAI"])
+    parser.add_argument("--record", metavar="PATH", help="Record a cassette against the real services and exit")
+    parser.add_argument("--cassette", metavar="PATH")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--turns", type=int, default=3, help="Turns per session")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay speed factor (2 = twice as fast)")
+    parser.add_argument("--async", dest="async_mode", action="store_true", help="Run turns on the AsyncRunner")
+    parser.add_argument("--retrieval-ms", type=float, default=250)
+    parser.add_argument("--first-token-ms", type=float, default=400)
+    parser.add_argument("--token-ms", type=float, default=15)
+    parser.add_argument("--output", metavar="PATH", help="Save results as JSON")
+    parser.add_argument("--compare", metavar="PATH", help="Fail if p95 latency regressed against these results")
+    args = parser.parse_args()
+
+    if args.record:
+        print(json.dumps(record(args.record, args.model, QUESTIONS), indent=2))
+        sys.exit(0)
+
+    cassette = Cassette.load(args.cassette) if args.cassette else synthetic_cassette(
+        "The Registrar's Office is in University Crossing, Suite 360, open 8:30 to 5 on weekdays. "
+        "You can also reach them by email or through the SIS self-service pages.",
+        retrieval_results(sample_documents()),
+        args.retrieval_ms, args.first_token_ms, args.token_ms,
+    )
+    results = run(args.model, cassette, args.sessions, args.turns, args.speed, args.async_mode)
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f))
+        for line in regressions:
+            print("REGRESSION", line, file=sys.stderr)
+        sys.exit(1 if regressions else 0)
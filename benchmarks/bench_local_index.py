@@ -0,0 +1,68 @@
+import argparse
+import json
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+from rowdy.local_index import LocalIndex, build_index
+
+# ------------------------------------------------------
+# Query latency of the local index (flat float32, flat float16 and IVF)
+# and IVF recall@k against exact search, on random unit vectors.
+#
+#   python -m benchmarks.bench_local_index --chunks 20000 --dim 1024
+
+
+class RandomEmbeddings:
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    def embed_documents(self, texts):
+        return [self.vectors[int(t)] for t in texts]
+
+
+def measure(index, queries, k, nprobe):
+    latencies = []
+    results = []
+    for query in queries:
+        start = time.perf_counter()
+        results.append({i for i, _ in index.search(query, k, nprobe)})
+        latencies.append(time.perf_counter() - start)
+    return results, {
+        "p50_ms": round(statistics.median(latencies) * 1000, 3),
+        "p95_ms": round(float(np.percentile(latencies, 95)) * 1000, 3),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the local knowledge base index.")
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("-k", type=int, default=12)
+    parser.add_argument("--nprobe", type=int, default=8)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    # Clustered data so IVF has structure to exploit
+    centers = rng.normal(size=(64, args.dim))
+    vectors = centers[rng.integers(0, 64, args.chunks)] + rng.normal(scale=0.8, size=(args.chunks, args.dim))
+    queries = vectors[rng.integers(0, args.chunks, args.queries)] + rng.normal(scale=0.3, size=(args.queries, args.dim))
+    texts = [str(i) for i in range(args.chunks)]
+    columns = [{"url": "", "uri": ""}] * args.chunks
+    embeddings = RandomEmbeddings(vectors)
+
+    report = {}
+    exact = None
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, dtype, lists in [("flat_f32", "float32", 0), ("flat_f16", "float16", 0),
+                                   ("ivf_f32", "float32", int(np.sqrt(args.chunks)))]:
+            build_index(texts, columns, embeddings, f"{tmp}/{name}", dtype=dtype, ivf_lists=lists)
+            results, timing = measure(LocalIndex(f"{tmp}/{name}"), queries, args.k, args.nprobe)
+            if exact is None:
+                exact = results
+            timing["recall_vs_exact"] = round(statistics.mean(len(a & b) / args.k for a, b in zip(results, exact)), 3)
+            report[name] = timing
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,82 @@
+import argparse
+import json
+import statistics
+import time
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+
+from rowdy.fakes import sample_documents
+from rowdy.packing import ContextPacker
+from rowdy.prompts import PromptAssembler, token_counter
+from tools.agent import load_prompts
+
+# ------------------------------------------------------
+# Prompt size per request, offline: tokens per segment (static system,
+# history, retrieved context, question) for each model's counter, the share
+# that is a cacheable prefix, and the time to assemble the prompt compared
+# with formatting the whole template, context included, on every request.
+# The Bedrock agent templates in tools/prompts are counted too.
+#
+#   python -m benchmarks.bench_prompt --turns 6 --chunks 12
+
+# The previous layout, with the retrieved context inside the system prompt
+TEMPLATE_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", """
+You are Rowdy the Riverhawk, a chatbot for the University of Massachusetts Lowell. Provide answers in the style of a tour guide.
+Please only use answers that are present in the search results here:\n {context}
+All users are full time students unless stated otherwise
+Please only answer questions about the University of Massachusetts Lowell.
+"""),
+    MessagesPlaceholder(variable_name="history"),
+    ("human", "{question}"),
+])
+
+
+def conversation(turns, chunks):
+    context = ContextPacker(max_tokens=10_000)(sample_documents(chunks))
+    history = []
+    requests = []
+    for turn in range(turns):
+        question = f"Question {turn + 1}: what are the office hours and where is the office located?"
+        requests.append({"question": question, "history": list(history), "context": context})
+        history += [HumanMessage(question), AIMessage("The office is open 9 to 5 in University Crossing. " * 4)]
+    return requests
+
+
+def timed(render, requests, rounds):
+    samples = []
+    for _ in range(rounds):
+        for request in requests:
+            start = time.perf_counter()
+            render(request)
+            samples.append(time.perf_counter() - start)
+    return round(statistics.median(samples) * 1_000_000, 1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure prompt size and assembly time per request.")
+    parser.add_argument("--turns", type=int, default=6)
+    parser.add_argument("--chunks", type=int, default=12)
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    requests = conversation(args.turns, args.chunks)
+    assembler = PromptAssembler()
+    report = {"requests": {}, "assembly_p50_us": {
+        "template": timed(TEMPLATE_PROMPT.invoke, requests, args.rounds),
+        "assembler": timed(assembler.invoke, requests, args.rounds),
+        "assembler_with_markers": timed(PromptAssembler(cache_markers=True).invoke, requests, args.rounds),
+    }}
+    for model in ("ANTHROPIC", "OPENAI"):
+        counts = [assembler.token_counts(request, model) for request in requests]
+        report["requests"][model] = {
+            "per_turn": counts,
+            "mean_total": round(statistics.mean(c["total"] for c in counts), 1),
+            "cacheable_share": round(sum(c["cacheable"] for c in counts) / sum(c["total"] for c in counts), 3),
+        }
+    report["agent_templates"] = {
+        model: {name: token_counter(model)(text) for name, text in load_prompts().items()}
+        for model in ("ANTHROPIC", "OPENAI")
+    }
+    print(json.dumps(report, indent=2))
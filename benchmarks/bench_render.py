@@ -0,0 +1,71 @@
+import argparse
+import json
+import random
+import time
+
+from rowdy.render import StreamRenderer
+
+# ------------------------------------------------------
+# CPU time to render one streamed answer, per-token re-render vs.
+# StreamRenderer. The fake placeholder does what Streamlit does with each
+# update: encode the full string for the websocket.
+#
+#   python -m benchmarks.bench_render --tokens 2048
+
+
+class EncodingPlaceholder:
+    def __init__(self):
+        self.updates = 0
+        self.bytes_sent = 0
+
+    def markdown(self, body):
+        payload = body.encode("utf-8")
+        self.updates += 1
+        self.bytes_sent += len(payload)
+
+
+def tokens(count, seed=0):
+    rng = random.Random(seed)
+    words = ["UMass", "Lowell", "tuition", "is", "$", "16,000", "per", "year", "and", "the", "Registrar", "helps"]
+    return [" " + rng.choice(words) for _ in range(count)]
+
+
+def per_token(chunks, placeholder):
+    full_response = ''
+    for chunk in chunks:
+        full_response += chunk
+        placeholder.markdown(full_response.replace('$', r'\$'))
+    placeholder.markdown(full_response.replace('$', r'\$'))
+    return full_response
+
+
+def throttled(chunks, placeholder):
+    renderer = StreamRenderer(placeholder)
+    for chunk in chunks:
+        renderer.write(chunk)
+    return renderer.close()
+
+
+def run(count, repeat):
+    chunks = tokens(count)
+    report = {}
+    for name, render in [("per_token", per_token), ("throttled", throttled)]:
+        placeholder = EncodingPlaceholder()
+        start = time.process_time()
+        for _ in range(repeat):
+            render(chunks, placeholder)
+        cpu = (time.process_time() - start) / repeat
+        report[name] = {
+            "cpu_ms_per_response": round(cpu * 1000, 3),
+            "updates_per_response": placeholder.updates // repeat,
+            "kb_sent_per_response": round(placeholder.bytes_sent / repeat / 1024, 1),
+        }
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark streaming render cost.")
+    parser.add_argument("--tokens", type=int, default=2048)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    print(json.dumps(run(args.tokens, args.repeat), indent=2))
@@ -0,0 +1,119 @@
+import argparse
+import json
+import random
+import statistics
+import time
+
+from langchain_core.documents import Document
+
+from rowdy.fakes import LatencyRetriever
+from rowdy.packing import document_url
+from rowdy.rerank import BM25Reranker, CrossEncoderReranker, RerankingRetriever
+
+# ------------------------------------------------------
+# Recall@k of the knowledge base order vs. local rerankers, and the
+# latency each reranker adds per query.
+#
+#   python -m benchmarks.bench_rerank
+#   python -m benchmarks.bench_rerank --data recorded.jsonl
+#
+# Recorded data is one JSON object per line:
+#   {"question": ..., "documents": [{"page_content", "metadata"}], "relevant": [url, ...]}
+# Without --data a synthetic set mimicking vector-only retrieval is used:
+# the relevant chunk mentions the query terms, but its vector score is noisy.
+
+TOPICS = [
+    ("registrar transcript request", "The Registrar processes official transcript requests online through SIS."),
+    ("parking permit commuter", "Commuter students buy a parking permit for the East Campus garage."),
+    ("dining hall hours", "Fox Dining Hall hours are 7 a.m. to 10 p.m. on weekdays."),
+    ("add drop deadline", "The add/drop deadline is the fifth day of classes each semester."),
+    ("financial aid fafsa", "Submit the FAFSA by March 1 to be considered for financial aid."),
+    ("housing application", "Returning students complete the housing application in February."),
+    ("library study rooms", "O'Leary Library study rooms can be reserved for two hours."),
+    ("shuttle schedule", "The campus shuttle runs every ten minutes between North and South campus."),
+    ("graduate admissions", "Graduate admissions requires two letters of recommendation."),
+    ("health services", "Wellness Center health services accept walk-ins on weekdays."),
+    ("career services resume", "Career Services reviews your resume and offers mock interviews."),
+    ("tuition payment plan", "The tuition payment plan splits the semester bill into monthly payments."),
+]
+
+
+def synthetic_dataset(queries, seed=7):
+    rng = random.Random(seed)
+    data = []
+    for q in range(queries):
+        topic, fact = TOPICS[q % len(TOPICS)]
+        documents = []
+        for i, (other, other_fact) in enumerate(rng.sample(TOPICS, 12)):
+            relevant = other == topic
+            documents.append(Document(
+                page_content=other_fact + " More information is available on the UMass Lowell website.",
+                metadata={
+                    "score": round((0.62 if relevant else 0.55) + rng.gauss(0, 0.06), 4),
+                    "source_metadata": {"url": f"https://www.uml.edu/{other.replace(' ', '-')}"},
+                },
+            ))
+        if not any(d.page_content.startswith(fact) for d in documents):
+            documents[-1] = Document(
+                page_content=fact,
+                metadata={"score": 0.5, "source_metadata": {"url": f"https://www.uml.edu/{topic.replace(' ', '-')}"}},
+            )
+        documents.sort(key=lambda d: d.metadata["score"], reverse=True)
+        question = f"what do I need to know about {topic}?"
+        data.append({"question": question, "documents": documents,
+                     "relevant": [f"https://www.uml.edu/{topic.replace(' ', '-')}"]})
+    return data
+
+
+def load_dataset(path):
+    with open(path) as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    for row in rows:
+        row["documents"] = [Document(**d) for d in row["documents"]]
+    return rows
+
+
+def recall_at(ranked, relevant, k):
+    urls = {document_url(d) for d in ranked[:k]}
+    return len(urls & set(relevant)) / len(relevant)
+
+
+def evaluate(name, reorder, data, ks):
+    latencies = []
+    recalls = {k: [] for k in ks}
+    for row in data:
+        start = time.perf_counter()
+        ranked = reorder(row["question"], row["documents"])
+        latencies.append(time.perf_counter() - start)
+        for k in ks:
+            recalls[k].append(recall_at(ranked, row["relevant"], k))
+    return {
+        "reranker": name,
+        **{f"recall@{k}": round(statistics.mean(v), 3) for k, v in recalls.items()},
+        "p50_ms": round(statistics.median(latencies) * 1000, 3),
+        "max_ms": round(max(latencies) * 1000, 3),
+    }
+
+
+def reorder_with(reranker, top_n):
+    wrapper = RerankingRetriever(retriever=LatencyRetriever(latency=0), reranker=reranker, top_n=top_n, latency_budget=None)
+    return wrapper.rerank
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark local rerankers.")
+    parser.add_argument("--data", help="Recorded queries (JSON lines)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--cross-encoder-model")
+    parser.add_argument("--cross-encoder-tokenizer")
+    args = parser.parse_args()
+
+    data = load_dataset(args.data) if args.data else synthetic_dataset(args.queries)
+    ks = [1, 2, 4, 8]
+    results = [evaluate("knowledge base order", lambda q, docs: docs, data, ks)]
+    for alpha in (1.0, 0.5):
+        results.append(evaluate(f"bm25 alpha={alpha}", reorder_with(BM25Reranker(alpha=alpha), max(ks)), data, ks))
+    if args.cross_encoder_model:
+        encoder = CrossEncoderReranker(args.cross_encoder_model, args.cross_encoder_tokenizer)
+        results.append(evaluate("cross-encoder", reorder_with(encoder, max(ks)), data, ks))
+    print(json.dumps(results, indent=2))
@@ -0,0 +1,92 @@
+import argparse
+import json
+import statistics
+import time
+import uuid
+
+from langchain_core.runnables.history import RunnableWithMessageHistory
+
+from rowdy.fakes import LatencyChatModel, LatencyRetriever, sample_documents
+from rowdy.resources import Resources
+from rowdy.speculative import SpeculativeRetriever
+
+# ------------------------------------------------------
+# Time-to-first-token with and without speculative retrieval, in the
+# order rowdy_stream.py runs a turn: admit the client, prefetch, render
+# the chat history and echo the message (`--render-ms`), then stream the
+# chain with history. With speculation the Retrieve call overlaps the
+# render.
+#
+# Each conversation is a first question and a follow-up. Follow-ups are
+# prefetched as their local standalone rewrite (CONDENSE = "heuristic",
+# the default); with CONDENSE = "model" they are not prefetched, so that
+# mode is not measured here.
+#
+#   python -m benchmarks.bench_speculative --runs 20
+
+CONVERSATION = ["How do I apply for on-campus housing?", "what about for grad students?"]
+
+
+def build(retrieval_ms, first_token_ms, speculative):
+    resources = Resources({"MODEL": "ANTHROPIC", "SPECULATIVE_RETRIEVAL": str(speculative).lower()})
+    base = LatencyRetriever(documents=sample_documents(), latency=retrieval_ms / 1000)
+    resources.__dict__.update(
+        retriever=SpeculativeRetriever(retriever=base),
+        model=LatencyChatModel(first_token_latency=first_token_ms / 1000, token_latency=0),
+    )
+    chain = RunnableWithMessageHistory(
+        resources.chain,
+        resources.session_history,
+        input_messages_key="question",
+        history_messages_key="history",
+        output_messages_key="response",
+    )
+    return resources, chain
+
+
+def time_to_first_token(resources, chain, question, session_id, render_seconds):
+    start = time.perf_counter()
+    first_token = None
+    with resources.admit(session_id):
+        if resources.speculative_mode:
+            resources.prefetch(question, session_id)
+        time.sleep(render_seconds)
+        for chunk in chain.stream({"question": question}, {"configurable": {"session_id": session_id}}):
+            if "response" in chunk and first_token is None:
+                first_token = time.perf_counter() - start
+    return first_token
+
+
+def summarize(samples):
+    return {
+        "ttft_p50_ms": round(statistics.median(samples) * 1000, 1),
+        "ttft_max_ms": round(max(samples) * 1000, 1),
+    }
+
+
+def run(runs, retrieval_ms, render_ms, first_token_ms):
+    results = {}
+    for name, speculative in [("baseline", False), ("speculative", True)]:
+        resources, chain = build(retrieval_ms, first_token_ms, speculative)
+        samples = {"first_turn": [], "follow_up": []}
+        for _ in range(runs):
+            session_id = uuid.uuid4().hex
+            for turn, question in zip(samples, CONVERSATION):
+                samples[turn].append(time_to_first_token(resources, chain, question, session_id, render_ms / 1000))
+        results[name] = {turn: summarize(values) for turn, values in samples.items()}
+        results[name]["retriever_stats"] = resources.retriever.stats()
+    results["saved_p50_ms"] = {
+        turn: round(results["baseline"][turn]["ttft_p50_ms"] - results["speculative"][turn]["ttft_p50_ms"], 1)
+        for turn in ("first_turn", "follow_up")
+    }
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark speculative retrieval.")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--retrieval-ms", type=float, default=250)
+    parser.add_argument("--render-ms", type=float, default=120)
+    parser.add_argument("--first-token-ms", type=float, default=300)
+    args = parser.parse_args()
+    print(json.dumps(run(args.runs, args.retrieval_ms, args.render_ms, args.first_token_ms), indent=2))
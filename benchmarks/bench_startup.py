@@ -0,0 +1,55 @@
+import argparse
+import json
+import statistics
+import time
+
+from rowdy.resources import Resources, build_resources
+
+# ------------------------------------------------------
+# Per-rerun setup cost: rebuilding clients, retriever, model and chain on
+# every Streamlit rerun (the old behaviour) vs. reusing the process-wide
+# Resources. Uses dummy credentials; nothing is sent over the network.
+#
+#   python -m benchmarks.bench_startup --model ANTHROPIC
+
+
+def settings(model):
+    return {
+        "MODEL": model,
+        "KB_ID": "BENCHKBID",
+        "AWS_ACCESS_KEY_ID": "AKIABENCHMARK",
+        "AWS_SECRET_ACCESS_KEY": "benchmark",
+        "OPENAI_API_KEY": "sk-benchmark",
+    }
+
+
+def run(model, reruns):
+    values = settings(model)
+    rebuild = []
+    for _ in range(reruns):
+        start = time.perf_counter()
+        build_resources(values)
+        rebuild.append(time.perf_counter() - start)
+
+    cached = Resources(values).warm()
+    reuse = []
+    for _ in range(reruns):
+        start = time.perf_counter()
+        cached.chain
+        cached.retriever
+        reuse.append(time.perf_counter() - start)
+
+    return {
+        "model": model,
+        "rebuild_p50_ms": round(statistics.median(rebuild) * 1000, 2),
+        "first_build_ms": round(rebuild[0] * 1000, 2),
+        "cached_p50_ms": round(statistics.median(reuse) * 1000, 4),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark per-rerun resource construction.")
+    parser.add_argument("--model", default="ANTHROPIC", choices=["ANTHROPIC", "OPENAI"])
+    parser.add_argument("--reruns", type=int, default=10)
+    args = parser.parse_args()
+    print(json.dumps(run(args.model, args.reruns), indent=2))
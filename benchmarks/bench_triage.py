@@ -0,0 +1,71 @@
+import argparse
+import json
+import time
+
+from rowdy.chain import build_chain
+from rowdy.fakes import LatencyChatModel, LatencyRetriever, sample_documents
+from rowdy.triage import QueryTriage, with_triage
+
+# ------------------------------------------------------
+# Query triage on a mix of chat traffic: share of requests per route and
+# latency saved against sending everything through the full pipeline.
+# The full path retrieves 12 chunks and writes a long answer; the factoid
+# path retrieves 3 and is capped to a short one.
+#
+#   python -m benchmarks.bench_triage --scale 0.2
+
+QUESTIONS = [
+    "hi",
+    "thanks!",
+    "Tell me a joke",
+    "What's the registrar's phone number?",
+    "Where is University Crossing?",
+    "When is the add/drop deadline?",
+    "What are the library hours?",
+    "Who is the dean of the Kennedy College of Sciences?",
+    "How do I transfer credits from a community college and what should I do first?",
+    "Can you explain the difference between the BS and BA in computer science?",
+    "Why should I live on campus my first year?",
+    "I'm a part-time student who works nights. How can I plan my schedule to graduate on time?",
+]
+
+
+def fake_chain(documents, answer_words, retrieval_s, first_token_s, token_s):
+    model = LatencyChatModel(response=" ".join(["word"] * answer_words),
+                             first_token_latency=first_token_s, token_latency=token_s)
+    return build_chain(LatencyRetriever(documents=sample_documents(documents), latency=retrieval_s), model)
+
+
+def run(scale, rounds):
+    full = fake_chain(12, 200, 0.30 * scale, 0.45 * scale, 0.015 * scale)
+    factoid = fake_chain(3, 25, 0.22 * scale, 0.35 * scale, 0.015 * scale)
+    triage = QueryTriage()
+    chain = with_triage(full, factoid, triage)
+
+    baseline = []
+    for _ in range(rounds):
+        for question in QUESTIONS:
+            start = time.perf_counter()
+            list(full.stream({"question": question, "history": []}))
+            baseline.append(time.perf_counter() - start)
+            list(chain.stream({"question": question, "history": []}))
+
+    stats = triage.stats()
+    routed = sum(r["seconds"] for r in stats["routes"].values())
+    return {
+        "routes": {
+            name: {"share": round(r["share"], 3), "mean_ms": round(r["mean_ms"], 1)}
+            for name, r in stats["routes"].items()
+        },
+        "all_full_mean_ms": round(sum(baseline) / len(baseline) * 1000, 1),
+        "triaged_mean_ms": round(routed / stats["requests"] * 1000, 1),
+        "saved_ms_per_request": round((sum(baseline) - routed) / stats["requests"] * 1000, 1),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark query triage routes.")
+    parser.add_argument("--scale", type=float, default=1.0, help="Scale all simulated latencies")
+    parser.add_argument("--rounds", type=int, default=1)
+    args = parser.parse_args()
+    print(json.dumps(run(args.scale, args.rounds), indent=2))
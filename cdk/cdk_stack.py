@@ -137,6 +137,7 @@ class CdkStack(Stack):
             # ),
             vector_ingestion_configuration=bedrock.CfnDataSource.VectorIngestionConfigurationProperty(
                 chunking_configuration=bedrock.CfnDataSource.ChunkingConfigurationProperty(
+                    # Content is chunked before upload by rowdy/ingest.py: one object per chunk
                     chunking_strategy="NONE",
 
                     # # the properties below are optional
@@ -149,7 +150,72 @@ class CdkStack(Stack):
         )
 
         CfnOutput(self, "Knowledge Base ID: ", value=cfn_knowledge_base.attr_knowledge_base_id)
+        # For `python -m rowdy.ingest sync --data-source-id`
+        CfnOutput(self, "Data Source ID: ", value=cfn_data_source.attr_data_source_id)
 
+        # Optional chat Lambda (tests/old_src): CHAT_LAMBDA = "zip" deploys the
+        # buffered handler on the Python 3.12 runtime, where SnapStart is
+        # available; "image" deploys the streaming container behind the Lambda
+        # Web Adapter. CHAT_LAMBDA_PROVISIONED keeps that many environments warm;
+        # Lambda does not allow it on a SnapStart version, so pick one of the two.
+        # CHAT_LAMBDA_RESERVED caps concurrent invocations (size it from the
+        # Bedrock quota); requests over it get an immediate 429 from Lambda.
+        chat_lambda = os.getenv("CHAT_LAMBDA")
+        if chat_lambda:
+            self.add_chat_lambda(
+                chat_lambda,
+                snap_start=os.getenv("CHAT_LAMBDA_SNAPSTART", "").lower() in ("1", "true", "yes"),
+                provisioned=int(os.getenv("CHAT_LAMBDA_PROVISIONED") or 0),
+                reserved=int(os.getenv("CHAT_LAMBDA_RESERVED") or 0),
+            )
 
+    def add_chat_lambda(self, mode: str, snap_start: bool = False, provisioned: int = 0,
+                        reserved: int = 0) -> _lambda.Alias:
+        if snap_start and provisioned:
+            raise ValueError("CHAT_LAMBDA_SNAPSTART and CHAT_LAMBDA_PROVISIONED cannot be combined: "
+                             "Lambda does not support provisioned concurrency on a SnapStart version")
+        source = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tests", "old_src")
+        environment = {
+            "AGENT_ID": os.getenv("AGENT_ID", ""),
+            "AGENT_ALIAS": os.getenv("AGENT_ALIAS", ""),
+            "AGENT_TIMEOUT": os.getenv("AGENT_TIMEOUT", "60"),
+        }
+        if mode == "image":
+            function = _lambda.DockerImageFunction(self, "ChatFunction",
+                code=_lambda.DockerImageCode.from_image_asset(source, target="stream"),
+                memory_size=1024,
+                timeout=Duration.seconds(120),
+                environment=environment,
+                reserved_concurrent_executions=reserved or None,
+            )
+        elif mode == "zip":
+            # boto3 ships with the runtime and python-dotenv is only used locally,
+            # so the app directory is deployed as is
+            function = _lambda.Function(self, "ChatFunction",
+                runtime=_lambda.Runtime.PYTHON_3_12,
+                handler="main.handler",
+                code=_lambda.Code.from_asset(os.path.join(source, "app"), exclude=["__pycache__", ".env"]),
+                memory_size=1024,
+                timeout=Duration.seconds(60),
+                environment=environment,
+                reserved_concurrent_executions=reserved or None,
+            )
+            if snap_start:
+                function.node.default_child.add_property_override("SnapStart", {"ApplyOn": "PublishedVersions"})
+        else:
+            raise ValueError(f"Unknown CHAT_LAMBDA {mode!r}, expected zip or image")
 
-        
\ No newline at end of file
+        function.add_to_role_policy(iam.PolicyStatement(actions=["bedrock:InvokeAgent"], resources=["*"]))
+        alias = _lambda.Alias(self, "ChatFunctionLive",
+            alias_name="live",
+            version=function.current_version,
+            provisioned_concurrent_executions=provisioned or None,
+        )
+        # The agent role can invoke any agent, so callers must sign their
+        # requests (SigV4) with lambda:InvokeFunctionUrl on this alias
+        url = alias.add_function_url(
+            auth_type=_lambda.FunctionUrlAuthType.AWS_IAM,
+            invoke_mode=_lambda.InvokeMode.RESPONSE_STREAM if mode == "image" else _lambda.InvokeMode.BUFFERED,
+        )
+        CfnOutput(self, "Chat URL: ", value=url.url)
+        return alias
@@ -0,0 +1,162 @@
+import json
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from rowdy.lru import LRUCache
+
+# ------------------------------------------------------
+# Adaptive retrieval depth
+#
+# Many questions have a couple of strong hits followed by weak ones, so a
+# fixed numberOfResults mostly adds noise to the prompt. The adaptive
+# retriever asks for a small first page and looks at the score curve:
+#   - a sharp drop between two neighbours (>= drop_off) ends the strong
+#     results: keep the ones before it
+#   - otherwise, scores falling below min_score inside the page also end
+#     them: keep the ones above
+#   - if the page is weak (nothing above min_score) or flat (all above, no
+#     drop), the next page is fetched - with the Retrieve nextToken when
+#     there is one - up to max_k results and max_latency per request
+# Every decision is logged (and appended to log_path as JSON lines) with
+# the chosen k and the scores seen, for tuning the thresholds offline
+# (python -m benchmarks.bench_adaptive).
+
+logger = logging.getLogger(__name__)
+_log_lock = threading.Lock()
+
+
+class Page(NamedTuple):
+    documents: List[Document]
+    next_token: Optional[str]
+
+
+# fetch(query, offset, size, next_token) -> results offset..offset+size
+Pager = Callable[[str, int, int, Optional[str]], Page]
+
+
+class Depth(NamedTuple):
+    k: int
+    reason: str
+
+
+def _score(document: Document) -> float:
+    return float(document.metadata.get("score") or 0.0)
+
+
+# Where the strong results end within `scores` (sorted, highest first), or
+# None if the curve gives no answer yet
+def strong_results(scores: Sequence[float], drop_off: float, min_score: float) -> Optional[Depth]:
+    if not scores or scores[0] < min_score:
+        return None
+    curve = np.asarray(scores, dtype=np.float32)
+    drops = np.flatnonzero(-np.diff(curve) >= drop_off)
+    below = np.flatnonzero(curve < min_score)
+    found = [Depth(int(drops[0]) + 1, "drop")] if len(drops) else []
+    found += [Depth(int(below[0]), "threshold")] if len(below) else []
+    return min(found) if found else None
+
+
+def bedrock_pager(client: Any, knowledge_base_id: str, retrieval_config: Optional[Dict[str, Any]] = None) -> Pager:
+    from langchain_aws import AmazonKnowledgeBasesRetriever
+
+    def fetch(query: str, offset: int, size: int, next_token: Optional[str]) -> Page:
+        vector_search = dict((retrieval_config or {}).get("vectorSearchConfiguration", {}))
+        # Without a token the query is repeated for the larger k and the
+        # results already seen are skipped
+        vector_search["numberOfResults"] = size if next_token else offset + size
+        request = {
+            "knowledgeBaseId": knowledge_base_id,
+            "retrievalQuery": {"text": query.strip()},
+            "retrievalConfiguration": {**(retrieval_config or {}), "vectorSearchConfiguration": vector_search},
+        }
+        if next_token:
+            request["nextToken"] = next_token
+        response = client.retrieve(**request)
+        documents = AmazonKnowledgeBasesRetriever._retrieval_results_to_documents(response["retrievalResults"])
+        return Page(documents if next_token else documents[offset:], response.get("nextToken"))
+
+    return fetch
+
+
+# Pages over the local index; the query is embedded once per request
+def local_pager(retriever: Any) -> Pager:
+    vectors = LRUCache(maxsize=64, ttl=60)
+
+    def fetch(query: str, offset: int, size: int, next_token: Optional[str]) -> Page:
+        vector = vectors.get(query)
+        if vector is None:
+            vector = np.asarray(retriever.embeddings.embed_query(query), dtype=np.float32)
+            vectors.set(query, vector)
+        hits = retriever.index.search(vector.copy(), offset + size, retriever.nprobe)[offset:]
+        return Page([retriever._document(i, score) for i, score in hits], None)
+
+    return fetch
+
+
+class AdaptiveRetriever(BaseRetriever):
+    pager: Any
+    initial_k: int = 4
+    max_k: int = 12
+    drop_off: float = 0.1
+    min_score: float = 0.5
+    max_latency: float = 0.8
+    log_path: Optional[str] = None
+    clock: Any = time.monotonic
+
+    def retrieve(self, query: str) -> Tuple[List[Document], Dict[str, Any]]:
+        start = self.clock()
+        documents: List[Document] = []
+        next_token = None
+        pages = 0
+        size = min(self.initial_k, self.max_k)
+        while True:
+            fetched_at = self.clock()
+            page = self.pager(query, len(documents), size, next_token)
+            pages += 1
+            documents += page.documents
+            next_token = page.next_token
+            depth = strong_results([_score(d) for d in documents], self.drop_off, self.min_score)
+            if depth is not None:
+                break
+            now = self.clock()
+            if len(page.documents) < size and next_token is None:
+                depth = Depth(len(documents), "exhausted")
+            elif len(documents) >= self.max_k:
+                depth = Depth(len(documents), "max_k")
+            # The next page would likely take as long as this one
+            elif now + (now - fetched_at) - start > self.max_latency:
+                depth = Depth(len(documents), "deadline")
+            if depth is not None:
+                break
+            size = max(1, min(len(documents), self.max_k - len(documents)))
+        record = {
+            "query": query,
+            "k": depth.k,
+            "reason": depth.reason,
+            "fetched": len(documents),
+            "pages": pages,
+            "scores": [round(_score(d), 4) for d in documents],
+            "ms": round((self.clock() - start) * 1000, 1),
+        }
+        return documents[:depth.k], record
+
+    def _log(self, record: Dict[str, Any]) -> None:
+        line = json.dumps(record)
+        logger.info("adaptive retrieval %s", line)
+        if self.log_path:
+            with _log_lock, open(self.log_path, "a") as f:
+                f.write(line + "\n")
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        documents, record = self.retrieve(query)
+        self._log(record)
+        return documents
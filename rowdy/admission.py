@@ -0,0 +1,240 @@
+import asyncio
+import contextlib
+import heapq
+import itertools
+import math
+import threading
+import time
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Mapping, Optional
+
+from rowdy.lru import LRUCache
+
+# ------------------------------------------------------
+# Admission control
+#
+# Every chat turn is admitted before it runs:
+#   1. a token bucket per client (session id or IP): `rate` turns per
+#      second, bursts of up to `burst`; an empty bucket is rejected at once
+#   2. a concurrency cap per model backend, sized from its quota
+#      (see concurrency_for_quota)
+#   3. when the backend is full, a bounded priority queue. Clients with few
+#      recent turns go ahead of heavy ("bulk") ones, and each class has a
+#      queue-time SLA. A turn that finds the queue full, or whose estimated
+#      wait is over its SLA, is rejected at once; one still queued when its
+#      SLA runs out is rejected then.
+# Rejections raise Busy with a retry_after hint, for a fast 429 / "busy"
+# message instead of a request that times out further down.
+
+INTERACTIVE, BULK = 0, 1
+
+
+class Busy(Exception):
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(f"Busy ({reason}), retry after {retry_after:.1f}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+# Turns that can run at once within a requests-per-minute quota when a turn
+# takes `seconds_per_request`
+def concurrency_for_quota(requests_per_minute: float, seconds_per_request: float) -> int:
+    return max(1, int(requests_per_minute * seconds_per_request / 60))
+
+
+class _Client:
+    __slots__ = ("tokens", "usage", "updated")
+
+    def __init__(self, tokens: float, now: float):
+        self.tokens = tokens
+        self.usage = 0.0
+        self.updated = now
+
+
+class _Backend:
+    def __init__(self, slots: Optional[int]):
+        self.slots = slots
+        self.active = 0
+        self.queued = 0
+        self.queue: List[Any] = []
+        self.hold = 0.0  # moving average of the time a turn holds its slot
+
+
+class Ticket:
+    __slots__ = ("backend", "priority", "enqueued", "admitted", "granted", "cancelled", "released", "wake")
+
+    def __init__(self, backend: str, priority: int, now: float, wake: Optional[Callable[[], None]]):
+        self.backend = backend
+        self.priority = priority
+        self.enqueued = now
+        self.admitted: Optional[float] = None  # None while queued
+        self.granted = False
+        self.cancelled = False
+        self.released = False
+        self.wake = wake
+
+
+class AdmissionController:
+    def __init__(self, limits: Mapping[str, Optional[int]], rate: float = 0.5, burst: float = 5,
+                 queue_size: int = 64, sla: float = 5.0, bulk_sla: float = 2.0, bulk_threshold: float = 20,
+                 bulk_window: float = 600, max_clients: int = 100_000, clock: Callable[[], float] = time.monotonic,
+                 observe: Optional[Callable[[str, float], None]] = None):
+        self.rate = rate
+        self.burst = burst
+        self.queue_size = queue_size
+        self.slas = {INTERACTIVE: sla, BULK: bulk_sla}
+        self.bulk_threshold = bulk_threshold
+        self.bulk_window = bulk_window
+        self.clock = clock
+        self.observe = observe
+        self._backends: Dict[str, _Backend] = {name: _Backend(slots) for name, slots in limits.items()}
+        self._clients = LRUCache(maxsize=max_clients, ttl=bulk_window, clock=clock)
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._stats = {"admitted": 0, "queued": 0, "rate_limited": 0, "queue_full": 0, "overloaded": 0,
+                       "queue_timeout": 0}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self._stats,
+                "backends": {name: {"slots": b.slots, "active": b.active, "queued": b.queued}
+                             for name, b in self._backends.items()},
+            }
+
+    # Token bucket and recent usage (decaying over bulk_window) of a client
+    def _check_rate(self, key: str, now: float) -> int:
+        client = self._clients.get(key)
+        if client is None:
+            client = _Client(self.burst, now)
+        # Refreshes the entry's ttl, so only idle clients are forgotten
+        self._clients.set(key, client)
+        elapsed = now - client.updated
+        client.updated = now
+        client.tokens = min(self.burst, client.tokens + elapsed * self.rate)
+        client.usage *= math.exp(-elapsed / self.bulk_window)
+        if client.tokens < 1:
+            self._stats["rate_limited"] += 1
+            raise Busy("rate_limited", (1 - client.tokens) / self.rate)
+        client.tokens -= 1
+        client.usage += 1
+        return BULK if client.usage > self.bulk_threshold else INTERACTIVE
+
+    def _enter(self, key: str, backend_name: str, wake: Callable[[], None]) -> Ticket:
+        now = self.clock()
+        with self._lock:
+            priority = self._check_rate(key, now)
+            backend = self._backends.get(backend_name)
+            if backend is None:
+                # Not configured: rate limited only
+                backend = self._backends[backend_name] = _Backend(None)
+            ticket = Ticket(backend_name, priority, now, wake)
+            if backend.slots is None or (backend.active < backend.slots and not backend.queued):
+                backend.active += 1
+                ticket.granted = True
+                ticket.admitted = now
+                self._stats["admitted"] += 1
+                return ticket
+            # Bulk turns may fill only half the queue, leaving room for interactive ones
+            if backend.queued >= (self.queue_size if priority == INTERACTIVE else self.queue_size // 2):
+                self._stats["queue_full"] += 1
+                raise Busy("queue_full", backend.hold or self.slas[priority])
+            # Turns that would run before this one, and how long they hold a slot
+            ahead = sum(1 for p, _, t in backend.queue if p <= priority and not t.cancelled)
+            wait = (ahead + 1) / backend.slots * backend.hold
+            if wait > self.slas[priority]:
+                self._stats["overloaded"] += 1
+                raise Busy("overloaded", wait)
+            heapq.heappush(backend.queue, (priority, next(self._seq), ticket))
+            backend.queued += 1
+            self._stats["queued"] += 1
+            return ticket
+
+    # Leave the queue unless the slot was granted meanwhile
+    def _withdraw(self, ticket: Ticket, reason: Optional[str] = None) -> bool:
+        with self._lock:
+            if ticket.granted:
+                return False
+            ticket.cancelled = True
+            self._backends[ticket.backend].queued -= 1
+            if reason:
+                self._stats[reason] += 1
+            return True
+
+    def _waited(self, ticket: Ticket) -> None:
+        now = self.clock()
+        if ticket.granted:
+            ticket.admitted = now
+        if self.observe is not None:
+            self.observe(ticket.backend, now - ticket.enqueued)
+        if not ticket.granted:
+            raise Busy("queue_timeout", self._backends[ticket.backend].hold or self.slas[ticket.priority])
+
+    # Safe to call more than once for a ticket
+    def release(self, ticket: Ticket) -> None:
+        wake = None
+        with self._lock:
+            if ticket.released:
+                return
+            ticket.released = True
+            backend = self._backends[ticket.backend]
+            held = self.clock() - (ticket.admitted or ticket.enqueued)
+            backend.hold = 0.8 * backend.hold + 0.2 * held if backend.hold else held
+            # Hand the slot straight to the next live waiter
+            while backend.queue:
+                _, _, waiter = heapq.heappop(backend.queue)
+                if not waiter.cancelled:
+                    waiter.granted = True
+                    backend.queued -= 1
+                    self._stats["admitted"] += 1
+                    wake = waiter.wake
+                    break
+            else:
+                backend.active -= 1
+        if wake is not None:
+            wake()
+
+    def acquire(self, key: str, backend: str) -> Ticket:
+        event = threading.Event()
+        ticket = self._enter(key, backend, event.set)
+        if ticket.admitted is None:
+            if not event.wait(self.slas[ticket.priority]):
+                self._withdraw(ticket, "queue_timeout")
+            self._waited(ticket)
+        return ticket
+
+    async def aacquire(self, key: str, backend: str) -> Ticket:
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def wake() -> None:
+            loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(None))
+
+        ticket = self._enter(key, backend, wake)
+        if ticket.admitted is None:
+            try:
+                await asyncio.wait_for(granted, self.slas[ticket.priority])
+            except asyncio.TimeoutError:
+                self._withdraw(ticket, "queue_timeout")
+            except asyncio.CancelledError:
+                # Client went away while queued
+                if not self._withdraw(ticket):
+                    self.release(ticket)
+                raise
+            self._waited(ticket)
+        return ticket
+
+    @contextlib.contextmanager
+    def admit(self, key: str, backend: str) -> Iterator[Ticket]:
+        ticket = self.acquire(key, backend)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    @contextlib.asynccontextmanager
+    async def aadmit(self, key: str, backend: str) -> AsyncIterator[Ticket]:
+        ticket = await self.aacquire(key, backend)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
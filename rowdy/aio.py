@@ -0,0 +1,84 @@
+import asyncio
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Iterator, Optional
+
+from langchain_core.runnables import Runnable, RunnableConfig
+
+# ------------------------------------------------------
+# Async request path
+#
+# One event loop per process runs every chat turn with astream. Blocking
+# calls (boto3, the Streamlit history) are offloaded to a bounded executor
+# and at most `max_concurrency` turns run at once, so the number of
+# concurrent chats is no longer tied to the number of worker threads.
+
+_DONE = object()
+
+
+class _Failure:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+class AsyncRunner:
+    def __init__(self, max_concurrency: int = 32, executor_workers: int = 16):
+        self.max_concurrency = max_concurrency
+        self.loop = asyncio.new_event_loop()
+        self.loop.set_default_executor(
+            ThreadPoolExecutor(max_workers=executor_workers, thread_name_prefix="rowdy-io")
+        )
+        self._thread = threading.Thread(target=self.loop.run_forever, name="rowdy-loop", daemon=True)
+        self._thread.start()
+        self._semaphore = asyncio.run_coroutine_threadsafe(self._make_semaphore(), self.loop).result()
+        self.active = 0
+
+    async def _make_semaphore(self) -> asyncio.Semaphore:
+        return asyncio.Semaphore(self.max_concurrency)
+
+    async def astream(self, runnable: Runnable, input: Any,
+                      config: Optional[RunnableConfig] = None) -> AsyncIterator[Any]:
+        async with self._semaphore:
+            self.active += 1
+            try:
+                async for chunk in runnable.astream(input, config):
+                    yield chunk
+            finally:
+                self.active -= 1
+
+    # Iterate an astream from a synchronous caller such as the Streamlit
+    # script thread. The caller still blocks on the queue for the whole
+    # turn, so it holds its thread; only async callers do not
+    def stream(self, runnable: Runnable, input: Any,
+               config: Optional[RunnableConfig] = None) -> Iterator[Any]:
+        chunks: "queue.Queue[Any]" = queue.Queue()
+
+        async def pump():
+            try:
+                async for chunk in self.astream(runnable, input, config):
+                    chunks.put(chunk)
+            except BaseException as e:
+                chunks.put(_Failure(e))
+            finally:
+                chunks.put(_DONE)
+
+        future = asyncio.run_coroutine_threadsafe(pump(), self.loop)
+        try:
+            while True:
+                item = chunks.get()
+                if item is _DONE:
+                    break
+                if isinstance(item, _Failure):
+                    raise item.error
+                yield item
+        finally:
+            future.cancel()
+
+    def run(self, coroutine: Any) -> Any:
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def close(self) -> None:
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+
@@ -0,0 +1,181 @@
+import threading
+from typing import AsyncIterator, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.runnables import Runnable, RunnableConfig, RunnableGenerator
+from langchain_core.runnables.config import run_in_executor
+from langchain_core.runnables.utils import AddableDict
+
+from rowdy.lru import LRUCache
+from rowdy.text import normalize_question
+
+# ------------------------------------------------------
+# Semantic answer cache
+#
+# Exact matches on the normalized question are served straight from an
+# LRU. With `embed` set, anything else is embedded (one embedding call per
+# miss) and compared against the cached questions, and a cosine similarity
+# above `threshold` counts as a hit. Entries are keyed by namespace (one
+# per chain sharing the cache) and by the knowledge base generation, so a
+# bump after a data source sync stops serving the answers cached before it.
+
+
+class CachedAnswer(NamedTuple):
+    response: str
+    context: List[Document]
+    vector: Optional[np.ndarray]
+
+
+class SemanticCache:
+    def __init__(
+        self,
+        embed: Optional[Callable[[str], List[float]]] = None,
+        threshold: float = 0.95,
+        maxsize: int = 512,
+        ttl: Optional[float] = 24 * 60 * 60,
+        generation: Optional[Callable[[], str]] = None,
+    ):
+        self.embed = embed
+        self.generation = generation
+        self.threshold = threshold
+        self._answers = LRUCache(maxsize=maxsize, ttl=ttl)
+        # Embeddings computed during a miss are reused by the following put()
+        self._vectors = LRUCache(maxsize=64, ttl=ttl)
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    @property
+    def hits(self) -> int:
+        return self.exact_hits + self.semantic_hits
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": len(self._answers),
+        }
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _vector(self, key: str) -> Optional[np.ndarray]:
+        if self.embed is None:
+            return None
+        vector = self._vectors.get(key)
+        if vector is None:
+            vector = np.asarray(self.embed(key), dtype=np.float32)
+            norm = np.linalg.norm(vector)
+            if norm:
+                vector /= norm
+            self._vectors.set(key, vector)
+        return vector
+
+    def _scope(self, namespace: str) -> Tuple[str, str]:
+        return namespace, self.generation() if self.generation is not None else ""
+
+    def get(self, question: str, namespace: str = "") -> Optional[CachedAnswer]:
+        scope = self._scope(namespace)
+        key = normalize_question(question)
+        answer = self._answers.get((*scope, key))
+        if answer is not None:
+            self._count("exact_hits")
+            return answer
+
+        vector = self._vector(key)
+        if vector is not None:
+            entries = [(k, a) for k, a in self._answers.items() if k[:2] == scope and a.vector is not None]
+            if entries:
+                scores = np.stack([a.vector for _, a in entries]) @ vector
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    # get() refreshes the LRU position of the matched entry
+                    answer = self._answers.get(entries[best][0])
+                    if answer is not None:
+                        self._count("semantic_hits")
+                        return answer
+
+        self._count("misses")
+        return None
+
+    def put(self, question: str, response: str, context: List[Document], namespace: str = "") -> None:
+        key = normalize_question(question)
+        self._answers.set((*self._scope(namespace), key), CachedAnswer(response, context, self._vector(key)))
+
+    def clear(self) -> None:
+        self._answers.clear()
+        self._vectors.clear()
+
+
+# Wrap a chain producing {"response", "context"} chunks with the cache.
+# Only questions asked with at most `max_history` prior messages are
+# cached, since later turns usually depend on the conversation so far.
+# Chains sharing one cache need their own `namespace`.
+def with_semantic_cache(chain: Runnable, cache: SemanticCache, max_history: int = 0, namespace: str = "") -> Runnable:
+    def semantic_cache(inputs: Iterator[Dict], config: RunnableConfig) -> Iterator[AddableDict]:
+        request = {}
+        for item in inputs:
+            request.update(item)
+
+        if len(request.get("history") or []) > max_history:
+            yield from chain.stream(request, config)
+            return
+
+        question = request["question"]
+        answer = cache.get(question, namespace)
+        if answer is not None:
+            yield AddableDict(context=answer.context)
+            yield AddableDict(response=answer.response)
+            return
+
+        response = []
+        context = None
+        for chunk in chain.stream(request, config):
+            if "response" in chunk:
+                response.append(chunk["response"])
+            if "context" in chunk:
+                context = chunk["context"]
+            yield chunk
+
+        if response and context is not None:
+            cache.put(question, "".join(response), context, namespace)
+
+    # Same flow for astream; the lookup may call the embedding model, so
+    # it runs in the executor rather than on the event loop
+    async def asemantic_cache(inputs: AsyncIterator[Dict], config: RunnableConfig) -> AsyncIterator[AddableDict]:
+        request = {}
+        async for item in inputs:
+            request.update(item)
+
+        if len(request.get("history") or []) > max_history:
+            async for chunk in chain.astream(request, config):
+                yield chunk
+            return
+
+        question = request["question"]
+        answer = await run_in_executor(config, cache.get, question, namespace)
+        if answer is not None:
+            yield AddableDict(context=answer.context)
+            yield AddableDict(response=answer.response)
+            return
+
+        response = []
+        context = None
+        async for chunk in chain.astream(request, config):
+            if "response" in chunk:
+                response.append(chunk["response"])
+            if "context" in chunk:
+                context = chunk["context"]
+            yield chunk
+
+        if response and context is not None:
+            await run_in_executor(config, cache.put, question, "".join(response), context, namespace)
+
+    return RunnableGenerator(semantic_cache, asemantic_cache, name="semantic_cache")
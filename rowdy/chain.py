@@ -0,0 +1,37 @@
+from operator import itemgetter
+from typing import Callable, List, Optional
+
+from langchain_core.documents import Document
+from langchain_core.language_models import BaseChatModel
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.runnables import Runnable, RunnableLambda, RunnableParallel, RunnablePassthrough
+
+from rowdy.prompts import build_prompt
+
+# ------------------------------------------------------
+# LangChain - RAG chain
+#
+# Shared by the Streamlit app, the API server and the benchmarks. Input is
+# {"question", "history"}; output streams {"context"} then {"response"}.
+# The prompt is assembled in rowdy/prompts.py.
+
+# `retrieve` replaces the default retrieval step (the raw question piped
+# into the retriever); it gets the whole {"question", "history"} input
+def build_chain(retriever: BaseRetriever, model: BaseChatModel,
+                prompt: Optional[Runnable] = None,
+                format_context: Optional[Callable[[List[Document]], str]] = None,
+                retrieve: Optional[Runnable] = None) -> Runnable:
+    prompt = prompt or build_prompt()
+    generate = prompt | model | StrOutputParser()
+    if format_context is not None:
+        generate = RunnablePassthrough.assign(context = itemgetter("context") | RunnableLambda(format_context)) | generate
+    return (
+        RunnableParallel({
+            "context": retrieve if retrieve is not None else itemgetter("question") | retriever,
+            "question": itemgetter("question"),
+            "history": itemgetter("history"),
+        })
+        .assign(response = generate)
+        .pick(["response", "context"])
+    )
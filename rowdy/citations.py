@@ -0,0 +1,64 @@
+import hashlib
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+from langchain_core.documents import Document
+
+from rowdy.lru import LRUCache
+from rowdy.packing import document_score, document_url
+
+# ------------------------------------------------------
+# Compact citations
+#
+# An answer keeps one small record per source URL (best score, a chunk id
+# and a short snippet) next to its message in the session, instead of
+# every retrieved Document. The full text of the URL's chunks goes to a
+# process-wide chunk store and is only read when the sources are shown.
+
+
+class Citation(NamedTuple):
+    url: str
+    score: float
+    chunk_id: str
+    snippet: str
+
+
+def chunk_id(text: str) -> str:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def snippet(text: str, chars: int = 160) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= chars else text[:chars].rsplit(" ", 1)[0] + "…"
+
+
+# Full chunk text by chunk id. Entries outlive the answer by `ttl`; after
+# that only the snippet is left to show.
+class ChunkStore:
+    def __init__(self, maxsize: int = 10000, ttl: Optional[float] = 24 * 60 * 60):
+        self._chunks = LRUCache(maxsize=maxsize, ttl=ttl)
+
+    def put(self, chunk_id: str, text: str) -> None:
+        self._chunks.set(chunk_id, text)
+
+    def get(self, chunk_id: str) -> Optional[str]:
+        return self._chunks.get(chunk_id)
+
+    def __len__(self) -> int:
+        return len(self._chunks)
+
+
+# One citation per URL, highest score first. The URL's chunks are joined,
+# best first, into the text stored under the citation's chunk id.
+def compact_citations(documents: Sequence[Document], store: Optional[ChunkStore] = None,
+                      snippet_chars: int = 160) -> List[Citation]:
+    by_url: Dict[str, List[Document]] = {}
+    for document in sorted(documents, key=document_score, reverse=True):
+        by_url.setdefault(document_url(document), []).append(document)
+    citations = []
+    for url, group in by_url.items():
+        text = "\n\n".join(dict.fromkeys(d.page_content for d in group))
+        citation = Citation(url, round(document_score(group[0]), 4), chunk_id(text), snippet(group[0].page_content, snippet_chars))
+        if store is not None:
+            store.put(citation.chunk_id, text)
+        citations.append(citation)
+    return citations
@@ -0,0 +1,285 @@
+import asyncio
+import threading
+from typing import Any, AsyncIterator, Callable, Dict, Hashable, Iterator, List, Optional, Sequence, Tuple
+
+from langchain_core.messages import BaseMessage
+from langchain_core.runnables import Runnable, RunnableConfig, RunnableGenerator
+
+from rowdy.text import normalize_question
+
+# ------------------------------------------------------
+# Single-flight request coalescing
+#
+# Identical requests (same normalized question, equivalent history) that
+# arrive while one is already running share its upstream stream - one
+# retrieval and one generation - instead of starting their own. Every
+# chunk is kept for the life of the flight, so a late joiner first gets the
+# prefix emitted so far and then follows live.
+#
+# Async subscribers each have a bounded queue. The upstream waits while a
+# subscriber is `buffer` chunks behind (backpressure) for up to
+# `stall_timeout`; after that the subscriber is detached and catches up
+# from the kept chunks on its own, so one stalled client cannot hold the
+# others. A sync flight runs in its first caller's thread, so there is no
+# pool to cap how many distinct requests run at once; sync followers read
+# the kept chunks directly.
+#
+# The flight runs with the first request's config; later subscribers get
+# its chunks but not their own callbacks. The upstream is stopped when
+# every subscriber has gone.
+
+_END = object()
+
+
+def _text(message: BaseMessage) -> str:
+    return message.content if isinstance(message.content, str) else str(message.content)
+
+
+# Requests share a flight if the question and every history message match
+# after normalization
+def request_key(question: str, history: Optional[Sequence[BaseMessage]] = None) -> Tuple:
+    return normalize_question(question), tuple((m.type, normalize_question(_text(m))) for m in history or [])
+
+
+class _Flight:
+    def __init__(self):
+        self.chunks: List[Any] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.cond = threading.Condition()
+
+    def publish(self, chunk: Any) -> None:
+        with self.cond:
+            self.chunks.append(chunk)
+            self.cond.notify_all()
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        with self.cond:
+            self.done = True
+            self.error = error
+            self.cond.notify_all()
+
+    def follow(self) -> Iterator[Any]:
+        position = 0
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: len(self.chunks) > position or self.done)
+                chunks = self.chunks[position:]
+                done, error = self.done, self.error
+            position += len(chunks)
+            yield from chunks
+            if done and position == len(self.chunks):
+                if error is not None:
+                    raise error
+                return
+
+
+class _Subscriber:
+    def __init__(self, buffer: int):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=buffer)
+        self.detached = False
+
+
+# Lives on one event loop; only touched from that loop
+class _AsyncFlight:
+    def __init__(self):
+        self.chunks: List[Any] = []
+        self.subscribers: List[_Subscriber] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.changed = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+    def notify(self) -> None:
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+
+class SingleFlight:
+    def __init__(self, buffer: int = 64, stall_timeout: float = 1.0):
+        self.buffer = buffer
+        self.stall_timeout = stall_timeout
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._async_flights: Dict[Hashable, _AsyncFlight] = {}
+        self._lock = threading.Lock()
+        self._stats = {"flights": 0, "joined": 0, "late_joined": 0, "detached": 0}
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._stats, "in_flight": len(self._flights) + len(self._async_flights)}
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+    def _joined(self, flight: Any) -> None:
+        self._count("late_joined" if flight.chunks else "joined")
+
+    # ------------------------------------------------------
+    # Sync callers: the upstream runs in the first caller's thread, which
+    # publishes each chunk before taking it; followers read the kept chunks.
+    # If that caller leaves while others still follow, the rest of the
+    # upstream is drained on a thread of its own.
+
+    def stream(self, key: Hashable, start: Callable[[], Iterator[Any]]) -> Iterator[Any]:
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self._stats["flights"] += 1
+            with flight.cond:
+                flight.subscribers += 1
+        # Runs when the caller finishes or drops the stream, started or not
+        try:
+            if leader:
+                yield from self._lead(key, flight, start)
+            else:
+                self._joined(flight)
+                yield from flight.follow()
+        finally:
+            with flight.cond:
+                flight.subscribers -= 1
+
+    def _lead(self, key: Hashable, flight: _Flight, start: Callable[[], Iterator[Any]]) -> Iterator[Any]:
+        stream = None
+        handed_off = False
+        try:
+            stream = start()
+            for chunk in stream:
+                flight.publish(chunk)
+                yield chunk
+            flight.finish()
+        except GeneratorExit:
+            # Joining takes the lock, so nobody joins between the check and the removal
+            with self._lock:
+                handed_off = flight.subscribers > 1
+                if not handed_off and self._flights.get(key) is flight:
+                    del self._flights[key]
+            if handed_off:
+                threading.Thread(target=self._drain, args=(key, flight, stream), name="rowdy-flight",
+                                 daemon=True).start()
+            else:
+                flight.finish(RuntimeError("Coalesced request was cancelled"))
+            raise
+        except BaseException as e:
+            flight.finish(e)
+            raise
+        finally:
+            if not handed_off:
+                self._end(key, flight, stream)
+
+    def _drain(self, key: Hashable, flight: _Flight, stream: Iterator[Any]) -> None:
+        try:
+            for chunk in stream:
+                if flight.subscribers == 0:
+                    break
+                flight.publish(chunk)
+            flight.finish()
+        except BaseException as e:
+            flight.finish(e)
+        finally:
+            self._end(key, flight, stream)
+
+    def _end(self, key: Hashable, flight: _Flight, stream: Optional[Iterator[Any]]) -> None:
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        if stream is not None and hasattr(stream, "close"):
+            stream.close()
+
+    # ------------------------------------------------------
+    # Async callers: the upstream runs as a task on the caller's loop
+
+    async def astream(self, key: Hashable, start: Callable[[], AsyncIterator[Any]]) -> AsyncIterator[Any]:
+        key = (id(asyncio.get_running_loop()), key)
+        flight = self._async_flights.get(key)
+        if flight is None:
+            flight = self._async_flights[key] = _AsyncFlight()
+            self._count("flights")
+            flight.task = asyncio.create_task(self._arun(key, flight, start))
+        else:
+            self._joined(flight)
+        subscriber = _Subscriber(self.buffer)
+        # Replay what was emitted before joining; the queue gets the rest
+        position = len(flight.chunks)
+        flight.subscribers.append(subscriber)
+        try:
+            for chunk in flight.chunks[:position]:
+                yield chunk
+            while not (subscriber.detached and subscriber.queue.empty()):
+                chunk = await subscriber.queue.get()
+                if chunk is _END:
+                    break
+                position += 1
+                yield chunk
+            # Detached (or finished): continue from the kept chunks
+            while True:
+                if position < len(flight.chunks):
+                    position += 1
+                    yield flight.chunks[position - 1]
+                elif flight.done:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+                else:
+                    await flight.changed.wait()
+        finally:
+            flight.subscribers.remove(subscriber)
+            if not flight.subscribers and not flight.done and flight.task is not None:
+                flight.task.cancel()
+
+    async def _put(self, subscriber: _Subscriber, item: Any) -> None:
+        if subscriber.detached:
+            return
+        try:
+            await asyncio.wait_for(subscriber.queue.put(item), self.stall_timeout)
+        except asyncio.TimeoutError:
+            subscriber.detached = True
+            self._count("detached")
+
+    async def _arun(self, key: Hashable, flight: _AsyncFlight, start: Callable[[], AsyncIterator[Any]]) -> None:
+        stream = start()
+        try:
+            async for chunk in stream:
+                flight.chunks.append(chunk)
+                for subscriber in list(flight.subscribers):
+                    await self._put(subscriber, chunk)
+                flight.notify()
+        except asyncio.CancelledError:
+            # Followers get an error of their own; the cancellation stays with this task
+            flight.error = RuntimeError("Coalesced request was cancelled")
+            raise
+        except BaseException as e:
+            flight.error = e
+        finally:
+            flight.done = True
+            if self._async_flights.get(key) is flight:
+                del self._async_flights[key]
+            flight.notify()
+            if hasattr(stream, "aclose"):
+                await stream.aclose()
+            for subscriber in list(flight.subscribers):
+                await self._put(subscriber, _END)
+
+
+# Wrap a chain taking {"question", "history"} so identical concurrent
+# requests share one run of it
+def with_coalescing(chain: Runnable, flights: SingleFlight) -> Runnable:
+    def coalesce(inputs: Iterator[Dict], config: RunnableConfig) -> Iterator[Any]:
+        request = {}
+        for item in inputs:
+            request.update(item)
+        key = request_key(request["question"], request.get("history"))
+        yield from flights.stream(key, lambda: chain.stream(request, config))
+
+    async def acoalesce(inputs: AsyncIterator[Dict], config: RunnableConfig) -> AsyncIterator[Any]:
+        request = {}
+        async for item in inputs:
+            request.update(item)
+        key = request_key(request["question"], request.get("history"))
+        async for chunk in flights.astream(key, lambda: chain.astream(request, config)):
+            yield chunk
+
+    return RunnableGenerator(coalesce, acoalesce, name="coalesce")
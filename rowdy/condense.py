@@ -0,0 +1,210 @@
+import asyncio
+import re
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.runnables import Runnable, RunnableConfig, RunnableLambda
+
+from rowdy.lru import LRUCache
+from rowdy.text import normalize_question
+
+# ------------------------------------------------------
+# Follow-up question condensation
+#
+# Retrieval only sees a single query string. A follow-up such as "what
+# about for grad students?" retrieves poorly on its own, so the condenser
+# rewrites (recent history, question) into a standalone search query,
+# either with a local heuristic or with a small, fast model call. Rewrites
+# are cached per (session, turn). The local rewrite takes microseconds and
+# is retrieved directly. While a model rewrite runs, the raw question is
+# already being retrieved; if the rewrite misses its deadline, fails, or
+# comes back unchanged, the raw result is used.
+
+_LEAD_IN = re.compile(
+    r"^(?:(?:and|also|so|ok(?:ay)?|thanks?|but)[\s,]+)*(?:(?:what|how)\s+about|and|also)\b[\s,]*", re.IGNORECASE
+)
+_REFERENCE = re.compile(r"\b(?:it|its|that|this|they|them|their|those|these|same)\b", re.IGNORECASE)
+_WORD = re.compile(r"[\w'-]+")
+_STOPWORDS = {
+    "a", "an", "the", "and", "or", "but", "of", "to", "in", "on", "at", "for", "with", "by", "from", "about",
+    "is", "are", "was", "were", "be", "do", "does", "did", "can", "could", "should", "would", "will", "i", "me",
+    "my", "we", "you", "your", "what", "when", "where", "who", "how", "which", "why", "there", "it", "its",
+    "that", "this", "they", "them", "their", "those", "these", "get", "have", "has", "need", "any", "some",
+}
+
+CONDENSE_PROMPT = (
+    "Rewrite the student's last message as a standalone search query for the UMass Lowell knowledge "
+    "base. Use the conversation only to resolve what the message refers to. Reply with the query only."
+)
+
+
+def _text(message: BaseMessage) -> str:
+    return message.content if isinstance(message.content, str) else str(message.content)
+
+
+def _questions(history: Sequence[BaseMessage]) -> List[str]:
+    return [_text(m) for m in history if isinstance(m, HumanMessage)]
+
+
+# A question needs condensing if there is an earlier question and it reads
+# as a follow-up: a lead-in ("what about ..."), a reference ("is it ...")
+# or too few words to stand alone
+def needs_condensing(question: str, history: Sequence[BaseMessage]) -> bool:
+    if not _questions(history):
+        return False
+    text = question.strip()
+    return bool(_LEAD_IN.match(text) or _REFERENCE.search(text) or len(_WORD.findall(text)) <= 3)
+
+
+# Local rewrite: an elliptical follow-up is appended to the previous
+# question ("How do I apply for housing?" + "what about for grad
+# students?"); otherwise the previous question's content words are added
+def heuristic_condense(question: str, history: Sequence[BaseMessage]) -> str:
+    questions = _questions(history)
+    if not questions:
+        return question
+    previous = questions[-1].strip().rstrip("?.! ")
+    text = question.strip()
+    lead_in = _LEAD_IN.match(text)
+    if lead_in and text[lead_in.end():].strip(" ?.!"):
+        return f"{previous} {text[lead_in.end():].strip(' ?.!')}"
+    present = {w.lower() for w in _WORD.findall(text)}
+    missing = [w for w in _WORD.findall(previous) if w.lower() not in _STOPWORDS and w.lower() not in present]
+    return f"{text.rstrip(' ?.!')} {' '.join(dict.fromkeys(missing))}".strip() if missing else text
+
+
+class QueryCondenser:
+    def __init__(self, model: Optional[BaseChatModel] = None, history_turns: int = 2, deadline: float = 0.4,
+                 cache_size: int = 4096, ttl: float = 60 * 60, max_workers: int = 8):
+        self.model = model
+        self.history_turns = history_turns
+        self.deadline = deadline
+        self._cache = LRUCache(maxsize=cache_size, ttl=ttl)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="rowdy-condense")
+        self._lock = threading.Lock()
+        self._stats = {"condensed": 0, "cached": 0, "fallbacks": 0}
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats)
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+    # The last `history_turns` turns, without the running summary
+    def _recent(self, history: Sequence[BaseMessage]) -> List[BaseMessage]:
+        messages = [m for m in history if not isinstance(m, SystemMessage)]
+        starts = [i for i, m in enumerate(messages) if isinstance(m, HumanMessage)]
+        return messages[starts[-self.history_turns]:] if len(starts) >= self.history_turns else messages
+
+    def condense(self, question: str, history: Sequence[BaseMessage]) -> str:
+        recent = self._recent(history)
+        if self.model is None:
+            return heuristic_condense(question, recent)
+        transcript = "\n".join(f"{m.type}: {_text(m)}" for m in recent)
+        result = self.model.invoke([
+            SystemMessage(CONDENSE_PROMPT),
+            HumanMessage(f"Conversation:\n{transcript}\n\nLast message: {question}"),
+        ])
+        query = _text(result).strip().strip('"')
+        # An empty or rambling reply is worse than the local rewrite
+        if not query or len(query.split()) > 3 * len(question.split()) + 20:
+            return heuristic_condense(question, recent)
+        return query
+
+    # One rewrite per (session, turn): the turn is identified by the
+    # history length and the previous question, since the history window
+    # stops growing once it is full
+    def key(self, question: str, history: Sequence[BaseMessage], session_id: str = "") -> Tuple:
+        questions = _questions(history)
+        return session_id, len(history), questions[-1] if questions else "", normalize_question(question)
+
+    # The local rewrite, cached like a model one
+    def rewrite_now(self, question: str, history: Sequence[BaseMessage], session_id: str = "") -> str:
+        key = self.key(question, history, session_id)
+        future = self._cache.get(key)
+        if future is not None:
+            self._count("cached")
+            return future.result()
+        future = Future()
+        future.set_result(self.condense(question, history))
+        self._cache.set(key, future)
+        self._count("condensed")
+        return future.result()
+
+    def submit(self, question: str, history: Sequence[BaseMessage], session_id: str = "") -> Future:
+        key = self.key(question, history, session_id)
+        future = self._cache.get(key)
+        if future is not None:
+            self._count("cached")
+            return future
+        future = self._executor.submit(self.condense, question, list(history))
+        self._cache.set(key, future)
+        self._count("condensed")
+        return future
+
+    # Speculative retrieval of the raw question while the rewrite runs
+    def retrieve_raw(self, retriever: BaseRetriever, question: str, config: RunnableConfig) -> Future:
+        return self._executor.submit(retriever.invoke, question, config)
+
+    # The rewrite, or the raw question if it is late or failed
+    def result(self, future: Future, question: str) -> str:
+        try:
+            return future.result(timeout=self.deadline)
+        except Exception:
+            self._count("fallbacks")
+            return question
+
+    async def aresult(self, future: Future, question: str) -> str:
+        try:
+            return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), self.deadline)
+        except Exception:
+            self._count("fallbacks")
+            return question
+
+
+def _session_id(config: RunnableConfig) -> str:
+    return str((config.get("configurable") or {}).get("session_id", ""))
+
+
+# Retrieval step for build_chain: takes {"question", "history"} and returns
+# documents for the standalone query. The raw question is retrieved
+# concurrently and used if the rewrite is late, fails or changes nothing.
+def condensed_retrieval(retriever: BaseRetriever, condenser: QueryCondenser) -> Runnable:
+    def retrieve(request: Dict[str, Any], config: RunnableConfig) -> List[Any]:
+        question, history = request["question"], request.get("history") or []
+        if not needs_condensing(question, history):
+            return retriever.invoke(question, config)
+        if condenser.model is None:
+            return retriever.invoke(condenser.rewrite_now(question, history, _session_id(config)), config)
+        rewrite = condenser.submit(question, history, _session_id(config))
+        raw = condenser.retrieve_raw(retriever, question, config)
+        query = condenser.result(rewrite, question)
+        if normalize_question(query) == normalize_question(question):
+            return raw.result()
+        # cancel() only stops a raw retrieval still queued on the executor;
+        # one already running finishes and is discarded. That extra Retrieve
+        # call is the accepted cost of the fast fallback.
+        raw.cancel()
+        return retriever.invoke(query, config)
+
+    async def aretrieve(request: Dict[str, Any], config: RunnableConfig) -> List[Any]:
+        question, history = request["question"], request.get("history") or []
+        if not needs_condensing(question, history):
+            return await retriever.ainvoke(question, config)
+        if condenser.model is None:
+            return await retriever.ainvoke(condenser.rewrite_now(question, history, _session_id(config)), config)
+        rewrite = condenser.submit(question, history, _session_id(config))
+        raw = asyncio.ensure_future(retriever.ainvoke(question, config))
+        query = await condenser.aresult(rewrite, question)
+        if normalize_question(query) == normalize_question(question):
+            return await raw
+        raw.cancel()
+        return await retriever.ainvoke(query, config)
+
+    return RunnableLambda(retrieve, afunc=aretrieve, name="condensed_retrieval")
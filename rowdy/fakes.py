@@ -0,0 +1,114 @@
+import asyncio
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForLLMRun,
+    AsyncCallbackManagerForRetrieverRun,
+    CallbackManagerForLLMRun,
+    CallbackManagerForRetrieverRun,
+)
+from langchain_core.documents import Document
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.retrievers import BaseRetriever
+
+# ------------------------------------------------------
+# Offline stand-ins for the knowledge base and the chat model with
+# configurable latency, used by the benchmarks and local testing
+
+
+def sample_documents(count: int = 12) -> List[Document]:
+    return [
+        Document(
+            page_content=f"UMass Lowell page {i}: the Registrar's Office is in University Crossing.",
+            metadata={
+                "score": round(0.8 - i * 0.05, 3),
+                "source_metadata": {"url": f"https://www.uml.edu/page-{i}.aspx"},
+            },
+        )
+        for i in range(count)
+    ]
+
+
+class LatencyRetriever(BaseRetriever):
+    documents: List[Document] = []
+    latency: float = 0.25
+    calls: int = 0
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        self.calls += 1
+        time.sleep(self.latency)
+        return list(self.documents)
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        return list(self.documents)
+
+
+class LatencyChatModel(BaseChatModel):
+    response: str = "The Registrar's Office is in University Crossing, Suite 360."
+    first_token_latency: float = 0.3
+    token_latency: float = 0.01
+    # Raise after the first-token latency instead of answering
+    error: Optional[str] = None
+    # Hold the rest of the answer after the first token until set: a
+    # threading.Event for stream, an asyncio.Event for astream
+    gate: Optional[Any] = None
+    calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "latency-fake"
+
+    def _tokens(self) -> List[str]:
+        words = self.response.split(" ")
+        return [w if i == 0 else " " + w for i, w in enumerate(words)]
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        text = "".join(chunk.message.content for chunk in self._stream(messages, stop, run_manager, **kwargs))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        self.calls += 1
+        time.sleep(self.first_token_latency)
+        if self.error:
+            raise RuntimeError(self.error)
+        for i, token in enumerate(self._tokens()):
+            if i == 1 and self.gate is not None:
+                self.gate.wait()
+            if i:
+                time.sleep(self.token_latency)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+                       **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        self.calls += 1
+        await asyncio.sleep(self.first_token_latency)
+        if self.error:
+            raise RuntimeError(self.error)
+        for i, token in enumerate(self._tokens()):
+            if i == 1 and self.gate is not None:
+                await self.gate.wait()
+            if i:
+                await asyncio.sleep(self.token_latency)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"response": self.response}
@@ -0,0 +1,169 @@
+import threading
+from typing import Callable, List, Optional, Sequence
+
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+
+from rowdy.prompts import TokenCounter
+from rowdy.text import estimate_tokens
+
+# ------------------------------------------------------
+# Bounded chat history window
+#
+# Only the most recent turns that fit in the model's token budget are sent
+# verbatim. Turns that fall out of the window are folded into a running
+# summary once, so each turn costs O(window) instead of O(conversation).
+
+# Context window per MODEL setting (claude-3-haiku, gpt-4o-mini). ROUTER
+# can fail over to either model, so it gets the smaller one.
+CONTEXT_WINDOWS = {
+    "ANTHROPIC": 200_000,
+    "OPENAI": 128_000,
+    "ROUTER": 128_000,
+}
+
+# History token budget per MODEL setting: a fixed share of the context
+# window, leaving the rest for the prompt, the retrieved context and the answer
+HISTORY_BUDGETS = {model: window // 40 for model, window in CONTEXT_WINDOWS.items()}
+
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+Summarizer = Callable[[str, Sequence[BaseMessage]], str]
+
+
+def _text(message: BaseMessage) -> str:
+    return message.content if isinstance(message.content, str) else str(message.content)
+
+
+# Local summarizer: keeps the student's earlier questions, newest last,
+# trimmed to `max_tokens`. No model call, so folding is effectively free.
+def question_summarizer(max_tokens: int = 300, count_tokens: TokenCounter = estimate_tokens) -> Summarizer:
+    def summarize(summary: str, messages: Sequence[BaseMessage]) -> str:
+        lines = summary.splitlines() if summary else []
+        lines += [f"- The student asked: {_text(m)}" for m in messages if isinstance(m, HumanMessage)]
+        while len(lines) > 1 and count_tokens("\n".join(lines)) > max_tokens:
+            lines.pop(0)
+        return "\n".join(lines)
+    return summarize
+
+
+# Model summarizer: asks the chat model to update the running summary with
+# only the turns that just left the window.
+def model_summarizer(model: BaseChatModel, max_tokens: int = 300) -> Summarizer:
+    def summarize(summary: str, messages: Sequence[BaseMessage]) -> str:
+        transcript = "\n".join(f"{m.type}: {_text(m)}" for m in messages)
+        result = model.invoke([
+            SystemMessage(
+                f"Update the running summary of a conversation between a student and Rowdy, "
+                f"the UMass Lowell chatbot. Keep facts the student shared and topics they asked "
+                f"about. Reply with the summary only, under {max_tokens * 3 // 4} words."
+            ),
+            HumanMessage(f"Current summary:\n{summary or '(none)'}\n\nNew turns:\n{transcript}"),
+        ])
+        return _text(result).strip()
+    return summarize
+
+
+# Positions (`summarized`, the token counts) are counted from the start of
+# the session. A store that keeps only its recent messages in memory says
+# where they start with an `offset` attribute; one with load_summary and
+# save_summary (StoredChatMessageHistory) keeps the summary with the session.
+# Tokens are counted with the model's counter (rowdy/prompts.py). Reads go
+# through a lock, so concurrent turns of a session summarize each turn once.
+class WindowedChatMessageHistory(BaseChatMessageHistory):
+    def __init__(self, store: BaseChatMessageHistory, max_tokens: int = 3000,
+                 max_turns: int = 6, summarizer: Optional[Summarizer] = None,
+                 count_tokens: TokenCounter = estimate_tokens):
+        self.store = store
+        self.max_tokens = max_tokens
+        self.max_turns = max_turns
+        self.count_tokens = count_tokens
+        self.summarizer = summarizer or question_summarizer(count_tokens=count_tokens)
+        self.summary = ""
+        self.summarized = 0
+        self._token_counts: List[int] = []
+        self._counts_offset = 0
+        self._summary_loaded = False
+        self._lock = threading.Lock()
+
+    def _count_tokens(self, messages: Sequence[BaseMessage], offset: int) -> List[int]:
+        # Counts are computed once per message; the ones for messages the
+        # store no longer holds are dropped
+        # The store only ever grows between clear() calls
+        if offset < self._counts_offset or len(messages) < len(self._token_counts) - (offset - self._counts_offset):
+            self._reset()
+        if offset != self._counts_offset:
+            del self._token_counts[:offset - self._counts_offset]
+            self._counts_offset = offset
+        for message in messages[len(self._token_counts):]:
+            self._token_counts.append(self.count_tokens(_text(message)))
+        return self._token_counts
+
+    def _reset(self) -> None:
+        self.summary = ""
+        self.summarized = 0
+        self._token_counts = []
+        self._counts_offset = 0
+
+    # Window start, relative to `messages`
+    def _window_start(self, messages: Sequence[BaseMessage], counts: List[int], summarized: int) -> int:
+        budget = self.max_tokens - self.count_tokens(self.summary)
+        start = len(messages)
+        turns = 0
+        used = 0
+        while start > summarized:
+            i = start - 1
+            if used + counts[i] > budget:
+                break
+            used += counts[i]
+            start = i
+            if isinstance(messages[i], HumanMessage):
+                turns += 1
+                if turns == self.max_turns:
+                    break
+        # Never start the window halfway through a turn
+        while start < len(messages) and not isinstance(messages[start], HumanMessage):
+            start += 1
+        return start
+
+    def _load_summary(self) -> None:
+        self._summary_loaded = True
+        load = getattr(self.store, "load_summary", None)
+        stored = load() if load is not None else None
+        if stored is not None:
+            self.summary, self.summarized = stored
+
+    @property
+    def messages(self) -> List[BaseMessage]:
+        with self._lock:
+            return self._window()
+
+    def _window(self) -> List[BaseMessage]:
+        if not self._summary_loaded:
+            self._load_summary()
+        messages = self.store.messages
+        offset = getattr(self.store, "offset", 0)
+        counts = self._count_tokens(messages, offset)
+        # Messages older than what the store holds can no longer be summarized
+        summarized = max(0, self.summarized - offset)
+        start = self._window_start(messages, counts, summarized)
+        if start > summarized:
+            self.summary = self.summarizer(self.summary, messages[summarized:start])
+            self.summarized = offset + start
+            save = getattr(self.store, "save_summary", None)
+            if save is not None:
+                save(self.summary, self.summarized)
+        self.summarized = max(self.summarized, offset + start)
+        window = list(messages[start:])
+        if self.summary:
+            window.insert(0, SystemMessage(SUMMARY_PREFIX + self.summary))
+        return window
+
+    def add_messages(self, messages: Sequence[BaseMessage]) -> None:
+        self.store.add_messages(messages)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.store.clear()
+            self._reset()
@@ -0,0 +1,411 @@
+import argparse
+import hashlib
+import importlib.util
+import io
+import json
+import logging
+import os
+import posixpath
+import re
+import threading
+import time
+import urllib.parse
+import urllib.request
+import urllib.robotparser
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from html.parser import HTMLParser
+from itertools import accumulate
+from typing import Any, Callable, Collection, Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+from rowdy.text import estimate_tokens, html_to_text
+
+# ------------------------------------------------------
+# Bulk ingestion into the knowledge base bucket
+#
+# The data source uses chunking_strategy NONE, so every object in the
+# bucket is one chunk. This tool does the chunking itself:
+#   crawl    mirror the site (HTML and PDF) into a local directory, with a
+#            <file>.metadata.json sidecar holding the page url. robots.txt
+#            is honored and requests to the host are spaced by a delay
+#   sync     extract text, chunk by tokens with overlap in a process pool,
+#            hash each chunk, upload only new or changed chunks (and delete
+#            removed ones) with concurrent transfers, then start a single
+#            ingestion job
+# The manifest is a local JSON file of object key -> content hash from the
+# last sync, so a re-sync only touches what changed.
+
+SOURCE_EXTENSIONS = {".html", ".htm", ".txt", ".md", ".pdf"}
+METADATA_SUFFIX = ".metadata.json"
+USER_AGENT = "rowdy-ingest"
+_WORD = re.compile(r"\S+")
+
+logger = logging.getLogger(__name__)
+
+
+class Chunk(NamedTuple):
+    key: str
+    text: str
+    url: str
+    digest: str
+
+    def metadata(self) -> bytes:
+        return json.dumps({"metadataAttributes": {"url": self.url}}).encode("utf-8")
+
+
+# PDF text extraction needs pypdf, an optional dependency
+def pdf_support() -> bool:
+    return importlib.util.find_spec("pypdf") is not None
+
+
+def extract_text(path: str) -> str:
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".pdf":
+        try:
+            from pypdf import PdfReader
+        except ImportError as e:
+            raise ImportError("PDF sources need `pip install pypdf`") from e
+        return "\n".join(page.extract_text() or "" for page in PdfReader(path).pages)
+    with open(path, encoding="utf-8", errors="replace") as f:
+        text = f.read()
+    return html_to_text(text) if ext in (".html", ".htm") else text
+
+
+# Word windows of at most max_tokens, each starting overlap tokens before
+# the end of the previous one. Window ends are found by bisecting the
+# running token count, so a long page costs one pass over its words.
+def chunk_text(text: str, max_tokens: int = 300, overlap: int = 50) -> List[str]:
+    words = _WORD.findall(text)
+    # totals[i] is the token count of words[:i]
+    totals = [0, *accumulate(estimate_tokens(w + " ") for w in words)]
+    chunks = []
+    start = 0
+    while start < len(words):
+        # At least one word per chunk, even if it alone is over budget
+        end = max(bisect_right(totals, totals[start] + max_tokens) - 1, start + 1)
+        chunks.append(" ".join(words[start:end]))
+        if end == len(words):
+            break
+        # Step back over the overlap, but always make progress
+        start = max(bisect_left(totals, totals[end] - overlap), start + 1)
+    return chunks
+
+
+def digest(text: str, url: str) -> str:
+    return hashlib.sha256(f"{url}\n{text}".encode("utf-8")).hexdigest()
+
+
+def source_files(source_dir: str, extensions: Collection[str] = SOURCE_EXTENSIONS) -> Iterator[Tuple[str, str]]:
+    for root, _, files in os.walk(source_dir):
+        for name in sorted(files):
+            if name.endswith(METADATA_SUFFIX) or os.path.splitext(name)[1].lower() not in extensions:
+                continue
+            path = os.path.join(root, name)
+            yield path, os.path.relpath(path, source_dir).replace(os.sep, "/")
+
+
+def source_url(path: str, base_url: str = "", relpath: str = "") -> str:
+    sidecar = path + METADATA_SUFFIX
+    if os.path.exists(sidecar):
+        with open(sidecar) as f:
+            return json.load(f).get("metadataAttributes", {}).get("url", "")
+    return urllib.parse.urljoin(base_url, relpath) if base_url else ""
+
+
+# Runs in the worker processes: extract, chunk and hash one source file
+def process_file(job: Tuple[str, str, str, str, int, int]) -> List[Chunk]:
+    path, relpath, prefix, base_url, max_tokens, overlap = job
+    url = source_url(path, base_url, relpath)
+    return [
+        Chunk(f"{prefix}{relpath}/{i:04d}.txt", text, url, digest(text, url))
+        for i, text in enumerate(chunk_text(extract_text(path), max_tokens, overlap))
+    ]
+
+
+def chunk_sources(source_dir: str, prefix: str = "", base_url: str = "", max_tokens: int = 300,
+                  overlap: int = 50, processes: Optional[int] = None,
+                  extensions: Collection[str] = SOURCE_EXTENSIONS) -> List[Chunk]:
+    jobs = [(path, rel, prefix, base_url, max_tokens, overlap) for path, rel in source_files(source_dir, extensions)]
+    if processes == 1 or len(jobs) < 2:
+        return [chunk for job in jobs for chunk in process_file(job)]
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        return [chunk for chunks in pool.map(process_file, jobs, chunksize=16) for chunk in chunks]
+
+
+class Manifest:
+    def __init__(self, path: str, bucket: str, prefix: str = ""):
+        self.path = path
+        self.bucket = bucket
+        self.prefix = prefix
+        self.objects: Dict[str, str] = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                data = json.load(f)
+            # A manifest for another bucket or prefix says nothing about this one
+            if data.get("bucket") == bucket and data.get("prefix") == prefix:
+                self.objects = data.get("objects", {})
+
+    def save(self) -> None:
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"bucket": self.bucket, "prefix": self.prefix, "objects": self.objects}, f)
+        os.replace(tmp, self.path)
+
+    def diff(self, chunks: Sequence[Chunk]) -> Tuple[List[Chunk], List[str]]:
+        current = {chunk.key for chunk in chunks}
+        changed = [chunk for chunk in chunks if self.objects.get(chunk.key) != chunk.digest]
+        removed = sorted(key for key in self.objects if key not in current)
+        return changed, removed
+
+
+def transfer_config(max_concurrency: int = 10) -> Any:
+    from boto3.s3.transfer import TransferConfig
+    return TransferConfig(multipart_threshold=8 * 1024 * 1024, multipart_chunksize=8 * 1024 * 1024,
+                          max_concurrency=max_concurrency)
+
+
+# Upload chunks and their metadata sidecars on a thread pool. The manifest
+# is updated as uploads land and saved every few hundred, so an interrupted
+# sync resumes where it stopped.
+def upload(s3: Any, bucket: str, chunks: Sequence[Chunk], manifest: Manifest, workers: int = 16) -> int:
+    config = transfer_config()
+
+    def put(chunk: Chunk) -> Chunk:
+        s3.upload_fileobj(io.BytesIO(chunk.text.encode("utf-8")), bucket, chunk.key, Config=config,
+                          ExtraArgs={"ContentType": "text/plain; charset=utf-8"})
+        s3.upload_fileobj(io.BytesIO(chunk.metadata()), bucket, chunk.key + METADATA_SUFFIX, Config=config,
+                          ExtraArgs={"ContentType": "application/json"})
+        return chunk
+
+    uploaded = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(put, chunk) for chunk in chunks]
+        try:
+            for future in as_completed(futures):
+                chunk = future.result()
+                manifest.objects[chunk.key] = chunk.digest
+                uploaded += 1
+                if uploaded % 500 == 0:
+                    manifest.save()
+        finally:
+            for future in futures:
+                future.cancel()
+            manifest.save()
+    return uploaded
+
+
+def delete(s3: Any, bucket: str, keys: Sequence[str], manifest: Manifest) -> int:
+    objects = [k for key in keys for k in (key, key + METADATA_SUFFIX)]
+    for start in range(0, len(objects), 1000):
+        s3.delete_objects(Bucket=bucket, Delete={"Objects": [{"Key": k} for k in objects[start:start + 1000]],
+                                                 "Quiet": True})
+    for key in keys:
+        manifest.objects.pop(key, None)
+    manifest.save()
+    return len(keys)
+
+
+def sync(source_dir: str, bucket: str, manifest_path: str, s3: Any, bedrock_agent: Any = None,
+         kb_id: str = "", data_source_id: str = "", prefix: str = "", base_url: str = "",
+         max_tokens: int = 300, overlap: int = 50, processes: Optional[int] = None,
+         workers: int = 16) -> Dict[str, Any]:
+    start = time.perf_counter()
+    manifest = Manifest(manifest_path, bucket, prefix)
+    extensions = set(SOURCE_EXTENSIONS)
+    if not pdf_support():
+        extensions.discard(".pdf")
+        logger.warning("pypdf is not installed: PDF sources are skipped and their uploaded chunks kept "
+                       "(`pip install pypdf`)")
+    chunks = chunk_sources(source_dir, prefix, base_url, max_tokens, overlap, processes, extensions)
+    chunked = time.perf_counter()
+    changed, removed = manifest.diff(chunks)
+    # Chunks of skipped sources are not removed ones. Keys are <prefix><relpath>/<n>.txt
+    removed = [key for key in removed if posixpath.splitext(posixpath.dirname(key))[1].lower() in extensions]
+    uploaded = upload(s3, bucket, changed, manifest, workers) if changed else 0
+    deleted = delete(s3, bucket, removed, manifest) if removed else 0
+    job = None
+    # One ingestion job for the whole sync, and none when nothing changed
+    if bedrock_agent is not None and kb_id and data_source_id and (uploaded or deleted):
+        job = bedrock_agent.start_ingestion_job(
+            knowledgeBaseId=kb_id, dataSourceId=data_source_id,
+            description=f"rowdy.ingest: {uploaded} uploaded, {deleted} deleted",
+        )["ingestionJob"]["ingestionJobId"]
+    return {
+        "chunks": len(chunks),
+        "uploaded": uploaded,
+        "deleted": deleted,
+        "unchanged": len(chunks) - len(changed),
+        "ingestion_job": job,
+        "chunk_seconds": round(chunked - start, 2),
+        "seconds": round(time.perf_counter() - start, 2),
+    }
+
+
+class _LinkExtractor(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.links = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "a":
+            href = dict(attrs).get("href")
+            if href:
+                self.links.append(href)
+
+
+# Spaces requests to each host by at least `delay` seconds. Callers reserve
+# the next start time under the lock and sleep outside it.
+class HostRateLimiter:
+    def __init__(self, delay: float = 1.0, clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.delay = delay
+        self._clock = clock
+        self._sleep = sleep
+        self._next: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def wait(self, url: str) -> None:
+        host = urllib.parse.urlsplit(url).netloc
+        with self._lock:
+            now = self._clock()
+            start = max(now, self._next.get(host, now))
+            self._next[host] = start + self.delay
+        if start > now:
+            self._sleep(start - now)
+
+
+# robots.txt of the start url's host. A missing or unreadable file allows
+# everything, as robots.txt readers conventionally do.
+def read_robots(start_url: str, fetch: Callable[[str], Tuple[str, bytes]]) -> urllib.robotparser.RobotFileParser:
+    robots = urllib.robotparser.RobotFileParser(urllib.parse.urljoin(start_url, "/robots.txt"))
+    try:
+        _, body = fetch(robots.url)
+    except OSError:
+        body = b""
+    robots.parse(body.decode("utf-8", errors="replace").splitlines())
+    return robots
+
+
+# Mirror path for a URL. A URL with a query string gets a hash of the full
+# URL in its name, so pages that differ only by query are kept apart.
+def _local_path(out_dir: str, url: str, content_type: str) -> str:
+    parts = urllib.parse.urlsplit(url)
+    path = parts.path.lstrip("/") or "index"
+    if path.endswith("/"):
+        path += "index"
+    if parts.query:
+        path += "-" + hashlib.sha256(url.encode("utf-8")).hexdigest()[:12]
+    ext = ".pdf" if "pdf" in content_type else ".html"
+    if posixpath.splitext(path)[1].lower() != ext:
+        path += ext
+    return os.path.join(out_dir, *path.split("/"))
+
+
+# Breadth-first crawl of pages under start_url on the same host, fetched
+# on a thread pool. Pages robots.txt disallows are skipped, and requests
+# start at most once per `delay` seconds (or the robots.txt Crawl-delay,
+# if longer). Pages are saved with a metadata sidecar for sync.
+def crawl(start_url: str, out_dir: str, max_pages: int = 5000, workers: int = 4, timeout: float = 20.0,
+          fetch: Any = None, delay: float = 1.0, limiter: Optional[HostRateLimiter] = None) -> int:
+    root = urllib.parse.urlsplit(start_url)
+
+    def default_fetch(url: str) -> Tuple[str, bytes]:
+        request = urllib.request.Request(url, headers={"User-Agent": USER_AGENT})
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.headers.get("Content-Type", ""), response.read()
+
+    fetch = fetch or default_fetch
+    limiter = limiter or HostRateLimiter(delay)
+    robots = read_robots(start_url, fetch)
+    limiter.delay = max(limiter.delay, float(robots.crawl_delay(USER_AGENT) or 0))
+
+    def visit(url: str) -> List[str]:
+        if not robots.can_fetch(USER_AGENT, url):
+            return []
+        limiter.wait(url)
+        try:
+            content_type, body = fetch(url)
+        except OSError:
+            return []
+        if "html" not in content_type and "pdf" not in content_type:
+            return []
+        path = _local_path(out_dir, url, content_type)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(body)
+        with open(path + METADATA_SUFFIX, "w") as f:
+            json.dump({"metadataAttributes": {"url": url}}, f)
+        if "html" not in content_type:
+            return []
+        parser = _LinkExtractor()
+        parser.feed(body.decode("utf-8", errors="replace"))
+        links = []
+        for href in parser.links:
+            link = urllib.parse.urldefrag(urllib.parse.urljoin(url, href))[0]
+            parts = urllib.parse.urlsplit(link)
+            if parts.scheme in ("http", "https") and parts.netloc == root.netloc and parts.path.startswith(root.path):
+                links.append(link)
+        return links
+
+    seen = {start_url}
+    frontier = [start_url]
+    fetched = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while frontier and fetched < max_pages:
+            batch, frontier = frontier[:max_pages - fetched], []
+            for links in pool.map(visit, batch):
+                for link in links:
+                    if link not in seen:
+                        seen.add(link)
+                        frontier.append(link)
+            fetched += len(batch)
+    return fetched
+
+
+def s3_client(workers: int) -> Any:
+    import boto3
+    from botocore.config import Config
+    # One pooled connection per upload thread
+    return boto3.client("s3", config=Config(max_pool_connections=workers, retries={"mode": "adaptive"}))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load content into the knowledge base bucket.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    crawl_parser = subparsers.add_parser("crawl", help="Mirror a site into a local directory")
+    crawl_parser.add_argument("start_url")
+    crawl_parser.add_argument("out_dir")
+    crawl_parser.add_argument("--max-pages", type=int, default=5000)
+    crawl_parser.add_argument("--workers", type=int, default=4)
+    crawl_parser.add_argument("--delay", type=float, default=1.0,
+                              help="Seconds between requests to the host (robots.txt Crawl-delay if longer)")
+
+    sync_parser = subparsers.add_parser("sync", help="Chunk local sources and upload changed chunks")
+    sync_parser.add_argument("source_dir")
+    sync_parser.add_argument("bucket", help="Knowledge base bucket, e.g. infobucket<app name>")
+    sync_parser.add_argument("--manifest", default="ingest-manifest.json")
+    sync_parser.add_argument("--prefix", default="", help="Key prefix for the chunk objects")
+    sync_parser.add_argument("--base-url", default="", help="Page url for sources without a metadata sidecar")
+    sync_parser.add_argument("--kb-id", default=os.getenv("KB_ID", ""))
+    sync_parser.add_argument("--data-source-id", default=os.getenv("DATA_SOURCE_ID", ""))
+    sync_parser.add_argument("--max-tokens", type=int, default=300)
+    sync_parser.add_argument("--overlap", type=int, default=50)
+    sync_parser.add_argument("--processes", type=int, default=None, help="Chunking processes (default: CPUs)")
+    sync_parser.add_argument("--workers", type=int, default=32, help="Concurrent uploads")
+
+    args = parser.parse_args()
+    match args.command:
+        case "crawl":
+            start = time.perf_counter()
+            pages = crawl(args.start_url, args.out_dir, args.max_pages, args.workers, delay=args.delay)
+            print(f"Saved {pages} pages to {args.out_dir} in {time.perf_counter() - start:.1f} s")
+        case "sync":
+            import boto3
+            result = sync(
+                args.source_dir, args.bucket, args.manifest, s3_client(args.workers),
+                boto3.client("bedrock-agent") if args.kb_id else None,
+                args.kb_id, args.data_source_id, args.prefix, args.base_url,
+                args.max_tokens, args.overlap, args.processes, args.workers,
+            )
+            print(json.dumps(result, indent=2))
@@ -0,0 +1,248 @@
+import argparse
+import json
+import os
+import re
+import time
+import zlib
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.retrievers import BaseRetriever
+
+from rowdy.text import html_to_text
+
+# ------------------------------------------------------
+# Local mirror of the knowledge base
+#
+# Built from a local export of the knowledge base bucket
+# (`aws s3 sync s3://infobucket<app> export/`). An index directory holds:
+#   embeddings.npy   float32/float16 matrix, memory-mapped at load time
+#   chunks.bin       all chunk text as UTF-8, sliced by offsets.npy
+#   columns.json     per-chunk url / s3 uri columns and index settings
+#   ivf_*.npy        optional inverted-file lists (coarse k-means)
+# Search is a vectorized dot product plus argpartition top-k, so the
+# retriever works offline and answers in well under a millisecond for a
+# few thousand chunks.
+
+TEXT_EXTENSIONS = {".txt", ".md", ".html", ".htm"}
+_WORD = re.compile(r"\w+")
+
+
+# Offline embedding: signed feature hashing of words and word bigrams.
+# Not as good as Titan, but deterministic and dependency free.
+class HashingEmbeddings(Embeddings):
+    def __init__(self, dim: int = 1024):
+        self.dim = dim
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        words = _WORD.findall(text.lower())
+        for feature in words + [a + " " + b for a, b in zip(words, words[1:])]:
+            h = zlib.crc32(feature.encode("utf-8"))
+            vector[h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+def read_export(export_dir: str, bucket: str = "") -> Iterator[Tuple[str, Dict[str, str]]]:
+    for root, _, files in os.walk(export_dir):
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            ext = os.path.splitext(name)[1].lower()
+            if name.endswith(".metadata.json") or ext not in TEXT_EXTENSIONS:
+                continue
+            with open(path, encoding="utf-8", errors="replace") as f:
+                text = f.read()
+            if ext in (".html", ".htm"):
+                text = html_to_text(text)
+            key = os.path.relpath(path, export_dir).replace(os.sep, "/")
+            columns = {"uri": f"s3://{bucket}/{key}" if bucket else key, "url": ""}
+            # Knowledge base metadata sidecar: <file>.metadata.json
+            sidecar = path + ".metadata.json"
+            if os.path.exists(sidecar):
+                with open(sidecar) as f:
+                    columns["url"] = json.load(f).get("metadataAttributes", {}).get("url", "")
+            if text.strip():
+                yield text, columns
+
+
+def _kmeans(matrix: np.ndarray, clusters: int, iterations: int = 10, seed: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    centroids = matrix[rng.choice(len(matrix), clusters, replace=False)].astype(np.float32)
+    for _ in range(iterations):
+        assignments = np.argmax(matrix @ centroids.T, axis=1)
+        for c in range(clusters):
+            members = matrix[assignments == c]
+            if len(members):
+                centroid = members.mean(axis=0)
+                centroids[c] = centroid / (np.linalg.norm(centroid) or 1.0)
+    return centroids, np.argmax(matrix @ centroids.T, axis=1)
+
+
+def build_index(texts: List[str], columns: List[Dict[str, str]], embeddings: Embeddings, index_dir: str,
+                dtype: str = "float32", ivf_lists: int = 0, embedding_name: str = "hashing",
+                batch_size: int = 64) -> None:
+    os.makedirs(index_dir, exist_ok=True)
+    vectors = []
+    for start in range(0, len(texts), batch_size):
+        vectors.extend(embeddings.embed_documents(texts[start:start + batch_size]))
+    matrix = np.asarray(vectors, dtype=np.float32)
+    matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+    np.save(os.path.join(index_dir, "embeddings.npy"), matrix.astype(dtype))
+
+    encoded = [t.encode("utf-8") for t in texts]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(e) for e in encoded])
+    with open(os.path.join(index_dir, "chunks.bin"), "wb") as f:
+        f.write(b"".join(encoded))
+    np.save(os.path.join(index_dir, "offsets.npy"), offsets)
+
+    if ivf_lists:
+        centroids, assignments = _kmeans(matrix, min(ivf_lists, len(matrix)))
+        order = np.argsort(assignments, kind="stable").astype(np.int64)
+        list_offsets = np.searchsorted(assignments[order], np.arange(len(centroids) + 1)).astype(np.int64)
+        np.save(os.path.join(index_dir, "ivf_centroids.npy"), centroids)
+        np.save(os.path.join(index_dir, "ivf_order.npy"), order)
+        np.save(os.path.join(index_dir, "ivf_offsets.npy"), list_offsets)
+
+    with open(os.path.join(index_dir, "columns.json"), "w") as f:
+        json.dump({
+            "embedding": embedding_name,
+            "dim": int(matrix.shape[1]),
+            "count": len(texts),
+            "url": [c.get("url", "") for c in columns],
+            "uri": [c.get("uri", "") for c in columns],
+        }, f)
+
+
+class LocalIndex:
+    def __init__(self, index_dir: str):
+        self.index_dir = index_dir
+        self.embeddings = np.load(os.path.join(index_dir, "embeddings.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(index_dir, "offsets.npy"))
+        self._chunks = np.memmap(os.path.join(index_dir, "chunks.bin"), dtype=np.uint8, mode="r") \
+            if self.offsets[-1] else np.zeros(0, dtype=np.uint8)
+        with open(os.path.join(index_dir, "columns.json")) as f:
+            self.columns = json.load(f)
+        self.centroids = self.ivf_order = self.ivf_offsets = None
+        if os.path.exists(os.path.join(index_dir, "ivf_centroids.npy")):
+            self.centroids = np.load(os.path.join(index_dir, "ivf_centroids.npy"))
+            self.ivf_order = np.load(os.path.join(index_dir, "ivf_order.npy"))
+            self.ivf_offsets = np.load(os.path.join(index_dir, "ivf_offsets.npy"))
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def text(self, i: int) -> str:
+        return bytes(self._chunks[self.offsets[i]:self.offsets[i + 1]]).decode("utf-8")
+
+    def _scores(self, query: np.ndarray, rows: Optional[np.ndarray] = None, block: int = 65536) -> np.ndarray:
+        matrix = self.embeddings if rows is None else self.embeddings[rows]
+        if matrix.dtype == np.float32:
+            return matrix @ query
+        # float16 has no BLAS path; upcast one block at a time
+        return np.concatenate([
+            matrix[i:i + block].astype(np.float32) @ query for i in range(0, len(matrix), block)
+        ]) if len(matrix) else np.zeros(0, dtype=np.float32)
+
+    def search(self, query: np.ndarray, k: int = 12, nprobe: int = 4) -> List[Tuple[int, float]]:
+        query = np.asarray(query, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1.0
+        rows = None
+        if self.centroids is not None:
+            probes = np.argsort(-(self.centroids @ query))[:nprobe]
+            rows = np.sort(np.concatenate([
+                self.ivf_order[self.ivf_offsets[p]:self.ivf_offsets[p + 1]] for p in probes
+            ]))
+        scores = self._scores(query, rows)
+        k = min(k, len(scores))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        ids = top if rows is None else rows[top]
+        return [(int(i), float(scores[t])) for i, t in zip(ids, top)]
+
+
+class LocalKnowledgeBaseRetriever(BaseRetriever):
+    index: Any
+    embeddings: Any
+    k: int = 12
+    nprobe: int = 4
+
+    # Same metadata shape as AmazonKnowledgeBasesRetriever results
+    def _document(self, i: int, score: float) -> Document:
+        uri = self.index.columns["uri"][i]
+        return Document(
+            page_content=self.index.text(i),
+            metadata={
+                "location": {"s3Location": {"uri": uri}, "type": "S3"},
+                "score": score,
+                "source_metadata": {"url": self.index.columns["url"][i], "x-amz-bedrock-kb-source-uri": uri},
+                "type": "TEXT",
+            },
+        )
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        vector = np.asarray(self.embeddings.embed_query(query), dtype=np.float32)
+        return [self._document(i, score) for i, score in self.index.search(vector, self.k, self.nprobe)]
+
+
+def load_embeddings(name: str, client: Any = None) -> Embeddings:
+    if name == "hashing":
+        return HashingEmbeddings()
+    from langchain_aws import BedrockEmbeddings
+    return BedrockEmbeddings(client=client, model_id=name) if client else BedrockEmbeddings(model_id=name)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or query a local knowledge base index.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="Index a local export of the knowledge base bucket")
+    build_parser.add_argument("export_dir")
+    build_parser.add_argument("index_dir")
+    build_parser.add_argument("--bucket", default="", help="Bucket name used for s3:// uris")
+    build_parser.add_argument("--embedding", default="hashing",
+                              help='"hashing" (offline) or a Bedrock model id such as amazon.titan-embed-text-v2:0')
+    build_parser.add_argument("--float16", action="store_true")
+    build_parser.add_argument("--ivf-lists", type=int, default=0)
+
+    query_parser = subparsers.add_parser("query", help="Search an index")
+    query_parser.add_argument("index_dir")
+    query_parser.add_argument("text")
+    query_parser.add_argument("-k", type=int, default=5)
+
+    args = parser.parse_args()
+    match args.command:
+        case "build":
+            rows = list(read_export(args.export_dir, args.bucket))
+            build_index(
+                [text for text, _ in rows], [columns for _, columns in rows],
+                load_embeddings(args.embedding), args.index_dir,
+                dtype="float16" if args.float16 else "float32",
+                ivf_lists=args.ivf_lists, embedding_name=args.embedding,
+            )
+            print(f"Indexed {len(rows)} chunks into {args.index_dir}")
+        case "query":
+            index = LocalIndex(args.index_dir)
+            retriever = LocalKnowledgeBaseRetriever(
+                index=index, embeddings=load_embeddings(index.columns["embedding"]), k=args.k
+            )
+            start = time.perf_counter()
+            documents = retriever.invoke(args.text)
+            elapsed = (time.perf_counter() - start) * 1000
+            for document in documents:
+                print(f"{document.metadata['score']:.3f}  {document.metadata['source_metadata']['url'] or document.metadata['location']['s3Location']['uri']}")
+            print(f"{elapsed:.2f} ms")
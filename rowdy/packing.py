@@ -0,0 +1,133 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from rowdy.text import estimate_tokens
+
+# ------------------------------------------------------
+# Context packing
+#
+# Turns the retrieved documents into the `{context}` text of the prompt:
+# weak hits are cut, near-duplicate chunks (MinHash over word shingles)
+# are dropped, the rest are packed greedily by relevance (the rerank score
+# if the chunks were reranked, else the retrieval score) into a token
+# budget and grouped under their source URL as plain text.
+
+_PRIME = (1 << 31) - 1
+
+
+class PackedContext(NamedTuple):
+    text: str
+    documents: List[Document]
+    tokens: int
+    tokens_saved: int
+
+
+def document_url(document: Document) -> str:
+    metadata = document.metadata
+    return (
+        (metadata.get("source_metadata") or {}).get("url")
+        or (metadata.get("location") or {}).get("s3Location", {}).get("uri")
+        or ""
+    )
+
+
+def document_score(document: Document) -> float:
+    return float(document.metadata.get("score") or 0.0)
+
+
+# Reranked chunks first, in rerank order; the rest by retrieval score
+def document_rank(document: Document) -> Tuple[bool, float]:
+    rerank_score = document.metadata.get("rerank_score")
+    if rerank_score is not None:
+        return True, float(rerank_score)
+    return False, document_score(document)
+
+
+class ContextPacker:
+    def __init__(self, max_tokens: int = 1500, min_score: float = 0.0,
+                 dedup_threshold: float = 0.8, shingle_size: int = 3, num_perm: int = 128):
+        self.max_tokens = max_tokens
+        self.min_score = min_score
+        self.dedup_threshold = dedup_threshold
+        self.shingle_size = shingle_size
+        rng = np.random.default_rng(1)
+        self._a = rng.integers(1, _PRIME, num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, _PRIME, num_perm, dtype=np.uint64)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.tokens_saved = 0
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "tokens_saved": self.tokens_saved,
+                "avg_tokens_saved": self.tokens_saved / self.requests if self.requests else 0.0,
+            }
+
+    def _signature(self, text: str) -> Optional[np.ndarray]:
+        words = text.lower().split()
+        if not words:
+            return None
+        n = min(self.shingle_size, len(words))
+        shingles = {" ".join(words[i:i + n]) for i in range(len(words) - n + 1)}
+        hashes = np.fromiter(
+            (int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "little") % _PRIME
+             for s in shingles),
+            dtype=np.uint64, count=len(shingles),
+        )
+        return ((self._a[:, None] * hashes[None, :] + self._b[:, None]) % _PRIME).min(axis=1)
+
+    def deduplicate(self, documents: List[Document]) -> List[Document]:
+        kept: List[Document] = []
+        signatures: List[np.ndarray] = []
+        for document in documents:
+            signature = self._signature(document.page_content)
+            if signature is None:
+                continue
+            if signatures and (np.stack(signatures) == signature).mean(axis=1).max() >= self.dedup_threshold:
+                continue
+            kept.append(document)
+            signatures.append(signature)
+        return kept
+
+    def pack(self, documents: List[Document]) -> PackedContext:
+        candidates = sorted(
+            (d for d in documents if document_score(d) >= self.min_score),
+            key=document_rank, reverse=True,
+        )
+        candidates = self.deduplicate(candidates)
+
+        # Greedy by relevance: take every chunk that still fits the budget
+        groups: "OrderedDict[str, List[str]]" = OrderedDict()
+        packed: List[Document] = []
+        used = 0
+        for document in candidates:
+            url = document_url(document)
+            text = document.page_content.strip()
+            cost = estimate_tokens(text) + (0 if url in groups else estimate_tokens(url) + 2)
+            if used + cost > self.max_tokens:
+                continue
+            groups.setdefault(url, []).append(text)
+            packed.append(document)
+            used += cost
+
+        text = "\n\n".join(
+            f"[{i}] {url}\n" + "\n".join(chunks) if url else f"[{i}]\n" + "\n".join(chunks)
+            for i, (url, chunks) in enumerate(groups.items(), 1)
+        )
+        tokens = estimate_tokens(text)
+        # Previously the prompt received the repr of the Document list
+        saved = max(0, estimate_tokens(str(documents)) - tokens)
+        with self._lock:
+            self.requests += 1
+            self.tokens_saved += saved
+        return PackedContext(text, packed, tokens, saved)
+
+    def __call__(self, documents: List[Document]) -> str:
+        return self.pack(documents).text
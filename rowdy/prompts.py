@@ -0,0 +1,138 @@
+import threading
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Mapping, Optional, Tuple
+
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+from langchain_core.prompt_values import ChatPromptValue
+from langchain_core.runnables import Runnable, RunnableLambda
+
+from rowdy.text import estimate_tokens
+
+# ------------------------------------------------------
+# Prompt assembly
+#
+# Every request is laid out as
+#   system    static persona and rules - the same bytes for every request
+#   history   the session's window, append-only between summaries
+#   human     retrieved context, then the question
+# so the longest possible prefix stays identical across requests and turns.
+# The system message is built once and reused as-is. Retrieved context used
+# to sit inside the system prompt, which changed it on every request.
+#
+# Prompt caching: OpenAI caches identical prefixes (1024+ tokens) on its
+# own. Anthropic on Bedrock caches up to a cache_control marker; with
+# cache_markers the end of the system prompt and the end of the history are
+# marked. Prefixes below the model's minimum cacheable length are simply
+# not cached.
+
+SYSTEM_PROMPT = (
+    "You are Rowdy the Riverhawk, a chatbot for the University of Massachusetts Lowell. "
+    "Provide answers in the style of a tour guide.\n"
+    "Please only use answers that are present in the search results given with each question.\n"
+    "All users are full time students unless stated otherwise\n"
+    "Please only answer questions about the University of Massachusetts Lowell."
+)
+
+QUESTION_TEMPLATE = "Search results:\n{context}\n\nQuestion: {question}"
+
+CACHE_CONTROL = {"type": "ephemeral"}
+
+# MODEL settings whose chat model accepts cache_control on content blocks.
+# ROUTER is left out: the same messages would also go to OpenAI.
+CACHE_MARKER_MODELS = {"ANTHROPIC"}
+# Bedrock model IDs with prompt caching; matched anywhere in the ID, so
+# cross-region inference profiles ("us.anthropic...") count too. Other
+# Claude models (e.g. Claude 3 Haiku) get unmarked messages.
+CACHE_MARKER_MODEL_IDS = (
+    "anthropic.claude-3-5-haiku-20241022",
+    "anthropic.claude-3-7-sonnet-20250219",
+    "anthropic.claude-sonnet-4",
+    "anthropic.claude-opus-4",
+    "anthropic.claude-haiku-4-5",
+)
+
+TokenCounter = Callable[[str], int]
+
+
+def _text(message: BaseMessage) -> str:
+    return message.content if isinstance(message.content, str) else message.text
+
+
+def _marked(text: str) -> List[Dict[str, Any]]:
+    return [{"type": "text", "text": text, "cache_control": CACHE_CONTROL}]
+
+
+# Token counter per MODEL setting. OpenAI models use their tiktoken encoding
+# when it can be loaded; Claude has no local tokenizer, so it is estimated.
+@lru_cache(maxsize=None)
+def token_counter(model: str) -> TokenCounter:
+    if model == "OPENAI":
+        try:
+            import tiktoken
+            encoding = tiktoken.get_encoding("o200k_base")
+            return lambda text: len(encoding.encode(text, disallowed_special=()))
+        except Exception:
+            pass
+    return estimate_tokens
+
+
+class PromptAssembler:
+    def __init__(self, system: str = SYSTEM_PROMPT, template: str = QUESTION_TEMPLATE, cache_markers: bool = False):
+        self.template = template
+        self.cache_markers = cache_markers
+        self.system_message = SystemMessage(_marked(system) if cache_markers else system)
+        # Static segments, by name; their token counts are kept per model
+        self.static = {"system": system, "template": template.format(context="", question="")}
+        self._counts: Dict[Tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+
+    def _question(self, inputs: Mapping[str, Any]) -> HumanMessage:
+        context = inputs.get("context", "")
+        return HumanMessage(self.template.format(
+            context=context if isinstance(context, str) else str(context), question=inputs["question"],
+        ))
+
+    def messages(self, inputs: Mapping[str, Any]) -> List[BaseMessage]:
+        history = list(inputs.get("history") or [])
+        if self.cache_markers and history:
+            # A copy: the session window keeps the plain message
+            history[-1] = history[-1].model_copy(update={"content": _marked(_text(history[-1]))})
+        return [self.system_message, *history, self._question(inputs)]
+
+    def invoke(self, inputs: Mapping[str, Any]) -> ChatPromptValue:
+        return ChatPromptValue(messages=self.messages(inputs))
+
+    def static_tokens(self, name: str, model: str) -> int:
+        key = (name, model)
+        with self._lock:
+            count = self._counts.get(key)
+        if count is None:
+            count = token_counter(model)(self.static[name])
+            with self._lock:
+                self._counts[key] = count
+        return count
+
+    # Prompt size per segment for one request. "cacheable" is the prefix
+    # shared with the next turn of the same session: system plus history.
+    def token_counts(self, inputs: Mapping[str, Any], model: str) -> Dict[str, int]:
+        count = token_counter(model)
+        context = inputs.get("context", "")
+        counts = {
+            "system": self.static_tokens("system", model),
+            "history": sum(count(_text(m)) for m in inputs.get("history") or []),
+            "template": self.static_tokens("template", model),
+            "context": count(context if isinstance(context, str) else str(context)),
+            "question": count(inputs["question"]),
+        }
+        counts["cacheable"] = counts["system"] + counts["history"]
+        counts["total"] = counts["cacheable"] + counts["template"] + counts["context"] + counts["question"]
+        return counts
+
+
+def supports_cache_markers(model: str, model_id: str) -> bool:
+    return model in CACHE_MARKER_MODELS and any(prefix in model_id for prefix in CACHE_MARKER_MODEL_IDS)
+
+
+def build_prompt(cache_markers: bool = False, assembler: Optional[PromptAssembler] = None) -> Runnable:
+    assembler = assembler or PromptAssembler(cache_markers=cache_markers)
+    return RunnableLambda(assembler.invoke, name="prompt")
@@ -0,0 +1,59 @@
+import time
+from typing import Any, Callable, List
+
+# ------------------------------------------------------
+# Throttled streaming render
+#
+# Chunks are escaped once as they arrive and buffered; the placeholder is
+# only updated every `interval` seconds or `min_chars` characters, plus a
+# final flush. The old loop re-escaped and re-sent the whole answer for
+# every token.
+
+
+def escape_markdown(text: str) -> str:
+    return text.replace('$', r'\$')
+
+
+class StreamRenderer:
+    def __init__(self, placeholder: Any, interval: float = 0.05, min_chars: int = 64,
+                 clock: Callable[[], float] = time.monotonic):
+        self.placeholder = placeholder
+        self.interval = interval
+        self.min_chars = min_chars
+        self._clock = clock
+        self._raw: List[str] = []
+        self._escaped: List[str] = []
+        self._pending = 0
+        self._last_flush = clock()
+        self.flushes = 0
+        self.render_seconds = 0.0
+
+    @property
+    def text(self) -> str:
+        if len(self._raw) > 1:
+            self._raw = ["".join(self._raw)]
+        return self._raw[0] if self._raw else ""
+
+    def write(self, chunk: str) -> None:
+        if not chunk:
+            return
+        self._raw.append(chunk)
+        self._escaped.append(escape_markdown(chunk))
+        self._pending += len(chunk)
+        if self._pending >= self.min_chars or self._clock() - self._last_flush >= self.interval:
+            self.flush()
+
+    def flush(self) -> None:
+        # Collapse the buffer so the next join only touches the new suffix
+        start = time.perf_counter()
+        rendered = "".join(self._escaped)
+        self._escaped = [rendered]
+        self.placeholder.markdown(rendered)
+        self.render_seconds += time.perf_counter() - start
+        self._pending = 0
+        self._last_flush = self._clock()
+        self.flushes += 1
+
+    def close(self) -> str:
+        self.flush()
+        return self.text
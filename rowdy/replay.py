@@ -0,0 +1,268 @@
+import asyncio
+import copy
+import itertools
+import json
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, Dict, Iterator, List, Optional
+
+import httpx
+
+# ------------------------------------------------------
+# Record / replay of the Bedrock and OpenAI backends
+#
+# Recording wraps the real clients and saves every Retrieve response and
+# every streamed model response, with the delay before each event, to a
+# JSON cassette. Replaying swaps fakes with the same interface into the
+# Resources, so the real chain (retriever, ChatBedrock / ChatOpenAI,
+# packing, history) runs unchanged against recorded timing. `speed`
+# scales every delay. Cassette layout:
+#   {"retrieve": [{"query", "latency", "response"}],
+#    "bedrock":  [{"events": [[delay, chunk json], ...]}],
+#    "openai":   [{"status", "headers", "events": [[delay, sse text], ...]}]}
+
+
+class Cassette:
+    def __init__(self, data: Optional[Dict[str, List[Dict[str, Any]]]] = None):
+        self.data = data or {}
+        for kind in ("retrieve", "bedrock", "openai"):
+            self.data.setdefault(kind, [])
+        self._lock = threading.Lock()
+        self._cursors: Dict[str, Any] = {}
+
+    @classmethod
+    def load(cls, path: str) -> "Cassette":
+        with open(path) as f:
+            return cls(json.load(f))
+
+    def save(self, path: str) -> None:
+        with self._lock, open(path, "w") as f:
+            json.dump(self.data, f)
+
+    def add(self, kind: str, entry: Dict[str, Any]) -> None:
+        with self._lock:
+            self.data[kind].append(entry)
+
+    # Entries are handed out round-robin; Retrieve prefers a recorded
+    # response for the same query
+    def next(self, kind: str, query: Optional[str] = None) -> Dict[str, Any]:
+        entries = self.data[kind]
+        if not entries:
+            raise LookupError(f"No {kind} responses in the cassette")
+        if query is not None:
+            for entry in entries:
+                if entry.get("query") == query:
+                    return entry
+        with self._lock:
+            cursor = self._cursors.setdefault(kind, itertools.cycle(range(len(entries))))
+            return entries[next(cursor)]
+
+
+# ------------------------------------------------------
+# Bedrock (boto3 bedrock-runtime / bedrock-agent-runtime)
+
+class RecordingBedrockClient:
+    def __init__(self, client: Any, cassette: Cassette):
+        self.client = client
+        self.cassette = cassette
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.client, name)
+
+    def retrieve(self, **kwargs: Any) -> Dict[str, Any]:
+        start = time.perf_counter()
+        response = self.client.retrieve(**kwargs)
+        self.cassette.add("retrieve", {
+            "query": kwargs.get("retrievalQuery", {}).get("text"),
+            "latency": time.perf_counter() - start,
+            "response": {"retrievalResults": response["retrievalResults"]},
+        })
+        return response
+
+    def invoke_model_with_response_stream(self, **kwargs: Any) -> Dict[str, Any]:
+        start = time.perf_counter()
+        response = self.client.invoke_model_with_response_stream(**kwargs)
+        events: List[List[Any]] = []
+        self.cassette.add("bedrock", {"events": events})
+
+        def body() -> Iterator[Dict[str, Any]]:
+            last = start
+            for event in response["body"]:
+                now = time.perf_counter()
+                if "chunk" in event:
+                    events.append([now - last, event["chunk"]["bytes"].decode()])
+                last = now
+                yield event
+
+        return {**response, "body": body()}
+
+
+class ReplayBedrockClient:
+    def __init__(self, cassette: Cassette, speed: float = 1.0, region_name: str = "us-east-1"):
+        self.cassette = cassette
+        self.speed = speed
+        # ChatBedrock reads the region off the client like a boto3 client
+        self.meta = SimpleNamespace(region_name=region_name)
+
+    def _sleep(self, seconds: float) -> None:
+        if seconds > 0 and self.speed > 0:
+            time.sleep(seconds / self.speed)
+
+    def retrieve(self, **kwargs: Any) -> Dict[str, Any]:
+        entry = self.cassette.next("retrieve", kwargs.get("retrievalQuery", {}).get("text"))
+        self._sleep(entry["latency"])
+        return copy.deepcopy(entry["response"])
+
+    def invoke_model_with_response_stream(self, **kwargs: Any) -> Dict[str, Any]:
+        entry = self.cassette.next("bedrock")
+
+        def body() -> Iterator[Dict[str, Any]]:
+            for delay, chunk in entry["events"]:
+                self._sleep(delay)
+                yield {"chunk": {"bytes": chunk.encode()}}
+
+        return {"body": body(), "contentType": "application/json"}
+
+
+# ------------------------------------------------------
+# OpenAI (httpx transport under the openai client)
+
+class _RecordingStream(httpx.SyncByteStream):
+    def __init__(self, stream: Any, events: List[List[Any]], start: float):
+        self.stream = stream
+        self.events = events
+        self.start = start
+
+    def __iter__(self) -> Iterator[bytes]:
+        last = self.start
+        for chunk in self.stream:
+            now = time.perf_counter()
+            self.events.append([now - last, chunk.decode()])
+            last = now
+            yield chunk
+
+    def close(self) -> None:
+        self.stream.close()
+
+
+class RecordingTransport(httpx.BaseTransport):
+    def __init__(self, cassette: Cassette, transport: Optional[httpx.BaseTransport] = None):
+        self.cassette = cassette
+        self.transport = transport or httpx.HTTPTransport()
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        start = time.perf_counter()
+        response = self.transport.handle_request(request)
+        events: List[List[Any]] = []
+        self.cassette.add("openai", {
+            "status": response.status_code,
+            "headers": {"content-type": response.headers.get("content-type", "text/event-stream")},
+            "events": events,
+        })
+        return httpx.Response(
+            response.status_code, headers=response.headers,
+            stream=_RecordingStream(response.stream, events, start), extensions=response.extensions,
+        )
+
+
+class _ReplayStream(httpx.SyncByteStream, httpx.AsyncByteStream):
+    def __init__(self, events: List[List[Any]], speed: float):
+        self.events = events
+        self.speed = speed
+
+    def __iter__(self) -> Iterator[bytes]:
+        for delay, chunk in self.events:
+            if delay > 0 and self.speed > 0:
+                time.sleep(delay / self.speed)
+            yield chunk.encode()
+
+    async def __aiter__(self):
+        for delay, chunk in self.events:
+            if delay > 0 and self.speed > 0:
+                await asyncio.sleep(delay / self.speed)
+            yield chunk.encode()
+
+
+class ReplayTransport(httpx.BaseTransport, httpx.AsyncBaseTransport):
+    def __init__(self, cassette: Cassette, speed: float = 1.0):
+        self.cassette = cassette
+        self.speed = speed
+
+    def _response(self) -> httpx.Response:
+        entry = self.cassette.next("openai")
+        return httpx.Response(entry["status"], headers=entry["headers"], stream=_ReplayStream(entry["events"], self.speed))
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        return self._response()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return self._response()
+
+
+# ------------------------------------------------------
+# Wiring into Resources - clients are plain cached attributes there, so
+# setting them before first use replaces them everywhere
+
+def install_replay(resources: Any, cassette: Cassette, speed: float = 1.0) -> None:
+    bedrock = ReplayBedrockClient(cassette, speed)
+    transport = ReplayTransport(cassette, speed)
+    resources.__dict__.update(
+        bedrock_runtime=bedrock,
+        retrieval_runtime=bedrock,
+        openai_http_client=httpx.Client(transport=transport),
+        openai_async_http_client=httpx.AsyncClient(transport=transport),
+    )
+
+
+def install_recorder(resources: Any, cassette: Cassette) -> None:
+    resources.__dict__.update(
+        bedrock_runtime=RecordingBedrockClient(resources.bedrock_runtime, cassette),
+        retrieval_runtime=RecordingBedrockClient(resources.retrieval_runtime, cassette),
+        openai_http_client=httpx.Client(transport=RecordingTransport(cassette)),
+    )
+
+
+# Offline cassette with the given timing, for running the benchmarks
+# without ever recording against AWS / OpenAI
+def synthetic_cassette(answer: str, documents: List[Dict[str, Any]], retrieval_ms: float = 250,
+                       first_token_ms: float = 400, token_ms: float = 15) -> Cassette:
+    words = answer.split(" ")
+    tokens = [w if i == 0 else " " + w for i, w in enumerate(words)]
+
+    bedrock = [[first_token_ms / 1000, json.dumps({"type": "message_start", "message": {"role": "assistant", "content": []}})],
+               [0.0, json.dumps({"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}})]]
+    bedrock += [[token_ms / 1000 if i else 0.0,
+                 json.dumps({"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": t}})]
+                for i, t in enumerate(tokens)]
+    bedrock += [[0.0, json.dumps({"type": "content_block_stop", "index": 0})],
+                [0.0, json.dumps({"type": "message_delta", "delta": {"stop_reason": "end_turn"}, "usage": {"output_tokens": len(tokens)}})],
+                [0.0, json.dumps({"type": "message_stop"})]]
+
+    def sse(delta: Dict[str, Any], finish: Optional[str] = None) -> str:
+        chunk = {"id": "chatcmpl-replay", "object": "chat.completion.chunk", "created": 0, "model": "gpt-4o-mini",
+                 "choices": [{"index": 0, "delta": delta, "finish_reason": finish}]}
+        return f"data: {json.dumps(chunk)}\n\n"
+
+    openai = [[first_token_ms / 1000, sse({"role": "assistant", "content": ""})]]
+    openai += [[token_ms / 1000 if i else 0.0, sse({"content": t})] for i, t in enumerate(tokens)]
+    openai += [[0.0, sse({}, "stop")], [0.0, "data: [DONE]\n\n"]]
+
+    return Cassette({
+        "retrieve": [{"query": None, "latency": retrieval_ms / 1000, "response": {"retrievalResults": documents}}],
+        "bedrock": [{"events": bedrock}],
+        "openai": [{"status": 200, "headers": {"content-type": "text/event-stream"}, "events": openai}],
+    })
+
+
+# Retrieve API shape of a list of documents (see rowdy.fakes.sample_documents)
+def retrieval_results(documents: List[Any]) -> List[Dict[str, Any]]:
+    return [
+        {
+            "content": {"text": d.page_content, "type": "TEXT"},
+            "location": {"type": "S3", "s3Location": {"uri": f"s3://replay/{i}.txt"}},
+            "metadata": dict(d.metadata.get("source_metadata") or {}),
+            "score": d.metadata.get("score", 0.0),
+        }
+        for i, d in enumerate(documents)
+    ]
@@ -0,0 +1,139 @@
+import re
+import threading
+import time
+from collections import Counter
+from typing import Any, List, Optional, Sequence
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from pydantic import PrivateAttr
+
+from rowdy.packing import document_score
+
+# ------------------------------------------------------
+# Reranking
+#
+# The knowledge base is vector-only, so we over-fetch and rerank the
+# returned chunks locally. Rerankers score (query, chunk) pairs; the
+# retriever wrapper keeps the original order whenever scoring would blow
+# the latency budget.
+
+_TOKEN = re.compile(r"\w+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i in is it me my of on or the "
+    "to what when where which who why will with you your".split()
+)
+
+
+class RerankTimeout(Exception):
+    pass
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN.findall(text.lower()) if t not in _STOPWORDS]
+
+
+# BM25 over the returned chunks, blended with the knowledge base score:
+#   alpha * bm25 (scaled to 0..1) + (1 - alpha) * vector score
+class BM25Reranker:
+    def __init__(self, k1: float = 1.5, b: float = 0.75, alpha: float = 0.5):
+        self.k1 = k1
+        self.b = b
+        self.alpha = alpha
+
+    def score(self, query: str, documents: Sequence[Document], deadline: Optional[float] = None) -> np.ndarray:
+        terms = sorted(set(tokenize(query)))
+        vector = np.array([document_score(d) for d in documents], dtype=np.float32)
+        if not terms or not documents:
+            return vector
+
+        counts = [Counter(tokenize(d.page_content)) for d in documents]
+        tf = np.array([[c[t] for t in terms] for c in counts], dtype=np.float32)
+        lengths = np.array([sum(c.values()) for c in counts], dtype=np.float32)
+        df = (tf > 0).sum(axis=0)
+        n = len(documents)
+        idf = np.log1p((n - df + 0.5) / (df + 0.5))
+        norm = self.k1 * (1 - self.b + self.b * lengths / max(lengths.mean(), 1.0))
+        bm25 = (tf * (self.k1 + 1) / (tf + norm[:, None]) * idf).sum(axis=1)
+        if bm25.max() > 0:
+            bm25 /= bm25.max()
+        return self.alpha * bm25 + (1 - self.alpha) * vector
+
+
+# Small cross-encoder (e.g. ms-marco-MiniLM-L-6-v2 exported to ONNX) run on
+# CPU with onnxruntime. Both packages are optional.
+class CrossEncoderReranker:
+    def __init__(self, model_path: str, tokenizer_path: str, batch_size: int = 8, max_length: int = 256):
+        try:
+            import onnxruntime
+            from tokenizers import Tokenizer
+        except ImportError as e:
+            raise ImportError(
+                "The cross-encoder reranker needs `pip install onnxruntime tokenizers`"
+            ) from e
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = 1
+        self.session = onnxruntime.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = Tokenizer.from_file(tokenizer_path)
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding()
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+
+    def score(self, query: str, documents: Sequence[Document], deadline: Optional[float] = None) -> np.ndarray:
+        scores: List[np.ndarray] = []
+        for start in range(0, len(documents), self.batch_size):
+            if deadline is not None and time.perf_counter() > deadline:
+                raise RerankTimeout()
+            batch = documents[start:start + self.batch_size]
+            encodings = self.tokenizer.encode_batch([(query, d.page_content) for d in batch])
+            feed = {
+                "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+                "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+                "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+            }
+            with self._lock:
+                logits = self.session.run(None, {k: v for k, v in feed.items() if k in self.input_names})[0]
+            scores.append(logits.reshape(len(batch), -1)[:, 0])
+        return np.concatenate(scores) if scores else np.zeros(0, dtype=np.float32)
+
+
+class RerankingRetriever(BaseRetriever):
+    retriever: BaseRetriever
+    reranker: Any
+    top_n: int = 4
+    latency_budget: Optional[float] = 0.05
+
+    _stats: Any = PrivateAttr(default_factory=lambda: {"reranked": 0, "fallbacks": 0, "seconds": 0.0})
+
+    def stats(self) -> dict:
+        return dict(self._stats)
+
+    def rerank(self, query: str, documents: List[Document]) -> List[Document]:
+        start = time.perf_counter()
+        deadline = start + self.latency_budget if self.latency_budget is not None else None
+        try:
+            scores = self.reranker.score(query, documents, deadline)
+            if deadline is not None and time.perf_counter() > deadline:
+                raise RerankTimeout()
+        except RerankTimeout:
+            self._stats["fallbacks"] += 1
+            return documents[:self.top_n]
+        finally:
+            self._stats["seconds"] += time.perf_counter() - start
+        self._stats["reranked"] += 1
+        order = np.argsort(-np.asarray(scores), kind="stable")[:self.top_n]
+        # Copies: the retrieval cache may hold the originals
+        return [
+            documents[i].model_copy(update={"metadata": {**documents[i].metadata, "rerank_score": float(scores[i])}})
+            for i in order
+        ]
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        documents = self.retriever.invoke(query, {"callbacks": run_manager.get_child()})
+        return self.rerank(query, documents)
@@ -0,0 +1,549 @@
+import contextlib
+import threading
+from typing import Any, Mapping, Optional
+
+import boto3
+from botocore.config import Config
+from langchain_core.language_models import BaseChatModel
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.runnables import Runnable
+
+from rowdy.aio import AsyncRunner
+from rowdy.cache import SemanticCache, with_semantic_cache
+from rowdy.chain import build_chain
+from rowdy.history import HISTORY_BUDGETS, WindowedChatMessageHistory, model_summarizer, question_summarizer
+from rowdy.packing import ContextPacker
+from rowdy.prompts import build_prompt, supports_cache_markers, token_counter
+from rowdy.lru import LRUCache
+from rowdy.retrieval import CachingRetriever, RetrievalCache
+from rowdy.sessions import MemorySessionStore, SessionStore, StoredChatMessageHistory
+
+# ------------------------------------------------------
+# Process-wide resources
+#
+# Clients, caches, the retriever stack, the model and the chain are built
+# once per process and shared by every session (the Streamlit app holds
+# the instance in st.cache_resource). Settings come from st.secrets, the
+# environment or a plain dict; optional parts are only built if enabled.
+
+region_name = "us-east-1"
+model_id = "anthropic.claude-3-haiku-20240307-v1:0"
+openai_model_name = "gpt-4o-mini"
+embedding_model_id = "amazon.titan-embed-text-v2:0"
+
+# Default requests-per-minute quotas for admission control; set
+# ADMISSION_{backend}_RPM to the account's actual quota
+ADMISSION_QUOTAS = {"ANTHROPIC": 200, "OPENAI": 500}
+
+model_kwargs =  {
+    "max_tokens": 2048,
+    "temperature": 0.0,
+    "top_k": 250,
+    "top_p": 1,
+    "stop_sequences": ["\n\nHuman"],
+}
+
+
+class Settings:
+    def __init__(self, values: Mapping[str, Any]):
+        self.values = values
+
+    def get(self, name: str, default: Any = None) -> Any:
+        value = self.values.get(name)
+        return default if value is None or value == "" else value
+
+    def __getitem__(self, name: str) -> Any:
+        return self.values[name]
+
+    def int(self, name: str, default: int) -> int:
+        return int(self.get(name, default))
+
+    def float(self, name: str, default: float) -> float:
+        return float(self.get(name, default))
+
+    def bool(self, name: str, default: bool = False) -> bool:
+        return str(self.get(name, default)).lower() in ("1", "true", "yes", "on")
+
+
+# Like functools.cached_property, but built under the instance lock so
+# sessions racing on first use share a single instance
+class resource:
+    def __init__(self, build):
+        self.build = build
+        self.name = build.__name__
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        with instance._lock:
+            if self.name not in instance.__dict__:
+                instance.__dict__[self.name] = self.build(instance)
+            return instance.__dict__[self.name]
+
+
+class Resources:
+    def __init__(self, settings: Mapping[str, Any]):
+        self.settings = settings if isinstance(settings, Settings) else Settings(settings)
+        self._lock = threading.RLock()
+        self._sessions_lock = threading.Lock()
+
+    # ------------------------------------------------------
+    # Amazon Bedrock / OpenAI clients
+
+    def _boto_client(self, service_name: str) -> Any:
+        return boto3.client(
+            service_name=service_name,
+            region_name=self.settings.get("AWS_REGION", region_name),
+            aws_access_key_id=self.settings.get("AWS_ACCESS_KEY_ID"),
+            aws_secret_access_key=self.settings.get("AWS_SECRET_ACCESS_KEY"),
+            config=Config(
+                max_pool_connections=self.settings.int("BOTO_MAX_POOL_CONNECTIONS", 50),
+                retries={"mode": "adaptive", "max_attempts": self.settings.int("BOTO_MAX_ATTEMPTS", 3)},
+                tcp_keepalive=True,
+            ),
+        )
+
+    @resource
+    def bedrock_runtime(self) -> Any:
+        return self._boto_client("bedrock-runtime")
+
+    @resource
+    def retrieval_runtime(self) -> Any:
+        return self._boto_client("bedrock-agent-runtime")
+
+    @resource
+    def openai_http_client(self) -> Any:
+        import httpx
+        connections = self.settings.int("OPENAI_MAX_CONNECTIONS", 50)
+        return httpx.Client(limits=httpx.Limits(max_connections=connections, max_keepalive_connections=connections))
+
+    @resource
+    def openai_async_http_client(self) -> Any:
+        import httpx
+        connections = self.settings.int("OPENAI_MAX_CONNECTIONS", 50)
+        return httpx.AsyncClient(limits=httpx.Limits(max_connections=connections, max_keepalive_connections=connections))
+
+    # ------------------------------------------------------
+    # Model
+
+    def build_model(self, backend: Optional[str] = None, **overrides: Any) -> BaseChatModel:
+        match (backend or self.settings["MODEL"]):
+            case "OPENAI":
+                from langchain_openai import ChatOpenAI
+                return ChatOpenAI(
+                    model_name=openai_model_name,
+                    api_key=self.settings.get("OPENAI_API_KEY"),
+                    http_client=self.openai_http_client,
+                    http_async_client=self.openai_async_http_client,
+                    **overrides,
+                )
+            case "ANTHROPIC":
+                from langchain_aws import ChatBedrock
+                return ChatBedrock(
+                    client=self.bedrock_runtime,
+                    model_id=model_id,
+                    model_kwargs={**model_kwargs, **overrides},
+                )
+            # Both, with hedging and failover - see rowdy/router.py
+            case "ROUTER":
+                from rowdy.router import Backend, CircuitBreaker, RoutingChatModel
+                return RoutingChatModel(
+                    backends=[
+                        Backend(
+                            name,
+                            self.build_model(name, **overrides),
+                            max_concurrency=self.settings.int(f"ROUTER_{name}_MAX_CONCURRENCY", 32),
+                            breaker=CircuitBreaker(
+                                failure_threshold=self.settings.int("ROUTER_BREAKER_FAILURES", 5),
+                                reset_timeout=self.settings.float("ROUTER_BREAKER_RESET_S", 30),
+                            ),
+                        )
+                        for name in map(str.strip, self.settings.get("ROUTER_BACKENDS", "ANTHROPIC,OPENAI").split(","))
+                    ],
+                    hedge_after=self.settings.float("ROUTER_HEDGE_MS", 1500) / 1000,
+                )
+            case other:
+                raise ValueError(f"Unknown MODEL {other!r}, expected OPENAI, ANTHROPIC or ROUTER")
+
+    @resource
+    def model(self) -> BaseChatModel:
+        return self.build_model()
+
+    # ------------------------------------------------------
+    # Retrieval
+
+    def build_base_retriever(self, number_of_results: Optional[int] = None) -> BaseRetriever:
+        number_of_results = number_of_results or self.settings.int("KB_NUMBER_OF_RESULTS", 12)
+        adaptive = self.settings.get("RETRIEVAL_DEPTH", "fixed") == "adaptive"
+        # Local mirror of the knowledge base - see `python -m rowdy.local_index build`
+        if self.settings.get("RETRIEVER", "BEDROCK") == "LOCAL":
+            from rowdy.local_index import LocalKnowledgeBaseRetriever, load_embeddings
+            retriever = LocalKnowledgeBaseRetriever(
+                index=self.local_index,
+                embeddings=load_embeddings(self.local_index.columns["embedding"], self.bedrock_runtime),
+                k=number_of_results,
+            )
+            if adaptive:
+                from rowdy.adaptive import local_pager
+                return self.build_adaptive_retriever(local_pager(retriever), number_of_results)
+            return retriever
+        if adaptive:
+            from rowdy.adaptive import bedrock_pager
+            return self.build_adaptive_retriever(
+                bedrock_pager(self.retrieval_runtime, self.settings["KB_ID"]), number_of_results,
+            )
+        from langchain_aws import AmazonKnowledgeBasesRetriever
+        return AmazonKnowledgeBasesRetriever(
+            knowledge_base_id=self.settings["KB_ID"],
+            client=self.retrieval_runtime,
+            retrieval_config={"vectorSearchConfiguration": {"numberOfResults": number_of_results}},
+        )
+
+    # Adaptive depth - a small first page, more only when the scores are
+    # weak or flat; numberOfResults becomes the maximum
+    def build_adaptive_retriever(self, pager: Any, max_k: int) -> BaseRetriever:
+        from rowdy.adaptive import AdaptiveRetriever
+        return AdaptiveRetriever(
+            pager=pager,
+            initial_k=self.settings.int("ADAPTIVE_INITIAL_K", 4),
+            max_k=max_k,
+            drop_off=self.settings.float("ADAPTIVE_DROP_OFF", 0.1),
+            min_score=self.settings.float("ADAPTIVE_MIN_SCORE", 0.5),
+            max_latency=self.settings.float("ADAPTIVE_MAX_LATENCY_MS", 800) / 1000,
+            log_path=self.settings.get("ADAPTIVE_LOG_PATH"),
+        )
+
+    @resource
+    def local_index(self) -> Any:
+        from rowdy.local_index import LocalIndex
+        return LocalIndex(self.settings["LOCAL_INDEX_PATH"])
+
+    # Retrieval result cache - bump KB_GENERATION (or run
+    # `python -m rowdy.retrieval bump <RETRIEVAL_CACHE_PATH>`) after each sync
+    @resource
+    def retrieval_cache(self) -> RetrievalCache:
+        return RetrievalCache(
+            maxsize=self.settings.int("RETRIEVAL_CACHE_SIZE", 1024),
+            ttl=self.settings.float("RETRIEVAL_CACHE_TTL", 6 * 60 * 60),
+            path=self.settings.get("RETRIEVAL_CACHE_PATH"),
+            generation=str(self.settings.get("KB_GENERATION", "0")),
+            generation_ttl=self.settings.float("RETRIEVAL_CACHE_GENERATION_TTL", 1),
+        )
+
+    # Local reranking of the returned chunks - "bm25", "cross-encoder" or "none"
+    @resource
+    def reranker(self) -> Any:
+        from rowdy.rerank import BM25Reranker, CrossEncoderReranker
+        if self.settings.get("RERANKER", "none") == "cross-encoder":
+            return CrossEncoderReranker(
+                model_path=self.settings["CROSS_ENCODER_MODEL"],
+                tokenizer_path=self.settings["CROSS_ENCODER_TOKENIZER"],
+            )
+        return BM25Reranker(alpha=self.settings.float("BM25_ALPHA", 0.5))
+
+    @property
+    def speculative_mode(self) -> bool:
+        return self.settings.bool("SPECULATIVE_RETRIEVAL")
+
+    def build_retriever(self, number_of_results: Optional[int] = None, namespace: str = "full") -> BaseRetriever:
+        retriever = CachingRetriever(
+            retriever=self.build_base_retriever(number_of_results), cache=self.retrieval_cache, namespace=namespace,
+        )
+        if self.settings.get("RERANKER", "none") != "none":
+            from rowdy.rerank import RerankingRetriever
+            retriever = RerankingRetriever(
+                retriever=retriever,
+                reranker=self.reranker,
+                top_n=self.settings.int("RERANK_TOP_N", 4),
+                latency_budget=self.settings.float("RERANK_BUDGET_MS", 50) / 1000,
+            )
+        # Speculative retrieval - start the Retrieve call as soon as the user submits
+        if self.speculative_mode:
+            from rowdy.speculative import SpeculativeRetriever
+            retriever = SpeculativeRetriever(retriever=retriever, ttl=self.settings.float("SPECULATIVE_TTL", 60))
+        return retriever
+
+    @resource
+    def retriever(self) -> BaseRetriever:
+        return self.build_retriever()
+
+    # ------------------------------------------------------
+    # Chain
+
+    # Context packing - dedupe and budget the retrieved chunks before the prompt
+    @resource
+    def context_packer(self) -> ContextPacker:
+        return ContextPacker(
+            max_tokens=self.settings.int("CONTEXT_MAX_TOKENS", 1500),
+            min_score=self.settings.float("CONTEXT_MIN_SCORE", 0.0),
+            dedup_threshold=self.settings.float("CONTEXT_DEDUP_THRESHOLD", 0.8),
+        )
+
+    # Answer cache - shared by every session in this process. Off unless
+    # ANSWER_CACHE is set; ANSWER_CACHE_SEMANTIC adds one embedding call per
+    # miss to match rephrasings. Answers follow the retrieval cache's KB
+    # generation, so a bump after a sync invalidates them too.
+    @resource
+    def answer_cache(self) -> Optional[SemanticCache]:
+        if not self.settings.bool("ANSWER_CACHE"):
+            return None
+        embed = None
+        if self.settings.bool("ANSWER_CACHE_SEMANTIC"):
+            from langchain_aws import BedrockEmbeddings
+            embed = BedrockEmbeddings(client=self.bedrock_runtime, model_id=embedding_model_id).embed_query
+        retrieval_cache = self.retrieval_cache
+        return SemanticCache(
+            embed=embed,
+            threshold=self.settings.float("ANSWER_CACHE_THRESHOLD", 0.95),
+            maxsize=self.settings.int("ANSWER_CACHE_SIZE", 512),
+            ttl=self.settings.float("ANSWER_CACHE_TTL", 24 * 60 * 60),
+            generation=lambda: retrieval_cache.generation,
+        )
+
+    # Static system prefix first; PROMPT_CACHE adds cache markers where the
+    # backend takes them
+    @resource
+    def prompt(self) -> Runnable:
+        return build_prompt(
+            cache_markers=self.settings.bool("PROMPT_CACHE") and supports_cache_markers(self.settings.get("MODEL"), model_id),
+        )
+
+    # Query triage - canned answers, a small factoid path and the full chain
+    @resource
+    def triage(self) -> Any:
+        if not self.settings.bool("TRIAGE"):
+            return None
+        from rowdy.triage import QueryTriage
+        threshold = self.settings.float("TRIAGE_THRESHOLD", 0.6)
+        path = self.settings.get("TRIAGE_FAQ_PATH")
+        return QueryTriage.from_file(path, threshold=threshold) if path else QueryTriage(threshold=threshold)
+
+    @resource
+    def factoid_retriever(self) -> BaseRetriever:
+        return self.build_retriever(self.settings.int("TRIAGE_FACTOID_K", 3), namespace="factoid")
+
+    @resource
+    def factoid_model(self) -> BaseChatModel:
+        return self.build_model(max_tokens=self.settings.int("TRIAGE_FACTOID_MAX_TOKENS", 256))
+
+    # Follow-up condensation - "heuristic", "model" or "none"
+    @resource
+    def condenser(self) -> Any:
+        mode = self.settings.get("CONDENSE", "heuristic")
+        if mode == "none":
+            return None
+        from rowdy.condense import QueryCondenser
+        if mode not in ("heuristic", "model"):
+            raise ValueError(f"Unknown CONDENSE {mode!r}, expected none, heuristic or model")
+        return QueryCondenser(
+            model=self.build_model(max_tokens=self.settings.int("CONDENSE_MAX_TOKENS", 64)) if mode == "model" else None,
+            history_turns=self.settings.int("CONDENSE_HISTORY_TURNS", 2),
+            deadline=self.settings.float("CONDENSE_DEADLINE_MS", 400) / 1000,
+        )
+
+    # Single-flight coalescing of identical concurrent requests
+    @resource
+    def flights(self) -> Any:
+        if not self.settings.bool("COALESCE"):
+            return None
+        from rowdy.coalesce import SingleFlight
+        return SingleFlight(
+            buffer=self.settings.int("COALESCE_BUFFER", 64),
+            stall_timeout=self.settings.float("COALESCE_STALL_MS", 1000) / 1000,
+        )
+
+    @resource
+    def chain(self) -> Runnable:
+        retrieve = None
+        if self.condenser is not None:
+            from rowdy.condense import condensed_retrieval
+            retrieve = condensed_retrieval(self.retriever, self.condenser)
+        chain = build_chain(self.retriever, self.model, self.prompt, self.context_packer, retrieve)
+        if self.answer_cache is not None:
+            chain = with_semantic_cache(chain, self.answer_cache, namespace="full")
+        if self.triage is not None:
+            from rowdy.triage import with_triage
+            factoid = build_chain(self.factoid_retriever, self.factoid_model, self.prompt, self.context_packer)
+            if self.answer_cache is not None:
+                factoid = with_semantic_cache(factoid, self.answer_cache, namespace="factoid")
+            chain = with_triage(chain, factoid, self.triage)
+        if self.flights is not None:
+            from rowdy.coalesce import with_coalescing
+            chain = with_coalescing(chain, self.flights)
+        return chain
+
+    # Speculative retrieval for a question that is about to be asked, on
+    # the retriever its triage route will use and under the query the chain
+    # will look up. A follow-up on the full route is prefetched as its local
+    # standalone rewrite; with a model rewrite the query is not known yet,
+    # so follow-ups are not prefetched at all.
+    def prefetch(self, question: str, session_id: Optional[str] = None) -> None:
+        if not self.speculative_mode:
+            return
+        history = self.session_history(session_id).messages if session_id is not None else []
+        if self.triage is not None:
+            from rowdy.triage import CANNED, FACTOID
+            route = self.triage.classify(question, history).route
+            if route == CANNED:
+                return
+            if route == FACTOID:
+                self.factoid_retriever.prefetch(question)
+                return
+        query = question
+        if self.condenser is not None:
+            from rowdy.condense import needs_condensing
+            if needs_condensing(question, history):
+                if self.condenser.model is not None:
+                    return
+                query = self.condenser.rewrite_now(question, history, session_id or "")
+        self.retriever.prefetch(query)
+
+    # Async request path - one event loop per process with bounded concurrency
+    @property
+    def async_mode(self) -> bool:
+        return self.settings.bool("ASYNC_MODE")
+
+    @resource
+    def async_runner(self) -> AsyncRunner:
+        return AsyncRunner(
+            max_concurrency=self.settings.int("ASYNC_MAX_CONCURRENCY", 32),
+            executor_workers=self.settings.int("ASYNC_EXECUTOR_WORKERS", 16),
+        )
+
+    # Spans and metrics per stage of a turn - a no-op unless TELEMETRY is set
+    @resource
+    def telemetry(self) -> Any:
+        from rowdy.telemetry import build_telemetry
+        caches = {"retrieval": lambda: {"hits": self.retrieval_cache.hits, "misses": self.retrieval_cache.misses}}
+        if self.answer_cache is not None:
+            caches["answer"] = lambda: self.answer_cache.stats()
+        return build_telemetry(self.settings, caches=caches, admission=(lambda: self.admission.stats()) if self.settings.bool("ADMISSION") else None)
+
+    # Model slots for a backend: ADMISSION_{backend}_MAX_CONCURRENCY, or
+    # what its requests-per-minute quota sustains at ADMISSION_TURN_SECONDS
+    # per turn. ROUTER gets the slots of all its backends.
+    def admission_slots(self, backend: str) -> int:
+        from rowdy.admission import concurrency_for_quota
+        if backend == "ROUTER":
+            names = map(str.strip, self.settings.get("ROUTER_BACKENDS", "ANTHROPIC,OPENAI").split(","))
+            return sum(self.admission_slots(name) for name in names)
+        explicit = self.settings.get(f"ADMISSION_{backend}_MAX_CONCURRENCY")
+        if explicit is not None:
+            return int(explicit)
+        return concurrency_for_quota(
+            self.settings.float(f"ADMISSION_{backend}_RPM", ADMISSION_QUOTAS.get(backend, 100)),
+            self.settings.float("ADMISSION_TURN_SECONDS", 6),
+        )
+
+    # Per-client rate limits and a priority queue in front of the model
+    @resource
+    def admission(self) -> Any:
+        if not self.settings.bool("ADMISSION"):
+            return None
+        from rowdy.admission import AdmissionController
+        backend = self.settings["MODEL"]
+        return AdmissionController(
+            {backend: self.admission_slots(backend)},
+            rate=self.settings.float("ADMISSION_RATE", 0.5),
+            burst=self.settings.float("ADMISSION_BURST", 5),
+            queue_size=self.settings.int("ADMISSION_QUEUE_SIZE", 64),
+            sla=self.settings.float("ADMISSION_QUEUE_SLA_MS", 5000) / 1000,
+            bulk_sla=self.settings.float("ADMISSION_BULK_SLA_MS", 2000) / 1000,
+            bulk_threshold=self.settings.float("ADMISSION_BULK_TURNS", 20),
+            observe=lambda name, seconds: self.telemetry.observe("admission_wait_seconds", seconds, backend=name),
+        )
+
+    # Holds a model slot for one turn of `key` (a session id or client IP);
+    # raises rowdy.admission.Busy when turned away
+    def admit(self, key: str) -> Any:
+        if self.admission is None:
+            return contextlib.nullcontext()
+        return self.admission.admit(key, self.settings["MODEL"])
+
+    # Full text behind the compact citations kept with each answer
+    @resource
+    def chunk_store(self) -> Any:
+        from rowdy.citations import ChunkStore
+        return ChunkStore(
+            maxsize=self.settings.int("CHUNK_STORE_SIZE", 10000),
+            ttl=self.settings.float("CHUNK_STORE_TTL", 24 * 60 * 60),
+        )
+
+    # ------------------------------------------------------
+    # Per-session state
+
+    # Token-bounded window over a session's history - older turns are
+    # folded into a running summary that is stored with the session
+    def history_window(self, store: Any) -> WindowedChatMessageHistory:
+        summary_tokens = self.settings.int("HISTORY_SUMMARY_TOKENS", 300)
+        model = self.settings.get("MODEL")
+        count_tokens = token_counter(model)
+        return WindowedChatMessageHistory(
+            store,
+            max_tokens=self.settings.int("HISTORY_MAX_TOKENS", HISTORY_BUDGETS.get(model, 3000)),
+            max_turns=self.settings.int("HISTORY_MAX_TURNS", 6),
+            summarizer=(
+                model_summarizer(self.model, summary_tokens)
+                if self.settings.get("HISTORY_SUMMARIZER", "local") == "model"
+                else question_summarizer(summary_tokens, count_tokens)
+            ),
+            count_tokens=count_tokens,
+        )
+
+    # Session history store - "memory", "sqlite" or "redis"
+    @resource
+    def session_store(self) -> SessionStore:
+        ttl = self.settings.float("SESSION_TTL", 24 * 60 * 60)
+        match self.settings.get("SESSION_STORE", "memory"):
+            case "memory":
+                return MemorySessionStore(maxsize=self.settings.int("SESSION_CACHE_SIZE", 10000), ttl=ttl)
+            case "sqlite":
+                from rowdy.sessions import SQLiteSessionStore
+                return SQLiteSessionStore(self.settings.get("SESSION_DB_PATH", "sessions.db"), ttl=ttl)
+            case "redis":
+                from rowdy.sessions import RedisSessionStore
+                return RedisSessionStore.from_url(self.settings["REDIS_URL"], ttl=ttl)
+            case other:
+                raise ValueError(f"Unknown SESSION_STORE {other!r}, expected memory, sqlite or redis")
+
+    # Sessions in use by this process, with their window and summary. After
+    # SESSION_CACHE_TTL idle seconds a session (and its summary) is reloaded
+    # from the store.
+    @resource
+    def open_sessions(self) -> LRUCache:
+        return LRUCache(
+            maxsize=self.settings.int("SESSION_CACHE_SIZE", 10000),
+            ttl=self.settings.float("SESSION_CACHE_TTL", 5 * 60),
+        )
+
+    # Created under the lock, so concurrent requests for a session share one history
+    def session_history(self, session_id: str) -> WindowedChatMessageHistory:
+        history = self.open_sessions.get(session_id)
+        if history is not None:
+            self.open_sessions.set(session_id, history)
+            return history
+        with self._sessions_lock:
+            history = self.open_sessions.get(session_id)
+            if history is None:
+                history = self.history_window(StoredChatMessageHistory(
+                    self.session_store, session_id, window=self.settings.int("SESSION_LOAD_MESSAGES", 40),
+                ))
+            self.open_sessions.set(session_id, history)
+        return history
+
+    # Build everything the first request needs, so that cost is paid at
+    # startup instead of by the first user
+    def warm(self) -> "Resources":
+        self.chain
+        self.session_store
+        self.telemetry
+        if self.async_mode:
+            self.async_runner
+        return self
+
+
+def build_resources(settings: Mapping[str, Any]) -> Resources:
+    return Resources(settings).warm()
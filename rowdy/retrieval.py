@@ -0,0 +1,177 @@
+import argparse
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, List, Optional
+
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForRetrieverRun,
+    CallbackManagerForRetrieverRun,
+)
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.runnables.config import run_in_executor
+
+from rowdy.lru import LRUCache
+from rowdy.text import normalize_question
+
+# ------------------------------------------------------
+# Retrieval result cache
+#
+# The knowledge base returns the same documents for the same query until
+# it is re-synced, so results are cached per (namespace, retriever and its
+# depth, normalized query, generation). Bumping the generation after a data
+# source sync invalidates everything at once; other processes sharing the
+# SQLite tier see the bump within `generation_ttl` seconds.
+
+
+class RetrievalCache:
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = 6 * 60 * 60,
+                 path: Optional[str] = None, generation: str = "0", generation_ttl: float = 1.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self.path = path
+        self.generation_ttl = generation_ttl
+        self._clock = clock
+        self._generation = generation
+        self._counter = 0
+        self._stored: Optional[str] = None
+        self._stored_at = 0.0
+        self._memory = LRUCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS retrievals "
+                "(key TEXT PRIMARY KEY, generation TEXT, created REAL, documents TEXT)"
+            )
+            self._db.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def generation(self) -> str:
+        if self._db is None:
+            return f"{self._generation}.{self._counter}"
+        with self._lock:
+            if self._stored is None or self._clock() - self._stored_at >= self.generation_ttl:
+                self._read_generation()
+            return self._stored
+
+    def _read_generation(self) -> str:
+        row = self._db.execute("SELECT value FROM meta WHERE name = 'generation'").fetchone()
+        self._stored = f"{self._generation}.{row[0] if row else 0}"
+        self._stored_at = self._clock()
+        return self._stored
+
+    def bump_generation(self) -> str:
+        if self._db is None:
+            self._counter += 1
+        else:
+            with self._lock:
+                self._db.execute(
+                    "INSERT INTO meta VALUES ('generation', '1') ON CONFLICT(name) "
+                    "DO UPDATE SET value = CAST(value AS INTEGER) + 1"
+                )
+                self._db.execute("DELETE FROM retrievals WHERE generation != ?", (self._read_generation(),))
+        self._memory.clear()
+        return self.generation
+
+    def key(self, query: str, *scope: Any) -> str:
+        scope = [s.model_dump(exclude_none=True) if hasattr(s, "model_dump") else s for s in scope]
+        raw = json.dumps([normalize_question(query), *scope], sort_keys=True, default=str)
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[List[Document]]:
+        generation = self.generation
+        documents = self._memory.get((generation, key))
+        if documents is None and self._db is not None:
+            with self._lock:
+                row = self._db.execute(
+                    "SELECT created, documents FROM retrievals WHERE key = ? AND generation = ?",
+                    (key, generation),
+                ).fetchone()
+            if row and (self.ttl is None or row[0] + self.ttl >= time.time()):
+                documents = [Document(**doc) for doc in json.loads(row[1])]
+                self._memory.set((generation, key), documents)
+        if documents is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return documents
+
+    def set(self, key: str, documents: List[Document]) -> None:
+        generation = self.generation
+        self._memory.set((generation, key), documents)
+        if self._db is not None:
+            payload = json.dumps(
+                [{"page_content": d.page_content, "metadata": d.metadata} for d in documents],
+                default=str,
+            )
+            with self._lock:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO retrievals VALUES (?, ?, ?, ?)",
+                    (key, generation, time.time(), payload),
+                )
+
+
+# What makes two retrievers return different documents for one query: the
+# class, knowledge base, config, depth mode (fixed, or adaptive paging) and
+# depth settings (k, max_k and the adaptive cut-offs)
+def retriever_scope(retriever: BaseRetriever) -> List[Any]:
+    depth = "adaptive" if getattr(retriever, "pager", None) is not None else "fixed"
+    return [type(retriever).__name__, depth] + [
+        getattr(retriever, name, None)
+        for name in ("knowledge_base_id", "retrieval_config", "k", "initial_k", "max_k",
+                     "drop_off", "min_score", "max_latency")
+    ]
+
+
+# Retrievers sharing a cache need distinct namespaces, e.g. the full and
+# factoid paths
+class CachingRetriever(BaseRetriever):
+    retriever: BaseRetriever
+    cache: RetrievalCache
+    namespace: str = ""
+
+    def _key(self, query: str) -> str:
+        return self.cache.key(query, self.namespace, *retriever_scope(self.retriever))
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        key = self._key(query)
+        documents = self.cache.get(key)
+        if documents is None:
+            documents = self.retriever.invoke(query, {"callbacks": run_manager.get_child()})
+            self.cache.set(key, documents)
+        return documents
+
+    # The SQLite tier blocks, so cache access goes through the executor
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        key = self._key(query)
+        documents = await run_in_executor(None, self.cache.get, key)
+        if documents is None:
+            documents = await self.retriever.ainvoke(query, {"callbacks": run_manager.get_child()})
+            await run_in_executor(None, self.cache.set, key, documents)
+        return documents
+
+
+# Run after each knowledge base data source sync:
+#   python -m rowdy.retrieval bump retrieval_cache.db
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the on-disk retrieval cache.")
+    parser.add_argument("command", choices=["bump", "show"])
+    parser.add_argument("path", help="Path of the SQLite retrieval cache")
+    args = parser.parse_args()
+
+    cache = RetrievalCache(path=args.path)
+    if args.command == "bump":
+        cache.bump_generation()
+    print(f"Knowledge base generation: {cache.generation}")
@@ -0,0 +1,407 @@
+import asyncio
+import queue
+import threading
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+import numpy as np
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import PrivateAttr
+
+# ------------------------------------------------------
+# Model routing with hedged requests
+#
+# Holds several chat models (Bedrock Haiku, gpt-4o-mini) and sends each
+# call to the preferred healthy backend. If no token has arrived after
+# `hedge_after` seconds the same call is started on the next backend; the
+# first one to produce a token wins and the other is cancelled: its slot is
+# freed at once and its stream closed, which closes the HTTP response. A
+# thread blocked in a socket read cannot be interrupted, so a sync loser
+# still waiting for its first token is closed as soon as that read returns
+# and never holds a slot meanwhile. Backends
+# that fail in a row trip a circuit breaker and are skipped until
+# `reset_timeout` has passed; each backend also has a concurrency cap and
+# traffic spills over to the next one when it is full. Once a backend has
+# streamed tokens the answer is committed to it - errors after that are
+# raised as usual.
+
+_DONE = object()
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if self._clock() - self.opened_at >= self.reset_timeout else "open"
+
+    # Closed and half-open (probing after reset_timeout) backends take calls
+    def allow(self) -> bool:
+        return self.state != "open"
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold or self.opened_at is not None:
+                self.opened_at = self._clock()
+
+
+class Backend:
+    def __init__(self, name: str, model: BaseChatModel, max_concurrency: int = 16,
+                 breaker: Optional[CircuitBreaker] = None, window: int = 50):
+        self.name = name
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.slots = threading.BoundedSemaphore(max_concurrency)
+        self.breaker = breaker or CircuitBreaker()
+        self.ttfts: deque = deque(maxlen=window)
+        self.outcomes: deque = deque(maxlen=window)
+        self.in_flight = 0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> bool:
+        if not self.slots.acquire(blocking=False):
+            return False
+        with self._lock:
+            self.in_flight += 1
+        return True
+
+    def release(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+        self.slots.release()
+
+    def record(self, ttft: Optional[float] = None, error: bool = False) -> None:
+        with self._lock:
+            self.outcomes.append(error)
+            if ttft is not None:
+                self.ttfts.append(ttft)
+        if error:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+
+    @property
+    def ttft_p50(self) -> Optional[float]:
+        with self._lock:
+            return float(np.median(self.ttfts)) if self.ttfts else None
+
+    @property
+    def error_rate(self) -> float:
+        with self._lock:
+            return sum(self.outcomes) / len(self.outcomes) if self.outcomes else 0.0
+
+    # Expected latency: rolling median TTFT, penalized by the error rate
+    def score(self) -> Optional[float]:
+        p50 = self.ttft_p50
+        return None if p50 is None else p50 * (1 + 4 * self.error_rate)
+
+    def stats(self) -> Dict[str, Any]:
+        p50 = self.ttft_p50
+        return {
+            "state": self.breaker.state,
+            "in_flight": self.in_flight,
+            "ttft_p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "error_rate": round(self.error_rate, 3),
+        }
+
+
+class _Attempt:
+    def __init__(self, backend: Backend):
+        self.backend = backend
+        self.start = time.perf_counter()
+        self.first_token: Optional[float] = None
+        self.error: Optional[BaseException] = None
+        self.finished = False
+        self.released = False
+        self.cancelled = threading.Event()
+        # The model's stream generator (sync) or task (async)
+        self.stream: Any = None
+        self.chunks: Any = None
+        self.task: Any = None
+
+    def ttft(self) -> Optional[float]:
+        return None if self.first_token is None else self.first_token - self.start
+
+
+class RoutingChatModel(BaseChatModel):
+    backends: List[Any]
+    hedge_after: Optional[float] = 1.5
+    # Stay on the preferred backend unless another is this much faster
+    tolerance: float = 1.5
+    min_samples: int = 5
+
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+    _stats: Any = PrivateAttr(default_factory=lambda: {"calls": 0, "hedges": 0, "hedge_wins": 0, "failovers": 0})
+
+    @property
+    def _llm_type(self) -> str:
+        return "rowdy-router"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"backends": [b.name for b in self.backends]}
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats: Dict[str, Any] = dict(self._stats)
+        stats["backends"] = {b.name: b.stats() for b in self.backends}
+        return stats
+
+    def order(self) -> List[Backend]:
+        healthy = [b for b in self.backends if b.breaker.allow()]
+        # Every breaker open: try them anyway rather than fail outright
+        if not healthy:
+            return list(self.backends)
+        preferred = healthy[0]
+        scored = [b for b in healthy if b.score() is not None and len(b.ttfts) >= self.min_samples]
+        if preferred in scored:
+            fastest = min(scored, key=lambda b: b.score())
+            if preferred.score() > self.tolerance * fastest.score():
+                return [fastest] + [b for b in healthy if b is not fastest]
+        return healthy
+
+    def _next_backend(self, candidates: List[Backend]) -> Optional[Backend]:
+        # The first backend with a free slot; candidates are consumed
+        while candidates:
+            backend = candidates.pop(0)
+            if backend.acquire():
+                return backend
+        return None
+
+    def _release(self, attempt: _Attempt) -> None:
+        with self._lock:
+            if attempt.released:
+                return
+            attempt.released = True
+        attempt.backend.release()
+
+    def _cancel(self, attempt: _Attempt) -> None:
+        attempt.cancelled.set()
+        self._release(attempt)
+        if attempt.task is not None:
+            attempt.task.cancel()
+        elif attempt.stream is not None:
+            try:
+                attempt.stream.close()
+            except ValueError:
+                # Running in its thread - _run closes it when the call returns
+                pass
+
+    def _finish(self, attempts: List[_Attempt], winner: Optional[_Attempt]) -> None:
+        for attempt in attempts:
+            if attempt is not winner:
+                self._cancel(attempt)
+        if winner is not None and winner is not attempts[0]:
+            self._count("hedge_wins" if attempts[0].error is None else "failovers")
+
+    # Cancelled attempts say nothing about the backend's health
+    def _settle(self, attempt: _Attempt) -> None:
+        attempt.finished = True
+        self._release(attempt)
+        if attempt.cancelled.is_set():
+            return
+        if attempt.error is not None or attempt.first_token is None:
+            attempt.backend.record(error=attempt.error is not None)
+        else:
+            attempt.backend.record(attempt.ttft())
+
+    # ------------------------------------------------------
+    # Sync
+
+    def _run(self, attempt: _Attempt, notify: "queue.Queue[Any]", messages: List[BaseMessage],
+             stop: Optional[List[str]], kwargs: Dict[str, Any]) -> None:
+        try:
+            attempt.stream = attempt.backend.model.stream(messages, stop=stop, **kwargs)
+            for chunk in attempt.stream:
+                if attempt.cancelled.is_set():
+                    break
+                attempt.chunks.put(chunk)
+                if attempt.first_token is None and chunk.text:
+                    attempt.first_token = time.perf_counter()
+                    notify.put(attempt)
+        except Exception as e:
+            attempt.error = e
+        finally:
+            if attempt.stream is not None:
+                try:
+                    attempt.stream.close()
+                except ValueError:
+                    # Being closed by _cancel right now
+                    pass
+            self._settle(attempt)
+            attempt.chunks.put(_DONE)
+            notify.put(attempt)
+
+    def _launch(self, backend: Backend, notify: "queue.Queue[Any]", *args: Any) -> _Attempt:
+        attempt = _Attempt(backend)
+        attempt.chunks = queue.Queue()
+        threading.Thread(target=self._run, args=(attempt, notify) + args, daemon=True,
+                         name=f"rowdy-route-{backend.name}").start()
+        return attempt
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        self._count("calls")
+        candidates = self.order()
+        backend = self._next_backend(candidates)
+        if backend is None:
+            # Every backend is at its cap - wait for the preferred one
+            backend = self.order()[0]
+            backend.slots.acquire()
+            with backend._lock:
+                backend.in_flight += 1
+        notify: "queue.Queue[Any]" = queue.Queue()
+        args = (messages, stop, kwargs)
+        attempts = [self._launch(backend, notify, *args)]
+        deadline = time.perf_counter() + self.hedge_after if self.hedge_after is not None else None
+
+        winner: Optional[_Attempt] = None
+        try:
+            while winner is None:
+                timeout = max(0.0, deadline - time.perf_counter()) if deadline is not None and candidates else None
+                try:
+                    attempt = notify.get(timeout=timeout)
+                except queue.Empty:
+                    backend = self._next_backend(candidates)
+                    if backend is not None:
+                        self._count("hedges")
+                        attempts.append(self._launch(backend, notify, *args))
+                    deadline = None
+                    continue
+                if attempt.first_token is not None and attempt.error is None:
+                    winner = attempt
+                elif attempt.finished and attempt.error is None:
+                    # Finished without any text - nothing better will come
+                    winner = attempt
+                elif all(a.finished for a in attempts):
+                    backend = self._next_backend(candidates)
+                    if backend is None:
+                        raise attempt.error
+                    attempts.append(self._launch(backend, notify, *args))
+        finally:
+            self._finish(attempts, winner)
+
+        try:
+            while True:
+                chunk = winner.chunks.get()
+                if chunk is _DONE:
+                    break
+                if run_manager and chunk.text:
+                    run_manager.on_llm_new_token(chunk.text, chunk=ChatGenerationChunk(message=chunk))
+                yield ChatGenerationChunk(message=chunk)
+        finally:
+            # The caller stopped reading - stop the stream too
+            if not winner.finished:
+                self._cancel(winner)
+        if winner.error is not None:
+            raise winner.error
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        text = "".join(chunk.text for chunk in self._stream(messages, stop, run_manager, **kwargs))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    # ------------------------------------------------------
+    # Async - same protocol with tasks instead of threads
+
+    async def _arun(self, attempt: _Attempt, notify: "asyncio.Queue[Any]", messages: List[BaseMessage],
+                    stop: Optional[List[str]], kwargs: Dict[str, Any]) -> None:
+        try:
+            async for chunk in attempt.backend.model.astream(messages, stop=stop, **kwargs):
+                await attempt.chunks.put(chunk)
+                if attempt.first_token is None and chunk.text:
+                    attempt.first_token = time.perf_counter()
+                    notify.put_nowait(attempt)
+        except asyncio.CancelledError:
+            attempt.cancelled.set()
+            raise
+        except Exception as e:
+            attempt.error = e
+        finally:
+            self._settle(attempt)
+            attempt.chunks.put_nowait(_DONE)
+            notify.put_nowait(attempt)
+
+    def _alaunch(self, backend: Backend, notify: "asyncio.Queue[Any]", *args: Any) -> _Attempt:
+        attempt = _Attempt(backend)
+        attempt.chunks = asyncio.Queue()
+        attempt.task = asyncio.ensure_future(self._arun(attempt, notify, *args))
+        return attempt
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+                       **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        self._count("calls")
+        candidates = self.order()
+        backend = self._next_backend(candidates)
+        if backend is None:
+            backend = self.order()[0]
+            await asyncio.get_running_loop().run_in_executor(None, backend.slots.acquire)
+            with backend._lock:
+                backend.in_flight += 1
+        notify: "asyncio.Queue[Any]" = asyncio.Queue()
+        args = (messages, stop, kwargs)
+        attempts = [self._alaunch(backend, notify, *args)]
+        deadline = time.perf_counter() + self.hedge_after if self.hedge_after is not None else None
+
+        winner: Optional[_Attempt] = None
+        try:
+            while winner is None:
+                timeout = max(0.0, deadline - time.perf_counter()) if deadline is not None and candidates else None
+                try:
+                    attempt = await asyncio.wait_for(notify.get(), timeout)
+                except asyncio.TimeoutError:
+                    backend = self._next_backend(candidates)
+                    if backend is not None:
+                        self._count("hedges")
+                        attempts.append(self._alaunch(backend, notify, *args))
+                    deadline = None
+                    continue
+                if attempt.first_token is not None and attempt.error is None:
+                    winner = attempt
+                elif attempt.finished and attempt.error is None:
+                    winner = attempt
+                elif all(a.finished for a in attempts):
+                    backend = self._next_backend(candidates)
+                    if backend is None:
+                        raise attempt.error
+                    attempts.append(self._alaunch(backend, notify, *args))
+        finally:
+            self._finish(attempts, winner)
+
+        try:
+            while True:
+                chunk = await winner.chunks.get()
+                if chunk is _DONE:
+                    break
+                if run_manager and chunk.text:
+                    await run_manager.on_llm_new_token(chunk.text, chunk=ChatGenerationChunk(message=chunk))
+                yield ChatGenerationChunk(message=chunk)
+        finally:
+            if not winner.finished:
+                winner.task.cancel()
+        if winner.error is not None:
+            raise winner.error
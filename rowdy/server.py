@@ -0,0 +1,202 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import math
+import os
+import secrets
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Sequence
+
+from fastapi import FastAPI, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.documents import Document
+from langchain_core.runnables import Runnable
+from langchain_core.runnables.history import RunnableWithMessageHistory
+from pydantic import BaseModel
+
+from rowdy.admission import AdmissionController, Busy, Ticket
+from rowdy.citations import compact_citations
+from rowdy.resources import Resources, Settings
+from rowdy.sessions import MemorySessionStore, StoredChatMessageHistory
+
+# ------------------------------------------------------
+# Headless API
+#
+# ASGI service around the same chain as the Streamlit app, for embedding
+# Rowdy in other sites:
+#   POST /chat    {"question", "session_id"?} -> text/event-stream of
+#                 session, citations, token... and done (or error) events;
+#                 429 with Retry-After when admission control turns it away
+#                 and 403 for a session id this server did not issue
+#   GET  /healthz liveness
+#   GET  /readyz  200 once the clients, retriever, model and chain are built
+#   GET  /metrics Prometheus metrics, if telemetry is enabled
+#
+#   $ uvicorn --factory rowdy.server:create_app
+#
+# Settings are read from the environment (same names as secrets.toml).
+# Session ids are issued by the server and signed with API_SESSION_SECRET,
+# so a client can only continue the sessions it was given.
+
+
+class ChatRequest(BaseModel):
+    question: str
+    session_id: Optional[str] = None
+
+
+def sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def citations(documents: Sequence[Document]) -> List[Dict[str, Any]]:
+    return [c._asdict() for c in compact_citations(documents)]
+
+
+# "<id>.<signature>" - the whole token is the session id
+def issue_session(secret: bytes) -> str:
+    session_id = uuid.uuid4().hex
+    return f"{session_id}.{hmac.new(secret, session_id.encode(), hashlib.sha256).hexdigest()}"
+
+
+def valid_session(secret: bytes, token: str) -> bool:
+    session_id, _, signature = token.partition(".")
+    expected = hmac.new(secret, session_id.encode(), hashlib.sha256).hexdigest()
+    return hmac.compare_digest(signature, expected)
+
+
+def create_app(resources: Optional[Resources] = None, chain: Optional[Runnable] = None,
+               get_session_history: Optional[Callable[[str], BaseChatMessageHistory]] = None,
+               admission: Optional[AdmissionController] = None) -> FastAPI:
+    if resources is None and chain is None:
+        resources = Resources(Settings(os.environ))
+    settings = resources.settings if resources is not None else Settings({})
+
+    # Per-session history - see rowdy/sessions.py
+    if get_session_history is None:
+        if resources is not None:
+            get_session_history = resources.session_history
+        else:
+            store = MemorySessionStore()
+            get_session_history = lambda session_id: StoredChatMessageHistory(store, session_id)
+
+    telemetry = resources.telemetry if resources is not None else None
+    if admission is None and resources is not None:
+        admission = resources.admission
+    backend = settings.get("MODEL", "")
+    # Rate limits are per client IP; behind a load balancer, name the header
+    # holding it (e.g. X-Forwarded-For)
+    client_header = settings.get("ADMISSION_CLIENT_HEADER")
+    # Without a configured secret, session ids only hold for this process
+    session_secret = settings.get("API_SESSION_SECRET")
+    session_secret = session_secret.encode() if session_secret else secrets.token_bytes(32)
+    state: Dict[str, Any] = {"ready": False, "active": 0, "chain": None}
+    semaphore = asyncio.Semaphore(settings.int("API_MAX_CONCURRENCY", 64))
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+        # boto3 calls run in the loop's default executor - keep it bounded
+        asyncio.get_running_loop().set_default_executor(
+            ThreadPoolExecutor(max_workers=settings.int("ASYNC_EXECUTOR_WORKERS", 16), thread_name_prefix="rowdy-io")
+        )
+        runnable = chain
+        if runnable is None:
+            runnable = await run_in_threadpool(lambda: resources.warm().chain)
+        state["chain"] = RunnableWithMessageHistory(
+            runnable,
+            get_session_history,
+            input_messages_key="question",
+            history_messages_key="history",
+            output_messages_key="response",
+        )
+        state["ready"] = True
+        yield
+        state["ready"] = False
+
+    app = FastAPI(title="RowdyLLM", lifespan=lifespan)
+    app.state.get_session_history = get_session_history
+    origins = [o.strip() for o in settings.get("API_CORS_ORIGINS", "").split(",") if o.strip()]
+    if origins:
+        app.add_middleware(CORSMiddleware, allow_origins=origins, allow_methods=["GET", "POST"], allow_headers=["*"])
+
+    @app.get("/healthz")
+    async def healthz() -> Dict[str, str]:
+        return {"status": "ok"}
+
+    @app.get("/readyz")
+    async def readyz() -> JSONResponse:
+        return JSONResponse(
+            {"ready": state["ready"], "active": state["active"]},
+            status_code=200 if state["ready"] else 503,
+        )
+
+    # Prometheus metrics when telemetry is enabled (TELEMETRY setting)
+    if telemetry is not None and telemetry.registry is not None:
+        from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
+        @app.get("/metrics")
+        async def metrics() -> Response:
+            return Response(generate_latest(telemetry.registry), media_type=CONTENT_TYPE_LATEST)
+
+    def client_key(http: Request) -> str:
+        forwarded = http.headers.get(client_header) if client_header else None
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+        return http.client.host if http.client else "unknown"
+
+    async def answer(request: ChatRequest, session_id: str, ticket: Optional[Ticket]) -> AsyncIterator[str]:
+        config = {"configurable": {"session_id": session_id}}
+        if telemetry is not None:
+            config["callbacks"] = telemetry.callbacks()
+        yield sse("session", {"session_id": session_id})
+        async with semaphore:
+            state["active"] += 1
+            try:
+                async for chunk in state["chain"].astream({"question": request.question}, config):
+                    if "response" in chunk:
+                        yield sse("token", {"text": chunk["response"]})
+                    if "context" in chunk:
+                        yield sse("citations", citations(chunk["context"]))
+            except Exception as e:
+                yield sse("error", {"detail": type(e).__name__})
+                return
+            finally:
+                state["active"] -= 1
+                if ticket is not None:
+                    admission.release(ticket)
+        yield sse("done", {})
+
+    @app.post("/chat")
+    async def chat(request: ChatRequest, http: Request) -> StreamingResponse:
+        if not state["ready"]:
+            return JSONResponse({"detail": "not ready"}, status_code=503)
+        if request.session_id is not None and not valid_session(session_secret, request.session_id):
+            return JSONResponse({"detail": "unknown session"}, status_code=403)
+        ticket = None
+        if admission is not None:
+            try:
+                ticket = await admission.aacquire(client_key(http), backend)
+            except Busy as e:
+                return JSONResponse({"detail": "busy", "reason": e.reason}, status_code=429,
+                                    headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))})
+        session_id = request.session_id or issue_session(session_secret)
+        return StreamingResponse(
+            answer(request, session_id, ticket),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+            # Frees the slot even if the client left before the stream ran
+            background=BackgroundTask(admission.release, ticket) if ticket is not None else None,
+        )
+
+    return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(create_app(), host=os.environ.get("HOST", "0.0.0.0"), port=int(os.environ.get("PORT", 8000)))
@@ -0,0 +1,284 @@
+import json
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import BaseMessage, message_to_dict, messages_from_dict
+
+from rowdy.lru import LRUCache
+
+# ------------------------------------------------------
+# Session history stores
+#
+# Chat history keyed by session id, outside of any one process. Stores
+# are append-only: a turn (question + answer) is written in one batch,
+# and only the most recent `limit` messages are read back, so a turn
+# costs the same however long the conversation is. Sessions that see no
+# new turns for `ttl` seconds expire. Each session also keeps the running
+# summary of the turns that left the history window (rowdy/history.py),
+# so any process can pick the session up where another left it.
+#   memory  in-process LRU (the default, lost on restart)
+#   sqlite  one WAL-mode database file shared by the processes on a host
+#   redis   one list per session, for running several hosts
+
+
+def _dumps(message: BaseMessage) -> str:
+    return json.dumps(message_to_dict(message))
+
+
+def _loads(rows: Sequence[Any]) -> List[BaseMessage]:
+    return messages_from_dict([json.loads(row) for row in rows])
+
+
+class SessionStore(ABC):
+    @abstractmethod
+    def load(self, session_id: str, limit: Optional[int] = None) -> List[BaseMessage]:
+        ...
+
+    # Messages in the session, whether or not they were loaded
+    @abstractmethod
+    def length(self, session_id: str) -> int:
+        ...
+
+    @abstractmethod
+    def append(self, session_id: str, messages: Sequence[BaseMessage]) -> None:
+        ...
+
+    @abstractmethod
+    def clear(self, session_id: str) -> None:
+        ...
+
+    # (summary, number of messages folded into it) or None
+    @abstractmethod
+    def load_summary(self, session_id: str) -> Optional[Tuple[str, int]]:
+        ...
+
+    @abstractmethod
+    def save_summary(self, session_id: str, summary: str, summarized: int) -> None:
+        ...
+
+
+class MemorySessionStore(SessionStore):
+    def __init__(self, maxsize: int = 10000, ttl: Optional[float] = 24 * 60 * 60):
+        self._sessions = LRUCache(maxsize=maxsize, ttl=ttl)
+        self._summaries = LRUCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+
+    def load(self, session_id: str, limit: Optional[int] = None) -> List[BaseMessage]:
+        messages = self._sessions.get(session_id) or []
+        return list(messages[-limit:] if limit else messages)
+
+    def length(self, session_id: str) -> int:
+        return len(self._sessions.get(session_id) or [])
+
+    def append(self, session_id: str, messages: Sequence[BaseMessage]) -> None:
+        with self._lock:
+            stored = self._sessions.get(session_id) or []
+            stored.extend(messages)
+            self._sessions.set(session_id, stored)
+
+    def clear(self, session_id: str) -> None:
+        self._sessions.pop(session_id)
+        self._summaries.pop(session_id)
+
+    def load_summary(self, session_id: str) -> Optional[Tuple[str, int]]:
+        return self._summaries.get(session_id)
+
+    def save_summary(self, session_id: str, summary: str, summarized: int) -> None:
+        self._summaries.set(session_id, (summary, summarized))
+
+
+class SQLiteSessionStore(SessionStore):
+    def __init__(self, path: str, ttl: Optional[float] = 24 * 60 * 60,
+                 clock: Callable[[], float] = time.time):
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._swept = clock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS sessions (session_id TEXT PRIMARY KEY, updated REAL)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS session_messages "
+            "(id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT NOT NULL, message TEXT)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS session_messages_by_session ON session_messages (session_id, id)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS session_summaries "
+            "(session_id TEXT PRIMARY KEY, summary TEXT, summarized INTEGER)"
+        )
+
+    def _expired(self, updated: float) -> bool:
+        return self.ttl is not None and updated < self._clock() - self.ttl
+
+    def load(self, session_id: str, limit: Optional[int] = None) -> List[BaseMessage]:
+        with self._lock:
+            row = self._db.execute("SELECT updated FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+            if row is None:
+                return []
+            if self._expired(row[0]):
+                self._delete(session_id)
+                return []
+            rows = self._db.execute(
+                "SELECT message FROM session_messages WHERE session_id = ? ORDER BY id DESC LIMIT ?",
+                (session_id, limit or -1),
+            ).fetchall()
+        return _loads([r[0] for r in reversed(rows)])
+
+    def length(self, session_id: str) -> int:
+        with self._lock:
+            row = self._db.execute("SELECT updated FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+            if row is None or self._expired(row[0]):
+                return 0
+            return self._db.execute(
+                "SELECT COUNT(*) FROM session_messages WHERE session_id = ?", (session_id,)
+            ).fetchone()[0]
+
+    def append(self, session_id: str, messages: Sequence[BaseMessage]) -> None:
+        rows = [(session_id, _dumps(m)) for m in messages]
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                self._db.executemany("INSERT INTO session_messages (session_id, message) VALUES (?, ?)", rows)
+                self._db.execute(
+                    "INSERT INTO sessions VALUES (?, ?) ON CONFLICT (session_id) DO UPDATE SET updated = excluded.updated",
+                    (session_id, self._clock()),
+                )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            # Sweep idle sessions now and then rather than on every write
+            if self.ttl is not None and self._clock() - self._swept > min(self.ttl, 60 * 60):
+                self._sweep()
+
+    def _delete(self, session_id: str) -> None:
+        self._db.execute("DELETE FROM session_messages WHERE session_id = ?", (session_id,))
+        self._db.execute("DELETE FROM session_summaries WHERE session_id = ?", (session_id,))
+        self._db.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def _sweep(self) -> None:
+        self._swept = self._clock()
+        cutoff = self._swept - self.ttl
+        for table in ("session_messages", "session_summaries"):
+            self._db.execute(
+                f"DELETE FROM {table} WHERE session_id IN (SELECT session_id FROM sessions WHERE updated < ?)",
+                (cutoff,),
+            )
+        self._db.execute("DELETE FROM sessions WHERE updated < ?", (cutoff,))
+
+    def expire(self) -> None:
+        if self.ttl is not None:
+            with self._lock:
+                self._sweep()
+
+    def clear(self, session_id: str) -> None:
+        with self._lock:
+            self._delete(session_id)
+
+    def load_summary(self, session_id: str) -> Optional[Tuple[str, int]]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT summary, summarized, updated FROM session_summaries JOIN sessions USING (session_id) "
+                "WHERE session_id = ?", (session_id,),
+            ).fetchone()
+        if row is None or self._expired(row[2]):
+            return None
+        return row[0], row[1]
+
+    def save_summary(self, session_id: str, summary: str, summarized: int) -> None:
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO session_summaries VALUES (?, ?, ?)", (session_id, summary, summarized),
+            )
+
+
+class RedisSessionStore(SessionStore):
+    def __init__(self, client: Any, ttl: Optional[float] = 24 * 60 * 60, prefix: str = "rowdy:session:"):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs: Any) -> "RedisSessionStore":
+        try:
+            import redis
+        except ImportError as e:
+            raise ImportError("The redis session store needs `pip install redis`") from e
+        return cls(redis.Redis.from_url(url), **kwargs)
+
+    def load(self, session_id: str, limit: Optional[int] = None) -> List[BaseMessage]:
+        return _loads(self.client.lrange(self.prefix + session_id, -limit if limit else 0, -1))
+
+    def length(self, session_id: str) -> int:
+        return self.client.llen(self.prefix + session_id)
+
+    def append(self, session_id: str, messages: Sequence[BaseMessage]) -> None:
+        key = self.prefix + session_id
+        pipe = self.client.pipeline(transaction=False)
+        pipe.rpush(key, *[_dumps(m) for m in messages])
+        if self.ttl is not None:
+            pipe.expire(key, int(self.ttl))
+            pipe.expire(key + ":summary", int(self.ttl))
+        pipe.execute()
+
+    def clear(self, session_id: str) -> None:
+        self.client.delete(self.prefix + session_id, self.prefix + session_id + ":summary")
+
+    def load_summary(self, session_id: str) -> Optional[Tuple[str, int]]:
+        value = self.client.get(self.prefix + session_id + ":summary")
+        if value is None:
+            return None
+        summary, summarized = json.loads(value)
+        return summary, summarized
+
+    def save_summary(self, session_id: str, summary: str, summarized: int) -> None:
+        self.client.set(self.prefix + session_id + ":summary", json.dumps([summary, summarized]),
+                        ex=int(self.ttl) if self.ttl is not None else None)
+
+
+# History of one session over a store. The recent window is read on first
+# use; each add_messages call (one per turn) is a single append. At most
+# `window` messages are kept in memory; `offset` is the position of the
+# first of them in the whole session.
+class StoredChatMessageHistory(BaseChatMessageHistory):
+    def __init__(self, store: SessionStore, session_id: str, window: Optional[int] = 40):
+        self.store = store
+        self.session_id = session_id
+        self.window = window
+        self.offset = 0
+        self._messages: Optional[List[BaseMessage]] = None
+
+    @property
+    def messages(self) -> List[BaseMessage]:
+        if self._messages is None:
+            self._messages = self.store.load(self.session_id, self.window)
+            self.offset = max(0, self.store.length(self.session_id) - len(self._messages))
+        return self._messages
+
+    def add_messages(self, messages: Sequence[BaseMessage]) -> None:
+        messages = list(messages)
+        if not messages:
+            return
+        self.store.append(self.session_id, messages)
+        if self._messages is not None:
+            self._messages.extend(messages)
+            excess = len(self._messages) - self.window if self.window else 0
+            if excess > 0:
+                del self._messages[:excess]
+                self.offset += excess
+
+    def clear(self) -> None:
+        self.store.clear(self.session_id)
+        self._messages = []
+        self.offset = 0
+
+    def load_summary(self) -> Optional[Tuple[str, int]]:
+        return self.store.load_summary(self.session_id)
+
+    def save_summary(self, summary: str, summarized: int) -> None:
+        self.store.save_summary(self.session_id, summary, summarized)
@@ -0,0 +1,76 @@
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, List, Optional
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from pydantic import PrivateAttr
+
+from rowdy.lru import LRUCache
+from rowdy.text import normalize_question
+
+# ------------------------------------------------------
+# Speculative retrieval
+#
+# prefetch() starts the knowledge base call in the background as soon as
+# a query is known - before the chat history is loaded and the prompt
+# is built. When the chain later asks for the same (normalized) query it
+# picks up the in-flight result; anything else runs as usual and stale
+# prefetches simply expire.
+
+
+class SpeculativeRetriever(BaseRetriever):
+    retriever: BaseRetriever
+    ttl: float = 60.0
+    max_workers: int = 8
+
+    _pending: Any = PrivateAttr()
+    _executor: Any = PrivateAttr()
+    _lock: Any = PrivateAttr()
+    _stats: Any = PrivateAttr()
+
+    def model_post_init(self, __context: Any) -> None:
+        self._pending = LRUCache(maxsize=256, ttl=self.ttl)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="rowdy-prefetch")
+        self._lock = threading.Lock()
+        self._stats = {"prefetched": 0, "used": 0, "failed": 0}
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["pending"] = len(self._pending)
+        return stats
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+    def prefetch(self, query: str) -> Future:
+        key = normalize_question(query)
+        future = self._pending.get(key)
+        if future is None:
+            future = self._executor.submit(self.retriever.invoke, query)
+            self._pending.set(key, future)
+            self._count("prefetched")
+        return future
+
+    def _take(self, query: str) -> Optional[List[Document]]:
+        future = self._pending.pop(normalize_question(query))
+        if future is None:
+            return None
+        try:
+            documents = future.result()
+        except Exception:
+            self._count("failed")
+            return None
+        self._count("used")
+        return documents
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        documents = self._take(query)
+        if documents is None:
+            documents = self.retriever.invoke(query, {"callbacks": run_manager.get_child()})
+        return documents
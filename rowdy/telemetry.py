@@ -0,0 +1,375 @@
+import contextlib
+import json
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Mapping, Optional, Sequence
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.documents import Document
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import LLMResult
+
+from rowdy.text import estimate_tokens
+
+# ------------------------------------------------------
+# Per-stage latency and token instrumentation
+#
+# A callback handler, added to the chain config for each turn, turns the
+# LangChain run events into OpenTelemetry spans (chat_turn > retrieval,
+# model) and Prometheus metrics:
+#   rowdy_stage_seconds{stage}            retrieval, model, render, turn, ...
+#   rowdy_retrieval_documents             documents per Retrieve call
+#   rowdy_prompt_tokens                   prompt size sent to the model
+#   rowdy_ttft_seconds                    time to first token
+#   rowdy_output_tokens_per_second        streaming rate after the first token
+#   rowdy_cache_{hits,misses}_total{cache} read from the caches at scrape time
+#   rowdy_admission_wait_seconds{backend} time queued for a model slot
+#   rowdy_admission_{queued,active}{backend}, rowdy_admission_rejected_total{reason}
+#                                         read from admission control at scrape time
+# stage() times anything else (e.g. rendering). opentelemetry-sdk and
+# prometheus_client are optional; with TELEMETRY unset the no-op version
+# is used and nothing is added to the chain.
+
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+# Span exporter writing one JSON object per finished span, for offline analysis
+class JsonLinesSpanExporter:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, spans: Sequence[Any]) -> Any:
+        from opentelemetry.sdk.trace.export import SpanExportResult
+        lines = [json.dumps({
+            "name": span.name,
+            "trace_id": format(span.context.trace_id, "032x"),
+            "span_id": format(span.context.span_id, "016x"),
+            "parent_id": format(span.parent.span_id, "016x") if span.parent else None,
+            "start": span.start_time / 1e9,
+            "duration_ms": (span.end_time - span.start_time) / 1e6,
+            "status": span.status.status_code.name,
+            "attributes": dict(span.attributes or {}),
+        }) for span in spans]
+        with self._lock, open(self.path, "a") as f:
+            f.write("".join(line + "\n" for line in lines))
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self) -> None:
+        pass
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return True
+
+
+class _Metrics:
+    def __init__(self, registry: Any):
+        from prometheus_client import Histogram
+        self.registry = registry
+        self.stage_seconds = Histogram("rowdy_stage_seconds", "Time spent per stage of a chat turn", ["stage"],
+                                       buckets=STAGE_BUCKETS, registry=registry)
+        self.retrieval_documents = Histogram("rowdy_retrieval_documents", "Documents returned per retrieval",
+                                             buckets=(0, 1, 2, 4, 8, 12, 16, 24, 32, 64), registry=registry)
+        self.prompt_tokens = Histogram("rowdy_prompt_tokens", "Estimated prompt tokens per model call", ["model"],
+                                       buckets=(250, 500, 1000, 2000, 4000, 8000, 16000), registry=registry)
+        self.ttft_seconds = Histogram("rowdy_ttft_seconds", "Time to first token", ["model"],
+                                      buckets=STAGE_BUCKETS, registry=registry)
+        self.tokens_per_second = Histogram("rowdy_output_tokens_per_second", "Output tokens per second", ["model"],
+                                           buckets=(5, 10, 20, 40, 60, 80, 120, 160, 240), registry=registry)
+        self.admission_wait_seconds = Histogram("rowdy_admission_wait_seconds", "Time queued for a model slot",
+                                                ["backend"], buckets=STAGE_BUCKETS, registry=registry)
+
+
+class _CacheCollector:
+    def __init__(self, caches: Mapping[str, Callable[[], Mapping[str, Any]]]):
+        self.caches = caches
+
+    def collect(self) -> Iterator[Any]:
+        from prometheus_client.core import CounterMetricFamily
+        hits = CounterMetricFamily("rowdy_cache_hits", "Cache hits", labels=["cache"])
+        misses = CounterMetricFamily("rowdy_cache_misses", "Cache misses", labels=["cache"])
+        for name, stats in self.caches.items():
+            try:
+                values = stats()
+            except Exception:
+                continue
+            hits.add_metric([name], values.get("hits", 0))
+            misses.add_metric([name], values.get("misses", 0))
+        yield hits
+        yield misses
+
+
+class _AdmissionCollector:
+    def __init__(self, stats: Callable[[], Mapping[str, Any]]):
+        self.stats = stats
+
+    def collect(self) -> Iterator[Any]:
+        from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+        try:
+            values = self.stats()
+        except Exception:
+            return
+        queued = GaugeMetricFamily("rowdy_admission_queued", "Turns waiting for a model slot", labels=["backend"])
+        active = GaugeMetricFamily("rowdy_admission_active", "Turns holding a model slot", labels=["backend"])
+        for name, backend in values.get("backends", {}).items():
+            queued.add_metric([name], backend["queued"])
+            active.add_metric([name], backend["active"])
+        rejected = CounterMetricFamily("rowdy_admission_rejected", "Turns turned away", labels=["reason"])
+        for reason in ("rate_limited", "queue_full", "overloaded", "queue_timeout"):
+            rejected.add_metric([reason], values.get(reason, 0))
+        yield queued
+        yield active
+        yield rejected
+
+
+class _Run:
+    __slots__ = ("span", "kind", "start", "first_token", "tokens", "model")
+
+    def __init__(self, span: Any, kind: str, model: str = ""):
+        self.span = span
+        self.kind = kind
+        self.start = time.perf_counter()
+        self.first_token: Optional[float] = None
+        self.tokens = 0
+        self.model = model
+
+
+class TelemetryCallbackHandler(BaseCallbackHandler):
+    # Cheap and thread-safe, so async runs call it inline instead of in an executor
+    run_inline = True
+
+    def __init__(self, telemetry: "Telemetry"):
+        self.telemetry = telemetry
+        self._parents: Dict[UUID, Optional[UUID]] = {}
+        self._runs: Dict[UUID, _Run] = {}
+        self._lock = threading.Lock()
+
+    def _root(self, run_id: UUID) -> UUID:
+        with self._lock:
+            while self._parents.get(run_id) is not None:
+                run_id = self._parents[run_id]
+        return run_id
+
+    def _start(self, kind: str, run_id: UUID, parent_run_id: Optional[UUID], model: str = "",
+               **attributes: Any) -> None:
+        with self._lock:
+            self._parents[run_id] = parent_run_id
+        root = self._runs.get(self._root(run_id)) if parent_run_id is not None else None
+        span = self.telemetry.start_span(kind, root.span if root else None, attributes)
+        self._runs[run_id] = _Run(span, kind, model)
+
+    def _end(self, run_id: UUID, stage: Optional[str], error: Optional[BaseException] = None,
+             **attributes: Any) -> Optional[_Run]:
+        run = self._runs.pop(run_id, None)
+        with self._lock:
+            self._parents.pop(run_id, None)
+        if run is None:
+            return None
+        seconds = time.perf_counter() - run.start
+        if stage:
+            self.telemetry.observe_stage(stage, seconds)
+        self.telemetry.end_span(run.span, error, attributes)
+        return run
+
+    # The outermost run of each turn becomes the chat_turn span
+    def on_chain_start(self, serialized: Dict[str, Any], inputs: Any, *, run_id: UUID,
+                       parent_run_id: Optional[UUID] = None, **kwargs: Any) -> None:
+        if parent_run_id is None:
+            self._start("chat_turn", run_id, None)
+        else:
+            with self._lock:
+                self._parents[run_id] = parent_run_id
+
+    def on_chain_end(self, outputs: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        if run_id in self._runs:
+            self._end(run_id, "turn")
+        else:
+            with self._lock:
+                self._parents.pop(run_id, None)
+
+    def on_chain_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        if run_id in self._runs:
+            self._end(run_id, "turn", error)
+        else:
+            with self._lock:
+                self._parents.pop(run_id, None)
+
+    def on_retriever_start(self, serialized: Dict[str, Any], query: str, *, run_id: UUID,
+                           parent_run_id: Optional[UUID] = None, **kwargs: Any) -> None:
+        # Only the outermost retriever of a stack (cache > rerank > KB) is timed
+        parent = self._runs.get(parent_run_id) if parent_run_id is not None else None
+        if parent is not None and parent.kind == "retrieval":
+            with self._lock:
+                self._parents[run_id] = parent_run_id
+            return
+        self._start("retrieval", run_id, parent_run_id, query_chars=len(query))
+
+    def on_retriever_end(self, documents: Sequence[Document], *, run_id: UUID, **kwargs: Any) -> None:
+        if run_id not in self._runs:
+            with self._lock:
+                self._parents.pop(run_id, None)
+            return
+        self.telemetry.observe("retrieval_documents", len(documents))
+        self._end(run_id, "retrieval", documents=len(documents))
+
+    def on_retriever_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id, "retrieval", error)
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[BaseMessage]], *,
+                            run_id: UUID, parent_run_id: Optional[UUID] = None, **kwargs: Any) -> None:
+        model = (kwargs.get("invocation_params") or {}).get("_type") or (serialized or {}).get("name") or "model"
+        prompt_tokens = sum(estimate_tokens(m.text) for batch in messages for m in batch)
+        self.telemetry.observe("prompt_tokens", prompt_tokens, model=model)
+        self._start("model", run_id, parent_run_id, model=model, prompt_tokens=prompt_tokens)
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any) -> None:
+        run = self._runs.get(run_id)
+        if run is None or not token:
+            return
+        if run.first_token is None:
+            run.first_token = time.perf_counter()
+            self.telemetry.observe("ttft_seconds", run.first_token - run.start, model=run.model)
+        run.tokens += estimate_tokens(token)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        run = self._runs.get(run_id)
+        if run is None:
+            return
+        attributes: Dict[str, Any] = {"output_tokens": run.tokens}
+        if run.first_token is not None:
+            streaming = time.perf_counter() - run.first_token
+            attributes["ttft_ms"] = (run.first_token - run.start) * 1000
+            if streaming > 0 and run.tokens:
+                self.telemetry.observe("tokens_per_second", run.tokens / streaming, model=run.model)
+        self._end(run_id, "model", **attributes)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id, "model", error)
+
+
+class Telemetry:
+    enabled = True
+
+    def __init__(self, tracer: Any = None, registry: Any = None,
+                 caches: Optional[Mapping[str, Callable[[], Mapping[str, Any]]]] = None, provider: Any = None,
+                 admission: Optional[Callable[[], Mapping[str, Any]]] = None):
+        self.tracer = tracer
+        self.provider = provider
+        self.registry = registry
+        self.metrics = _Metrics(registry) if registry is not None else None
+        if registry is not None and caches:
+            registry.register(_CacheCollector(caches))
+        if registry is not None and admission is not None:
+            registry.register(_AdmissionCollector(admission))
+        self.handler = TelemetryCallbackHandler(self)
+
+    def callbacks(self) -> List[BaseCallbackHandler]:
+        return [self.handler]
+
+    # Export whatever is still buffered, e.g. before the process exits
+    def shutdown(self) -> None:
+        if self.provider is not None:
+            self.provider.shutdown()
+
+    def start_span(self, name: str, parent: Any = None, attributes: Optional[Dict[str, Any]] = None) -> Any:
+        if self.tracer is None:
+            return None
+        from opentelemetry import trace
+        context = trace.set_span_in_context(parent) if parent is not None else None
+        return self.tracer.start_span(name, context=context, attributes=attributes)
+
+    def end_span(self, span: Any, error: Optional[BaseException] = None,
+                 attributes: Optional[Dict[str, Any]] = None) -> None:
+        if span is None:
+            return
+        if attributes:
+            span.set_attributes(attributes)
+        if error is not None:
+            from opentelemetry.trace import Status, StatusCode
+            span.record_exception(error)
+            span.set_status(Status(StatusCode.ERROR, type(error).__name__))
+        span.end()
+
+    def observe_stage(self, stage: str, seconds: float) -> None:
+        if self.metrics is not None:
+            self.metrics.stage_seconds.labels(stage).observe(seconds)
+
+    def observe(self, metric: str, value: float, **labels: str) -> None:
+        if self.metrics is not None:
+            histogram = getattr(self.metrics, metric)
+            (histogram.labels(**labels) if labels else histogram).observe(value)
+
+    @contextlib.contextmanager
+    def stage(self, name: str, **attributes: Any) -> Iterator[Any]:
+        span = self.start_span(name, attributes=attributes)
+        start = time.perf_counter()
+        error = None
+        try:
+            yield span
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self.observe_stage(name, time.perf_counter() - start)
+            self.end_span(span, error)
+
+
+class NoopTelemetry:
+    enabled = False
+    registry = None
+
+    def callbacks(self) -> List[BaseCallbackHandler]:
+        return []
+
+    def shutdown(self) -> None:
+        pass
+
+    def observe_stage(self, stage: str, seconds: float) -> None:
+        pass
+
+    def observe(self, metric: str, value: float, **labels: str) -> None:
+        pass
+
+    def stage(self, name: str, **attributes: Any) -> Any:
+        return contextlib.nullcontext()
+
+
+# TELEMETRY: "none", "otlp" (OTEL_EXPORTER_OTLP_ENDPOINT, default a local
+# collector), "file" (JSON lines in TELEMETRY_FILE) or "console"
+def build_telemetry(settings: Any, caches: Optional[Mapping[str, Callable[[], Mapping[str, Any]]]] = None,
+                    admission: Optional[Callable[[], Mapping[str, Any]]] = None) -> Any:
+    exporter_name = settings.get("TELEMETRY", "none")
+    if exporter_name == "none":
+        return NoopTelemetry()
+    try:
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+        from prometheus_client import CollectorRegistry
+    except ImportError as e:
+        raise ImportError("Telemetry needs `pip install opentelemetry-sdk prometheus_client`") from e
+
+    match exporter_name:
+        case "otlp":
+            try:
+                from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+            except ImportError as e:
+                raise ImportError("TELEMETRY=otlp needs `pip install opentelemetry-exporter-otlp-proto-http`") from e
+            endpoint = settings.get("OTEL_EXPORTER_OTLP_ENDPOINT", "http://localhost:4318")
+            exporter = OTLPSpanExporter(endpoint=endpoint.rstrip("/") + "/v1/traces")
+        case "file":
+            exporter = JsonLinesSpanExporter(settings.get("TELEMETRY_FILE", "rowdy-spans.jsonl"))
+        case "console":
+            exporter = ConsoleSpanExporter()
+        case other:
+            raise ValueError(f"Unknown TELEMETRY {other!r}, expected none, otlp, file or console")
+
+    provider = TracerProvider(resource=Resource.create({"service.name": "rowdy"}))
+    provider.add_span_processor(BatchSpanProcessor(exporter))
+    registry = CollectorRegistry()
+    port = settings.get("TELEMETRY_METRICS_PORT")
+    if port:
+        from prometheus_client import start_http_server
+        start_http_server(int(port), registry=registry)
+    return Telemetry(provider.get_tracer("rowdy"), registry, caches, provider, admission)
@@ -0,0 +1,51 @@
+import re
+from html.parser import HTMLParser
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+# Lowercase, drop punctuation and collapse whitespace so that
+# "When is Add/Drop?" and "when is add drop" share one cache key
+def normalize_question(text: str) -> str:
+    return _WHITESPACE.sub(" ", _PUNCTUATION.sub(" ", text.lower())).strip()
+
+
+# Rough token estimate (~4 characters per token for English text). Good
+# enough for budgeting without shipping a tokenizer per model.
+def estimate_tokens(text: str) -> int:
+    return (len(text) + 3) // 4
+
+
+class _TextExtractor(HTMLParser):
+    _SKIP = {"script", "style", "noscript", "nav", "header", "footer", "svg"}
+    _BLOCK = {"p", "div", "br", "li", "tr", "h1", "h2", "h3", "h4", "h5", "h6", "section", "article", "table"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self._skipping = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self._SKIP:
+            self._skipping += 1
+        elif tag in self._BLOCK:
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in self._SKIP and self._skipping:
+            self._skipping -= 1
+        elif tag in self._BLOCK:
+            self.parts.append("\n")
+
+    def handle_data(self, data):
+        if not self._skipping:
+            self.parts.append(data)
+
+
+# Visible text of an HTML page, one line per block element
+def html_to_text(html: str) -> str:
+    parser = _TextExtractor()
+    parser.feed(html)
+    lines = (_WHITESPACE.sub(" ", line).strip() for line in "".join(parser.parts).splitlines())
+    return "\n".join(line for line in lines if line)
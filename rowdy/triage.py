@@ -0,0 +1,207 @@
+import json
+import re
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.runnables import Runnable, RunnableConfig, RunnableGenerator
+from langchain_core.runnables.utils import AddableDict
+
+from rowdy.local_index import HashingEmbeddings
+from rowdy.lru import LRUCache
+from rowdy.text import normalize_question
+
+# ------------------------------------------------------
+# Query triage
+#
+# A local classifier in front of the chain picks one of three routes:
+#   canned   greetings and out-of-scope questions get a fixed answer,
+#            with no retrieval and no model call
+#   factoid  short lookups ("what's the registrar's phone number") use a
+#            small retrieval (k=3) and a small output cap; processes,
+#            requirements and how-tos are never factoids
+#   full     everything else goes through the full pipeline
+# Questions are matched against a curated FAQ set by nearest neighbour
+# over offline hashing embeddings, then by simple keyword rules.
+
+CANNED = "canned"
+FACTOID = "factoid"
+FULL = "full"
+ROUTES = (CANNED, FACTOID, FULL)
+
+DEFAULT_FAQ: List[Dict[str, Any]] = [
+    {
+        "route": CANNED,
+        "examples": ["hi", "hello", "hey there", "good morning", "who are you"],
+        "response": "Hi, I'm Rowdy the Riverhawk! Ask me anything about UMass Lowell.",
+    },
+    {
+        "route": CANNED,
+        "examples": ["thanks", "thank you", "thanks so much", "bye", "goodbye"],
+        "response": "You're welcome! Let me know if you have any other questions about UMass Lowell.",
+    },
+    {
+        "route": CANNED,
+        "examples": [
+            "what is the weather today", "tell me a joke", "write my essay for me",
+            "who won the game last night", "what is the capital of france",
+            "help me with my python homework", "what stocks should i buy",
+        ],
+        "response": "I can only answer questions about the University of Massachusetts Lowell.",
+    },
+    {
+        "route": FACTOID,
+        "examples": [
+            "what is the registrar's phone number", "where is the registrar's office",
+            "when is the add drop deadline", "what are the library hours",
+            "what is the financial aid email", "where is university crossing",
+            "when does the semester start", "where is the campus recreation center",
+        ],
+    },
+]
+
+_GREETING = re.compile(
+    r"^(?:hi|hello|hey|yo|howdy|thanks|thank you|thx|bye|goodbye|good (?:morning|afternoon|evening))"
+    r"(?: rowdy| there| so much| again)*$"
+)
+# Matched against normalize_question() output, where "what's" is "what s"
+_FACTOID_START = re.compile(r"^(?:what(?: s| is| are)|where|when|who|which|how much|how many|is there|phone|email|hours)\b")
+_COMPLEX = re.compile(r"\b(?:why|explain|compare|difference|versus|vs|should i|pros|cons|recommend|plan (?:to|my|for))\b")
+# Processes, requirements and how-tos have multi-step answers that the
+# factoid output cap would cut off, however short the question
+_PROCEDURAL = re.compile(
+    r"\b(?:process|procedures?|requirements?|required|prerequisites?|steps?|apply|how (?:do|does|can|to|should))\b"
+)
+# Never answer these with a canned out-of-scope reply
+_IN_SCOPE = re.compile(
+    r"\b(?:uml|umass|lowell|campus|river ?hawks?|rowdy|students?|course|class|semester|professor|dorm|tuition)\b"
+)
+_FOLLOW_UP = re.compile(r"\b(?:it|its|that|this|they|them|those|there|he|she)\b")
+
+
+class Triage(NamedTuple):
+    route: str
+    response: Optional[str] = None
+    score: float = 0.0
+
+
+class QueryTriage:
+    def __init__(self, faq: Optional[Sequence[Dict[str, Any]]] = None, embeddings: Optional[Embeddings] = None,
+                 threshold: float = 0.6, max_factoid_words: int = 14):
+        self.faq = list(faq or DEFAULT_FAQ)
+        self.embeddings = embeddings or HashingEmbeddings()
+        self.threshold = threshold
+        self.max_factoid_words = max_factoid_words
+        self._entries = [i for i, entry in enumerate(self.faq) for _ in entry["examples"]]
+        examples = [normalize_question(e) for entry in self.faq for e in entry["examples"]]
+        self._matrix = np.asarray(self.embeddings.embed_documents(examples), dtype=np.float32)
+        self._matrix /= np.maximum(np.linalg.norm(self._matrix, axis=1, keepdims=True), 1e-12)
+        self._recent = LRUCache(maxsize=256)
+        self._lock = threading.Lock()
+        self._stats = {route: {"count": 0, "seconds": 0.0} for route in ROUTES}
+
+    @classmethod
+    def from_file(cls, path: str, **kwargs: Any) -> "QueryTriage":
+        with open(path) as f:
+            return cls(json.load(f), **kwargs)
+
+    def _nearest(self, question: str) -> Triage:
+        vector = np.asarray(self.embeddings.embed_query(question), dtype=np.float32)
+        vector /= np.linalg.norm(vector) or 1.0
+        scores = self._matrix @ vector
+        best = int(np.argmax(scores))
+        entry = self.faq[self._entries[best]]
+        return Triage(entry["route"], entry.get("response"), float(scores[best]))
+
+    def classify(self, question: str, history: Optional[Sequence[Any]] = None) -> Triage:
+        text = normalize_question(question)
+        # A short follow-up ("what about its hours?") needs the conversation
+        if history and _FOLLOW_UP.search(text):
+            return Triage(FULL)
+        cached = self._recent.get(text)
+        if cached is not None:
+            return cached
+        triage = self._classify(text)
+        self._recent.set(text, triage)
+        return triage
+
+    def _classify(self, text: str) -> Triage:
+        if not text:
+            return Triage(CANNED, self.faq[0].get("response"), 1.0)
+        nearest = self._nearest(text)
+        if _GREETING.match(text):
+            return nearest if nearest.route == CANNED else Triage(CANNED, self.faq[0].get("response"), 1.0)
+        procedural = _PROCEDURAL.search(text)
+        if nearest.score >= self.threshold and not (nearest.route == CANNED and _IN_SCOPE.search(text)) \
+                and not (nearest.route == FACTOID and procedural):
+            return nearest
+        words = text.split()
+        if len(words) <= self.max_factoid_words and _FACTOID_START.match(text) and not _COMPLEX.search(text) \
+                and not procedural and " and " not in text:
+            return Triage(FACTOID, score=nearest.score)
+        return Triage(FULL, score=nearest.score)
+
+    def record(self, route: str, seconds: float) -> None:
+        with self._lock:
+            self._stats[route]["count"] += 1
+            self._stats[route]["seconds"] += seconds
+
+    # Share of traffic per route, mean latency per route, and the time
+    # saved against sending the cheaper routes through the full pipeline
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = {route: dict(values) for route, values in self._stats.items()}
+        total = sum(s["count"] for s in stats.values())
+        for s in stats.values():
+            s["share"] = s["count"] / total if total else 0.0
+            s["mean_ms"] = s["seconds"] / s["count"] * 1000 if s["count"] else 0.0
+        full_mean = stats[FULL]["mean_ms"]
+        saved = sum(
+            max(0.0, full_mean - stats[route]["mean_ms"]) * stats[route]["count"] for route in (CANNED, FACTOID)
+        ) if stats[FULL]["count"] else 0.0
+        return {"requests": total, "routes": stats, "saved_ms": saved}
+
+
+# Route each request to a canned answer, the factoid chain or the full
+# chain. Both chains take {"question", "history"} and stream {"context"}
+# and {"response"} chunks, so the output looks the same on every route.
+def with_triage(full: Runnable, factoid: Runnable, triage: QueryTriage) -> Runnable:
+    def route(request: Dict[str, Any]) -> Triage:
+        return triage.classify(request["question"], request.get("history"))
+
+    def triaged(inputs: Iterator[Dict], config: RunnableConfig) -> Iterator[AddableDict]:
+        request = {}
+        for item in inputs:
+            request.update(item)
+        start = time.perf_counter()
+        decision = route(request)
+        try:
+            if decision.route == CANNED:
+                yield AddableDict(context=[])
+                yield AddableDict(response=decision.response)
+            else:
+                chain = factoid if decision.route == FACTOID else full
+                yield from chain.stream(request, config)
+        finally:
+            triage.record(decision.route, time.perf_counter() - start)
+
+    async def atriaged(inputs: AsyncIterator[Dict], config: RunnableConfig) -> AsyncIterator[AddableDict]:
+        request = {}
+        async for item in inputs:
+            request.update(item)
+        start = time.perf_counter()
+        decision = route(request)
+        try:
+            if decision.route == CANNED:
+                yield AddableDict(context=[])
+                yield AddableDict(response=decision.response)
+            else:
+                chain = factoid if decision.route == FACTOID else full
+                async for chunk in chain.astream(request, config):
+                    yield chunk
+        finally:
+            triage.record(decision.route, time.perf_counter() - start)
+
+    return RunnableGenerator(triaged, atriaged, name="triage")
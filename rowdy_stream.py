@@ -3,21 +3,15 @@
 # Knowledge Bases for Amazon Bedrock and LangChain 🦜️🔗
 # ------------------------------------------------------
 
-import boto3
 import logging
-import os
+import math
+import uuid
 import streamlit as st
-from langchain_openai import ChatOpenAI
-from typing import List, Dict
-from pydantic import BaseModel
-from operator import itemgetter
-from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_core.runnables import RunnablePassthrough, RunnableParallel
-from langchain_core.output_parsers import StrOutputParser
 from langchain_core.runnables.history import RunnableWithMessageHistory
-from langchain_aws import ChatBedrock
-from langchain_aws import AmazonKnowledgeBasesRetriever
-from langchain_community.chat_message_histories import StreamlitChatMessageHistory
+from rowdy.admission import Busy
+from rowdy.citations import compact_citations
+from rowdy.render import StreamRenderer
+from rowdy.resources import build_resources
 
 st.set_page_config(
     page_title='RowdyLLM',
@@ -28,148 +22,150 @@ st.set_page_config(
     }
 )
 
-os.environ["OPENAI_API_KEY"] = st.secrets["OPENAI_API_KEY"]
-
 # ------------------------------------------------------
 # Log level
 
 logging.getLogger().setLevel(logging.ERROR) # reduce log level
 
 # ------------------------------------------------------
-# Amazon Bedrock - settings
-
-bedrock_runtime = boto3.client(
-    service_name="bedrock-runtime",
-    region_name="us-east-1",
-    aws_access_key_id=st.secrets["AWS_ACCESS_KEY_ID"],
-    aws_secret_access_key=st.secrets["AWS_SECRET_ACCESS_KEY"],
-)
+# Clients, retriever, model and chain - built once per process and
+# reused across reruns and sessions (see rowdy/resources.py)
 
-retrieval_runtime = boto3.client(
-    service_name="bedrock-agent-runtime",
-    region_name="us-east-1",
-    aws_access_key_id=st.secrets["AWS_ACCESS_KEY_ID"],
-    aws_secret_access_key=st.secrets["AWS_SECRET_ACCESS_KEY"],
-)
+@st.cache_resource
+def get_resources():
+    return build_resources(st.secrets)
 
-model_id = "anthropic.claude-3-haiku-20240307-v1:0"
-
-model_kwargs =  { 
-    "max_tokens": 2048,
-    "temperature": 0.0,
-    "top_k": 250,
-    "top_p": 1,
-    "stop_sequences": ["\n\nHuman"],
-}
+resources = get_resources()
+chain = resources.chain
+speculative_mode = resources.speculative_mode
+async_mode = resources.async_mode
+telemetry = resources.telemetry
 
 # ------------------------------------------------------
-# LangChain - RAG chain with chat history
-
-
-prompt_text = '''
-You are Rowdy the Riverhawk, a chatbot for the University of Massachusetts Lowell. Provide answers in the style of a tour guide. 
-Please only use answers that are present in the search results here:\n {context}
-All users are full time students unless stated otherwise
-Please only answer questions about the University of Massachusetts Lowell.
-'''
-
-prompt = ChatPromptTemplate.from_messages(
-    [
-        ("system", prompt_text),
-        MessagesPlaceholder(variable_name="history"),
-        ("human", "{question}"),
-    ]
-)
+# LangChain - chat history
 
-# Amazon Bedrock - KnowledgeBase Retriever 
-retriever = AmazonKnowledgeBasesRetriever(
-    knowledge_base_id=st.secrets["KB_ID"], # 👈 Set your Knowledge base ID
-    client=retrieval_runtime,
-    retrieval_config={"vectorSearchConfiguration": {"numberOfResults": 12}},
-)
-
-match (st.secrets["MODEL"]):
-    case "OPENAI":
-        model = ChatOpenAI(model_name="gpt-4o-mini")
-    case "ANTHROPIC":
-        model = ChatBedrock(
-            client=bedrock_runtime,
-            model_id=model_id,
-            model_kwargs=model_kwargs,
-        )
-
-chain = (
-    RunnableParallel({
-        "context": itemgetter("question") | retriever,
-        "question": itemgetter("question"),
-        "history": itemgetter("history"),
-    })
-    .assign(response = prompt | model | StrOutputParser())
-    .pick(["response", "context"])
-)
-
-# Streamlit Chat Message History
-history = StreamlitChatMessageHistory(key="chat_messages")
+# History is kept per browser session in the session store (memory,
+# SQLite or Redis - see rowdy/sessions.py), windowed to a token budget
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
 
 # Chain with History
 chain_with_history = RunnableWithMessageHistory(
     chain,
-    lambda session_id: history,
+    resources.session_history,
     input_messages_key="question",
     history_messages_key="history",
     output_messages_key="response",
 )
 
 # ------------------------------------------------------
-# Pydantic data model and helper function for Citations
-
-class Citation(BaseModel):
-    page_content: str
-    metadata: Dict
-
-def extract_citations(response: List[Dict]) -> List[Citation]:
-    return [Citation(page_content=doc.page_content, metadata=doc.metadata) for doc in response]
+# Citations - each answer keeps one compact record per source URL
+# (rowdy/citations.py); the full chunk text is read from the chunk store
+# only while its "Show source details" expander is open
+
+chunk_store = resources.chunk_store
+snippet_chars = int(st.secrets.get("CITATION_SNIPPET_CHARS", 160))
+
+def show_sources(citations, key):
+    if not citations:
+        return
+    sources = st.expander("Show source details >", key=key, on_change="rerun")
+    if not sources.open:
+        return
+    with sources:
+        for citation in citations:
+            st.write("Page Content:", chunk_store.get(citation.chunk_id) or citation.snippet)
+            st.write("Score:", citation.score)
+            st.write("URL:", citation.url)
+
+# Rate limits are per client, not per browser tab: the client IP from
+# ADMISSION_CLIENT_HEADER behind a load balancer, else the connection's.
+# The session id is the fallback when neither is known.
+client_header = st.secrets.get("ADMISSION_CLIENT_HEADER")
+
+def client_key():
+    forwarded = st.context.headers.get(client_header) if client_header else None
+    if forwarded:
+        return forwarded.split(",")[0].strip()
+    return st.context.ip_address or st.session_state.session_id
+
+user_prompt = st.chat_input()
 
 # Initialize session state for messages if not already present
 if "messages" not in st.session_state:
     st.session_state.messages = [{"role": "assistant", "content": "Ask me anything about UMass Lowell!"}]
 
+avatar = "https://www.uml.edu/Images/logo_tcm18-196751.svg"
+
 # Display chat messages
-for message in st.session_state.messages:
-    if message["role"] == "assistant":
-        with st.chat_message(message["role"], avatar="https://www.uml.edu/Images/logo_tcm18-196751.svg"):
-            st.write(message["content"])
+def show_messages():
+    for i, message in enumerate(st.session_state.messages):
+        if message["role"] == "assistant":
+            with st.chat_message(message["role"], avatar=avatar):
+                st.write(message["content"])
+                show_sources(message.get("citations"), f"sources-{i}")
+        else:
+            with st.chat_message(message["role"]):
+                st.write(message["content"])
+
+# Chat Input - User Prompt
+if prompt := user_prompt:
+    config = {"configurable": {"session_id": st.session_state.session_id}, "callbacks": telemetry.callbacks()}
+    # Admission control: rate limits per client and a queue for the model
+    try:
+        with resources.admit(client_key()):
+            # Start retrieval as soon as the turn is admitted, before any
+            # rendering, so the Retrieve call overlaps the history and echo
+            # below. A rejected client never reaches the knowledge base.
+            if speculative_mode:
+                resources.prefetch(prompt, st.session_state.session_id)
+            show_messages()
+            st.session_state.messages.append({"role": "user", "content": prompt})
+            with st.chat_message("user"):
+                st.write(prompt)
+
+            # Chain - Stream
+            assistant = st.chat_message("assistant", avatar=avatar)
+            with assistant:
+                renderer = StreamRenderer(
+                    st.empty(),
+                    interval=float(st.secrets.get("RENDER_INTERVAL_MS", 50)) / 1000,
+                    min_chars=int(st.secrets.get("RENDER_MIN_CHARS", 64)),
+                )
+                if async_mode:
+                    stream = resources.async_runner.stream(
+                        chain_with_history,
+                        {"question" : prompt},
+                        config
+                    )
+                else:
+                    stream = chain_with_history.stream(
+                        {"question" : prompt},
+                        config
+                    )
+                full_context = []
+                for chunk in stream:
+                    if 'response' in chunk:
+                        renderer.write(chunk['response'])
+                    else:
+                        full_context = chunk['context']
+                full_response = renderer.close()
+    except Busy as e:
+        st.session_state.messages.append({"role": "user", "content": prompt})
+        show_messages()
+        busy = f"Rowdy is busy right now, please try again in {max(1, math.ceil(e.retry_after))} seconds."
+        with st.chat_message("assistant", avatar=avatar):
+            st.warning(busy)
+        # Answer the question with the notice, so the transcript keeps
+        # alternating and the question is not left without a reply
+        st.session_state.messages.append({"role": "assistant", "content": busy})
     else:
-        with st.chat_message(message["role"]):
-            st.write(message["content"])
-
-# Chat Input - User Prompt 
-if prompt := st.chat_input():
-    st.session_state.messages.append({"role": "user", "content": prompt})
-    with st.chat_message("user"):
-        st.write(prompt)
-
-    config = {"configurable": {"session_id": "any"}}
-    # Chain - Stream
-    with st.chat_message("assistant", avatar="https://www.uml.edu/Images/logo_tcm18-196751.svg"):
-        placeholder = st.empty()
-        full_response = ''
-        for chunk in chain_with_history.stream(
-            {"question" : prompt, "history" : history},
-            config
-        ):
-            if 'response' in chunk:
-                full_response += chunk['response']
-                placeholder.markdown(full_response.replace('$', r'\$'))
-            else:
-                full_context = chunk['context']
-        placeholder.markdown(full_response.replace('$', r'\$'))
-
-        citations = extract_citations(full_context)
-        with st.expander("Show source details >"):
-            for citation in citations:
-                st.write("Page Content:", citation.page_content)
-                st.write("Score:", citation.metadata['score'])
-                st.write("URL:", citation.metadata['source_metadata']['url'])
-        # session_state append
-        st.session_state.messages.append({"role": "assistant", "content": full_response})
\ No newline at end of file
+        telemetry.observe_stage("render", renderer.render_seconds)
+
+        with assistant:
+            citations = compact_citations(full_context, chunk_store, snippet_chars)
+            show_sources(citations, f"sources-{len(st.session_state.messages)}")
+        # session_state append - the citations stay with the answer
+        st.session_state.messages.append({"role": "assistant", "content": full_response, "citations": citations})
+else:
+    show_messages()
@@ -0,0 +1,277 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Dict, Iterator, List, NamedTuple, Optional
+
+# ------------------------------------------------------
+# Streaming Bedrock agent client
+#
+# One pooled bedrock-agent-runtime client per process (reused across warm
+# Lambda invocations). stream() yields events as the agent produces them:
+#   text       a delta of the answer (small chunks coalesced)
+#   citation   a retrieved reference: url, text and s3 uri, once each
+#   trace      a trace event, when enable_trace is set
+#   files / return_control   passed through as they come
+# Requests are coalesced per session: an identical question already in
+# flight for a session is joined instead of sent again, and a different
+# question waits for the previous one (an agent session takes one
+# invocation at a time). Every request has an overall deadline.
+#
+# Imports are kept light for Lambda cold starts: botocore is loaded when
+# the first client is built, and without boto3, which also pulls in
+# s3transfer (check with `python -X importtime -c "import main"`).
+
+REGION = 'us-east-1'
+_clients: Dict[Any, Any] = {}
+_clients_lock = threading.Lock()
+
+
+class AgentEvent(NamedTuple):
+    kind: str
+    data: Any
+
+
+class Citation(NamedTuple):
+    url: str
+    text: str
+    uri: str
+
+
+class AgentAnswer(NamedTuple):
+    text: str
+    citations: List[Citation]
+
+
+class AgentTimeout(TimeoutError):
+    pass
+
+
+def runtime_client(region=REGION, max_pool_connections=32, read_timeout=60.0, **credentials):
+    key = (region, max_pool_connections, read_timeout, tuple(sorted(credentials.items())))
+    with _clients_lock:
+        if key not in _clients:
+            import botocore.session
+            from botocore.config import Config
+            _clients[key] = botocore.session.get_session().create_client(
+                'bedrock-agent-runtime',
+                region_name=region,
+                config=Config(
+                    max_pool_connections=max_pool_connections,
+                    connect_timeout=5,
+                    read_timeout=read_timeout,
+                    retries={'max_attempts': 3, 'mode': 'standard'},
+                    tcp_keepalive=True,
+                ),
+                **credentials
+            )
+        return _clients[key]
+
+
+def citations(chunk) -> Iterator[Citation]:
+    for citation in chunk.get('attribution', {}).get('citations', []):
+        for reference in citation.get('retrievedReferences', []):
+            yield Citation(
+                (reference.get('metadata') or {}).get('url', ''),
+                reference.get('content', {}).get('text', ''),
+                reference.get('location', {}).get('s3Location', {}).get('uri', ''),
+            )
+
+
+# One agent invocation, shared by every caller that joined it. Events are
+# kept so a late joiner replays them from the start.
+class _Flight:
+    def __init__(self, text: str, previous: Optional["_Flight"]):
+        self.text = text
+        self.previous = previous
+        self.events: List[AgentEvent] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.followers = 0
+        self.cond = threading.Condition()
+
+    def publish(self, event: AgentEvent) -> None:
+        with self.cond:
+            self.events.append(event)
+            self.cond.notify_all()
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        with self.cond:
+            self.done = True
+            self.error = error
+            self.previous = None
+            self.cond.notify_all()
+
+    def wait_done(self, timeout: float) -> bool:
+        with self.cond:
+            return self.cond.wait_for(lambda: self.done, timeout)
+
+    @property
+    def abandoned(self) -> bool:
+        return self.followers == 0
+
+    # Callers are counted from the moment they join, before the first event
+    def follow(self, deadline: float) -> Iterator[AgentEvent]:
+        try:
+            index = 0
+            while True:
+                with self.cond:
+                    ready = self.cond.wait_for(
+                        lambda: len(self.events) > index or self.done, max(0.0, deadline - time.monotonic())
+                    )
+                    if not ready:
+                        raise AgentTimeout("Agent did not answer in time")
+                    events = self.events[index:]
+                    done, error = self.done, self.error
+                index += len(events)
+                yield from events
+                if done and index == len(self.events):
+                    if error is not None:
+                        raise error
+                    return
+        finally:
+            with self.cond:
+                self.followers -= 1
+
+
+class AgentClient:
+    def __init__(self, agent_id: str, alias_id: str, client: Any = None, timeout: float = 60.0,
+                 coalesce_chars: int = 32, coalesce_s: float = 0.05, max_workers: int = 16):
+        self.agent_id = agent_id
+        self.alias_id = alias_id
+        self.client = client or runtime_client(read_timeout=timeout)
+        self.timeout = timeout
+        self.coalesce_chars = coalesce_chars
+        self.coalesce_s = coalesce_s
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='agent')
+        self._flights: Dict[str, _Flight] = {}
+        self._lock = threading.Lock()
+
+    def _join(self, text: str, session_id: str, enable_trace: bool, deadline: float) -> _Flight:
+        with self._lock:
+            current = self._flights.get(session_id)
+            if current is not None and current.text == text and not current.done:
+                with current.cond:
+                    current.followers += 1
+                return current
+            flight = _Flight(text, current if current is not None and not current.done else None)
+            flight.followers = 1
+            self._flights[session_id] = flight
+        self._executor.submit(self._run, flight, session_id, enable_trace, deadline)
+        return flight
+
+    def _run(self, flight: _Flight, session_id: str, enable_trace: bool, deadline: float) -> None:
+        from botocore.exceptions import ReadTimeoutError
+        stream = None
+        try:
+            if flight.previous is not None and not flight.previous.wait_done(deadline - time.monotonic()):
+                raise AgentTimeout("Previous request for this session did not finish in time")
+            response = self.client.invoke_agent(
+                agentId=self.agent_id,
+                agentAliasId=self.alias_id,
+                sessionId=session_id,
+                inputText=flight.text,
+                enableTrace=enable_trace,
+                streamingConfigurations={'streamFinalResponse': True},
+            )
+            stream = response['completion']
+            buffer, flushed = [], time.monotonic()
+            seen = set()
+            for event in stream:
+                if time.monotonic() > deadline:
+                    raise AgentTimeout("Agent did not answer in time")
+                if flight.abandoned:
+                    # Every caller went away; stop reading
+                    break
+                chunk = event.get('chunk')
+                if chunk is not None:
+                    if chunk.get('bytes'):
+                        buffer.append(chunk['bytes'].decode('utf-8'))
+                    for citation in citations(chunk):
+                        if citation not in seen:
+                            seen.add(citation)
+                            buffer, flushed = self._flush(flight, buffer, flushed, force=True)
+                            flight.publish(AgentEvent('citation', citation))
+                    buffer, flushed = self._flush(flight, buffer, flushed)
+                    continue
+                buffer, flushed = self._flush(flight, buffer, flushed, force=True)
+                if 'trace' in event:
+                    flight.publish(AgentEvent('trace', event['trace']))
+                elif 'returnControl' in event:
+                    flight.publish(AgentEvent('return_control', event['returnControl']))
+                elif 'files' in event:
+                    flight.publish(AgentEvent('files', event['files']))
+            self._flush(flight, buffer, flushed, force=True)
+            flight.finish()
+        except ReadTimeoutError as e:
+            flight.finish(AgentTimeout(str(e)))
+        except BaseException as e:
+            flight.finish(e)
+        finally:
+            if stream is not None and hasattr(stream, 'close'):
+                stream.close()
+            with self._lock:
+                if self._flights.get(session_id) is flight:
+                    del self._flights[session_id]
+
+    def _flush(self, flight, buffer, flushed, force=False):
+        text = ''.join(buffer)
+        now = time.monotonic()
+        if text and (force or len(text) >= self.coalesce_chars or now - flushed >= self.coalesce_s):
+            flight.publish(AgentEvent('text', text))
+            return [], now
+        return ([text] if text else []), flushed
+
+    def stream(self, text: str, session_id: str, enable_trace: bool = False,
+               timeout: Optional[float] = None) -> Iterator[AgentEvent]:
+        deadline = time.monotonic() + (timeout or self.timeout)
+        yield from self._join(text, session_id, enable_trace, deadline).follow(deadline)
+
+    # The blocking stream runs on its own thread and feeds an asyncio queue;
+    # it stops at the next event once the async caller goes away
+    async def astream(self, text: str, session_id: str, enable_trace: bool = False,
+                      timeout: Optional[float] = None) -> AsyncIterator[AgentEvent]:
+        import asyncio
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        stop = threading.Event()
+        done = object()
+
+        def put(item):
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+            except RuntimeError:
+                stop.set()  # loop closed
+
+        def pump():
+            events = self.stream(text, session_id, enable_trace, timeout)
+            try:
+                for event in events:
+                    if stop.is_set():
+                        break
+                    put((event, None))
+                put((done, None))
+            except BaseException as e:
+                put((done, e))
+            finally:
+                events.close()
+
+        threading.Thread(target=pump, name='agent-astream', daemon=True).start()
+        try:
+            while True:
+                event, error = await queue.get()
+                if error is not None:
+                    raise error
+                if event is done:
+                    return
+                yield event
+        finally:
+            stop.set()
+
+    def invoke(self, text: str, session_id: str, timeout: Optional[float] = None) -> AgentAnswer:
+        parts, found = [], []
+        for event in self.stream(text, session_id, timeout=timeout):
+            if event.kind == 'text':
+                parts.append(event.data)
+            elif event.kind == 'citation':
+                found.append(event.data)
+        return AgentAnswer(''.join(parts), found)
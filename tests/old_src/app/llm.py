@@ -1,48 +1,48 @@
-import boto3
-from dotenv import load_dotenv
 import os
-import json
-import re
-load_dotenv()
+from agent_client import AgentClient, runtime_client
+
+# In Lambda the settings come from the function configuration; .env is
+# only read for local runs, so python-dotenv is not needed at cold start
+if not os.getenv('AWS_LAMBDA_FUNCTION_NAME'):
+    try:
+        from dotenv import load_dotenv
+        load_dotenv()
+    except ImportError:
+        pass
 
 AWS_ID = os.getenv('AWS_ID')
 AWS_KEY = os.getenv('AWS_KEY')
 AGENT_ID = os.getenv('AGENT_ID')
 AGENT_ALIAS = os.getenv('AGENT_ALIAS')
+TIMEOUT = float(os.getenv('AGENT_TIMEOUT', '60'))
+
+_agent = None
+
+# Created once per Lambda environment and reused by warm invocations
+def agent():
+    global _agent
+    if _agent is None:
+        credentials = {'aws_access_key_id': AWS_ID, 'aws_secret_access_key': AWS_KEY} if AWS_ID else {}
+        client = runtime_client(read_timeout=TIMEOUT, **credentials)
+        _agent = AgentClient(AGENT_ID, AGENT_ALIAS, client=client, timeout=TIMEOUT)
+    return _agent
+
+# Provisioned concurrency and SnapStart run the init phase ahead of the
+# first request (and SnapStart snapshots it), so build the client there
+if os.getenv('AWS_LAMBDA_INITIALIZATION_TYPE') in ('provisioned-concurrency', 'snap-start'):
+    agent()
+
+# Call the Titan Premier Model (RAG Capabilities), yielding text deltas and
+# citations as the agent produces them
+def stream_llm(input, userID):
+    return agent().stream(input, userID)
 
-# Call the Titan Premier Model (RAG Capabilities)
 def invoke_llm(input, userID):
-    bedrock = boto3.client(
-        service_name='bedrock-agent-runtime', 
-        region_name='us-east-1',
-        aws_access_key_id=AWS_ID,
-        aws_secret_access_key=AWS_KEY
-            
-    )   
-    bedrockObj = bedrock.invoke_agent (
-        agentAliasId=AGENT_ALIAS,
-        agentId=AGENT_ID,
-        inputText=input,
-        sessionId=userID
-    )
-
-    print(bedrockObj)
-
-    eventStream = bedrockObj['completion']
-    url = ""
-
-    for event in eventStream:
-        print(event)
-        if 'chunk' in event:
-            data = event['chunk']['bytes'].decode('utf-8')
-            returnString = data
-        if 'attribution' in event['chunk']:
-            for citations in event['chunk']['attribution']['citations']:
-                for references in citations['retrievedReferences']:
-                    print(f"Metadata\n{references}")
-                    url = references.get('metadata').get('url')
-
-    return f"{returnString}\nFind more information: {url}"
+    answer = agent().invoke(input, userID)
+    urls = [c.url for c in answer.citations if c.url]
+    if not urls:
+        return answer.text
+    return f"{answer.text}\nFind more information: {urls[-1]}"
 
 # def extract_filename(s3_uri):
 #     # Regex pattern to match the filename at the end of the URI
@@ -55,4 +55,6 @@ def invoke_llm(input, userID):
 #         return None
     
 if __name__ == "__main__":
-    print(invoke_llm("What are some living learning communities I can participate in", "123456"))
\ No newline at end of file
+    for event in stream_llm("What are some living learning communities I can participate in", "123456"):
+        print(event.data if event.kind == 'text' else f"\n[{event.kind}] {event.data}", end="", flush=True)
+    print()
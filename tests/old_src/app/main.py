@@ -1,13 +1,74 @@
 import json
+import os
 import llm
 
+# Bedrock error codes for a full quota; the caller gets a fast 429 rather
+# than waiting out retries
+THROTTLED = ('ThrottlingException', 'ServiceQuotaExceededException', 'TooManyRequestsException')
+RETRY_AFTER = os.getenv('RETRY_AFTER', '2')
+
+def throttled(error):
+    response = getattr(error, 'response', None) or {}
+    return response.get('Error', {}).get('Code') in THROTTLED
+
+# Buffered handler for an API Gateway proxy integration
 def handler(event, context):
     body = json.loads(event.get('body'))
 
     msg = body['user_message']
     id = body['session_id']
 
-    response = llm.invoke_llm(msg, id)
+    try:
+        response = llm.invoke_llm(msg, id)
+    except Exception as e:
+        if not throttled(e):
+            raise
+        return {'statusCode': 429, 'headers': {'Retry-After': RETRY_AFTER},
+                'body': json.dumps({'message': 'busy, please try again shortly'})}
     response_body = {'message': response}
     
-    return {'statusCode': 200, 'body': json.dumps(response_body)}
\ No newline at end of file
+    return {'statusCode': 200, 'body': json.dumps(response_body)}
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n".encode('utf-8')
+
+# Streaming handler: Server-Sent Events with one `token` per text delta and
+# one `citation` per source, then `done` (or `error`). Served through the
+# Lambda Web Adapter in response streaming mode (see the Dockerfile).
+def stream(environ, start_response):
+    try:
+        length = int(environ.get('CONTENT_LENGTH') or 0)
+        body = json.loads(environ['wsgi.input'].read(length) or b'{}')
+        msg, id = body['user_message'], body['session_id']
+    except (ValueError, KeyError):
+        start_response('400 Bad Request', [('Content-Type', 'application/json')])
+        return [json.dumps({'message': 'user_message and session_id are required'}).encode('utf-8')]
+
+    start_response('200 OK', [('Content-Type', 'text/event-stream'), ('Cache-Control', 'no-cache')])
+
+    def events():
+        try:
+            for event in llm.stream_llm(msg, id):
+                if event.kind == 'text':
+                    yield sse('token', event.data)
+                elif event.kind == 'citation':
+                    yield sse('citation', event.data._asdict())
+            yield sse('done', {})
+        except Exception as e:
+            yield sse('error', {'message': str(e), 'busy': throttled(e)})
+
+    return events()
+
+# Only the streaming image runs the server; the buffered handler never
+# imports it
+def serve(port):
+    from socketserver import ThreadingMixIn
+    from wsgiref.simple_server import WSGIServer, make_server
+
+    class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+        daemon_threads = True
+
+    make_server('0.0.0.0', port, stream, server_class=ThreadingWSGIServer).serve_forever()
+
+if __name__ == "__main__":
+    serve(int(os.getenv('PORT', '8080')))
@@ -1,30 +1,26 @@
-import boto3
 import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "old_src", "app"))
+from agent_client import AgentClient, runtime_client
 
 AGENT_ID = "HTWBIU7STM"
 AGENT_ALIAS = "ENXLBWQ7TZ"
 
 def invoke_llm(input, userID):
-    bedrock = boto3.client(
-        service_name='bedrock-agent-runtime', 
-        region_name='us-east-1',
+    client = runtime_client(
         aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
         aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY')
-            
-    )   
-    bedrockObj = bedrock.invoke_agent (
-        agentAliasId=AGENT_ALIAS,
-        agentId=AGENT_ID,
-        inputText=input,
-        sessionId=userID
     )
-
-    for event in bedrockObj['completion']:
-        data = event['chunk']['bytes'].decode('utf-8')
-    
-    return data
+    # Print the answer as it streams in
+    for event in AgentClient(AGENT_ID, AGENT_ALIAS, client=client).stream(input, userID):
+        if event.kind == 'text':
+            print(event.data, end="", flush=True)
+        elif event.kind == 'citation':
+            print(f"\n[source] {event.data.url}", end="", flush=True)
+    print()
     
 if __name__ == "__main__":
     msg = input("Enter a message: ")
     id = input("Enter a session ID: ")
-    print(invoke_llm(msg, id))
\ No newline at end of file
+    invoke_llm(msg, id)
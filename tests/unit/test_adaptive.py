@@ -0,0 +1,83 @@
+import json
+
+import boto3
+from botocore.stub import Stubber
+from langchain_core.documents import Document
+
+from rowdy.adaptive import AdaptiveRetriever, Depth, Page, bedrock_pager, strong_results
+
+
+def test_strong_results_from_the_score_curve():
+    assert strong_results([0.82, 0.79, 0.41, 0.40], drop_off=0.1, min_score=0.3) == Depth(2, "drop")
+    assert strong_results([0.62, 0.58, 0.55, 0.47], drop_off=0.1, min_score=0.5) == Depth(3, "threshold")
+    # Weak or flat: no answer yet
+    assert strong_results([0.45, 0.44, 0.30], drop_off=0.1, min_score=0.5) is None
+    assert strong_results([0.70, 0.68, 0.66, 0.65], drop_off=0.1, min_score=0.5) is None
+
+
+def curve_pager(scores, calls):
+    def fetch(query, offset, size, next_token):
+        calls.append((offset, size, next_token))
+        page = [Document(page_content=f"chunk {i}", metadata={"score": s})
+                for i, s in enumerate(scores[offset:offset + size], offset)]
+        more = offset + size < len(scores)
+        return Page(page, f"token-{offset + size}" if more and offset else None)
+    return fetch
+
+
+def test_adaptive_depth_fetches_more_only_for_weak_or_flat_results(tmp_path):
+    log = tmp_path / "depth.jsonl"
+    calls = []
+    sharp = AdaptiveRetriever(pager=curve_pager([0.81, 0.78, 0.42] + [0.4] * 9, calls), log_path=str(log))
+    assert [d.page_content for d in sharp.invoke("where is the registrar")] == ["chunk 0", "chunk 1"]
+    assert calls == [(0, 4, None)]
+
+    calls.clear()
+    flat = AdaptiveRetriever(pager=curve_pager([0.7 - i * 0.01 for i in range(20)], calls))
+    assert len(flat.invoke("clubs")) == 12
+    assert calls == [(0, 4, None), (4, 4, None), (8, 4, "token-8")]
+
+    calls.clear()
+    weak = AdaptiveRetriever(pager=curve_pager([0.45, 0.44, 0.43, 0.42, 0.41, 0.2], calls))
+    assert len(weak.invoke("parking")) == 6 and len(calls) == 2
+
+    record = json.loads(log.read_text())
+    assert record["k"] == 2 and record["reason"] == "drop" and record["scores"][:3] == [0.81, 0.78, 0.42]
+
+
+def test_adaptive_depth_stops_at_the_latency_budget():
+    now = [0.0]
+
+    def slow(query, offset, size, next_token):
+        now[0] += 0.3
+        return Page([Document(page_content="x", metadata={"score": 0.7})] * size, None)
+
+    retriever = AdaptiveRetriever(pager=slow, max_latency=0.5, clock=lambda: now[0])
+    documents, record = retriever.retrieve("q")
+    assert len(documents) == 4 and record["reason"] == "deadline" and record["pages"] == 1
+
+
+def test_bedrock_pager_uses_next_token_or_requeries():
+    client = boto3.client("bedrock-agent-runtime", region_name="us-east-1",
+                          aws_access_key_id="x", aws_secret_access_key="x")
+
+    def result(i, score):
+        return {"content": {"text": f"chunk {i}"}, "score": score, "metadata": {"url": f"https://www.uml.edu/{i}"},
+                "location": {"type": "S3", "s3Location": {"uri": f"s3://infobucket/{i}.txt"}}}
+
+    config = {"vectorSearchConfiguration": {"numberOfResults": 4}}
+    with Stubber(client) as stub:
+        stub.add_response("retrieve", {"retrievalResults": [result(i, 0.6) for i in range(8)]}, {
+            "knowledgeBaseId": "KBID123456", "retrievalQuery": {"text": "clubs"},
+            "retrievalConfiguration": {"vectorSearchConfiguration": {"numberOfResults": 8}},
+        })
+        stub.add_response("retrieve", {"retrievalResults": [result(8, 0.5)], "nextToken": "next"}, {
+            "knowledgeBaseId": "KBID123456", "retrievalQuery": {"text": "clubs"}, "nextToken": "abc",
+            "retrievalConfiguration": {"vectorSearchConfiguration": {"numberOfResults": 4}},
+        })
+        fetch = bedrock_pager(client, "KBID123456", config)
+        page = fetch("clubs", 4, 4, None)
+        assert [d.page_content for d in page.documents] == ["chunk 4", "chunk 5", "chunk 6", "chunk 7"]
+        assert page.documents[0].metadata["source_metadata"] == {"url": "https://www.uml.edu/4"}
+        page = fetch("clubs", 8, 4, "abc")
+        assert [d.page_content for d in page.documents] == ["chunk 8"] and page.next_token == "next"
@@ -0,0 +1,123 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from rowdy.admission import INTERACTIVE, AdmissionController, Busy, concurrency_for_quota
+from rowdy.chain import build_chain
+from rowdy.fakes import LatencyChatModel, LatencyRetriever, sample_documents
+from rowdy.resources import Resources
+from rowdy.server import create_app
+from rowdy.telemetry import Telemetry
+
+
+def test_token_bucket_per_client():
+    now = [0.0]
+    admission = AdmissionController({"ANTHROPIC": 4}, rate=1, burst=2, clock=lambda: now[0])
+    for _ in range(2):
+        with admission.admit("a", "ANTHROPIC"):
+            pass
+    with pytest.raises(Busy) as e:
+        admission.acquire("a", "ANTHROPIC")
+    assert e.value.reason == "rate_limited" and e.value.retry_after == pytest.approx(1)
+    # Other clients are unaffected, and the bucket refills
+    admission.release(admission.acquire("b", "ANTHROPIC"))
+    now[0] += 1
+    admission.release(admission.acquire("a", "ANTHROPIC"))
+    assert admission.stats()["rate_limited"] == 1
+
+
+def test_new_sessions_go_ahead_of_bulk_users():
+    waits = []
+    admission = AdmissionController({"ANTHROPIC": 1}, rate=100, burst=100, bulk_threshold=3,
+                                    observe=lambda backend, seconds: waits.append(backend))
+
+    async def run():
+        holder = await admission.aacquire("bulk", "ANTHROPIC")
+        for _ in range(3):
+            admission.release(holder)
+            holder = await admission.aacquire("bulk", "ANTHROPIC")
+        order = []
+
+        async def turn(key):
+            async with admission.aadmit(key, "ANTHROPIC"):
+                order.append(key)
+
+        bulk = asyncio.create_task(turn("bulk"))
+        await asyncio.sleep(0.01)
+        new = asyncio.create_task(turn("new"))
+        await asyncio.sleep(0.01)
+        assert admission.stats()["backends"]["ANTHROPIC"] == {"slots": 1, "active": 1, "queued": 2}
+        admission.release(holder)
+        await asyncio.gather(bulk, new)
+        return order
+
+    assert asyncio.run(run()) == ["new", "bulk"]
+    assert waits == ["ANTHROPIC", "ANTHROPIC"]
+    assert admission.stats()["backends"]["ANTHROPIC"] == {"slots": 1, "active": 0, "queued": 0}
+
+
+def test_busy_is_fast_when_the_queue_is_full_or_too_slow():
+    now = [0.0]
+    admission = AdmissionController({"OPENAI": 1}, rate=100, burst=100, queue_size=2, sla=0.05,
+                                    clock=lambda: now[0])
+    holder = admission.acquire("a", "OPENAI")
+    # Nothing queued ahead, but no slot frees up within the SLA
+    with pytest.raises(Busy) as e:
+        admission.acquire("b", "OPENAI")
+    assert e.value.reason == "queue_timeout"
+
+    # Turns hold a slot for 10s: a queued turn would miss its 5s SLA
+    now[0] += 10
+    admission.release(holder)
+    admission.slas[INTERACTIVE] = 5.0
+    holder = admission.acquire("a", "OPENAI")
+    with pytest.raises(Busy) as e:
+        admission.acquire("c", "OPENAI")
+    assert e.value.reason == "overloaded" and e.value.retry_after == pytest.approx(10)
+
+    admission.queue_size = 0
+    with pytest.raises(Busy) as e:
+        admission.acquire("c", "OPENAI")
+    assert e.value.reason == "queue_full"
+    stats = admission.stats()
+    assert (stats["queue_timeout"], stats["overloaded"], stats["queue_full"]) == (1, 1, 1)
+    assert stats["backends"]["OPENAI"]["queued"] == 0
+
+
+def test_slots_from_quota():
+    assert concurrency_for_quota(200, 6) == 20 and concurrency_for_quota(5, 1) == 1
+    resources = Resources({"MODEL": "ROUTER", "ADMISSION": "true", "ADMISSION_ANTHROPIC_RPM": "100",
+                           "ADMISSION_OPENAI_MAX_CONCURRENCY": "3"})
+    assert resources.admission_slots("ROUTER") == 10 + 3
+    assert resources.admission.stats()["backends"]["ROUTER"]["slots"] == 13
+
+
+def test_admission_metrics():
+    pytest.importorskip("prometheus_client")
+    from prometheus_client import CollectorRegistry
+
+    registry = CollectorRegistry()
+    admission = AdmissionController({"ANTHROPIC": 2}, rate=0.01, burst=1)
+    telemetry = Telemetry(registry=registry, admission=admission.stats)
+    admission.observe = lambda backend, seconds: telemetry.observe("admission_wait_seconds", seconds, backend=backend)
+    admission.acquire("a", "ANTHROPIC")
+    with pytest.raises(Busy):
+        admission.acquire("a", "ANTHROPIC")
+    assert registry.get_sample_value("rowdy_admission_active", {"backend": "ANTHROPIC"}) == 1
+    assert registry.get_sample_value("rowdy_admission_queued", {"backend": "ANTHROPIC"}) == 0
+    assert registry.get_sample_value("rowdy_admission_rejected_total", {"reason": "rate_limited"}) == 1
+
+
+def test_api_answers_429_with_retry_after():
+    chain = build_chain(
+        LatencyRetriever(documents=sample_documents(3), latency=0),
+        LatencyChatModel(first_token_latency=0, token_latency=0),
+    )
+    admission = AdmissionController({"": 1}, rate=0.1, burst=1)
+    with TestClient(create_app(chain=chain, admission=admission)) as client:
+        assert client.post("/chat", json={"question": "Where is the registrar?"}).status_code == 200
+        response = client.post("/chat", json={"question": "Where is the registrar?"})
+    assert response.status_code == 429 and response.headers["Retry-After"] == "10"
+    assert response.json() == {"detail": "busy", "reason": "rate_limited"}
+    assert admission.stats()["backends"][""]["active"] == 0
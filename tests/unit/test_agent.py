@@ -0,0 +1,209 @@
+import json
+from datetime import datetime, timezone
+
+import boto3
+from botocore.exceptions import ClientError
+from botocore.stub import ANY, Stubber
+
+from tools.agent import (
+    AgentProvisioner,
+    AgentSpec,
+    Backoff,
+    load_prompts,
+    prompt_configurations,
+    role_name,
+    role_policy,
+)
+
+NOW = datetime(2024, 1, 1, tzinfo=timezone.utc)
+ROLE_ARN = "arn:aws:iam::123456789012:role/" + role_name("team-a")
+LEGACY_ROLE_ARN = "arn:aws:iam::123456789012:role/service-role/AmazonBedrockExecutionRoleForAgents_K2V9"
+
+
+def default_prompt(prompt_type, state="DISABLED"):
+    return {
+        "basePromptTemplate": "Default template", "promptType": prompt_type, "promptCreationMode": "DEFAULT",
+        "promptState": state, "parserMode": "DEFAULT",
+        "inferenceConfiguration": {"maximumLength": 2048, "temperature": 0, "topK": 250, "topP": 1, "stopSequences": []},
+    }
+
+
+# GetAgent returns every prompt type, overridden or not
+def agent(status, instruction=None, role_arn=ROLE_ARN):
+    prompts = load_prompts()
+    overridden = prompt_configurations(prompts)["promptConfigurations"]
+    return {"agent": {
+        "agentId": "AGENT12345", "agentName": "team-a", "agentArn": "arn:aws:bedrock:us-east-1:1:agent/AGENT12345",
+        "agentVersion": "DRAFT", "agentStatus": status, "idleSessionTTLInSeconds": 123,
+        "agentResourceRoleArn": role_arn, "createdAt": NOW, "updatedAt": NOW,
+        "description": "Testing", "foundationModel": "amazon.titan-text-premier-v1:0",
+        "instruction": instruction or prompts["instruction"],
+        "promptOverrideConfiguration": {"promptConfigurations": [
+            default_prompt("PRE_PROCESSING", "ENABLED"),
+            overridden[0],
+            default_prompt("POST_PROCESSING"),
+            overridden[1],
+            default_prompt("MEMORY_SUMMARIZATION"),
+        ]},
+    }}
+
+
+def alias(status):
+    return {"agentAlias": {
+        "agentId": "AGENT12345", "agentAliasId": "ALIAS12345", "agentAliasName": "team-a_alias",
+        "agentAliasArn": "arn:aws:bedrock:us-east-1:1:agent-alias/AGENT12345/ALIAS12345", "routingConfiguration": [],
+        "createdAt": NOW, "updatedAt": NOW, "agentAliasStatus": status,
+    }}
+
+
+ALIASES = {"agentAliasSummaries": [{
+    "agentAliasId": "ALIAS12345", "agentAliasName": "team-a_alias", "agentAliasStatus": "PREPARED",
+    "createdAt": NOW, "updatedAt": NOW,
+}]}
+AGENTS = {"agentSummaries": [{"agentId": "AGENT12345", "agentName": "team-a", "agentStatus": "PREPARED", "updatedAt": NOW}]}
+ROLE = {"Role": {"Path": "/", "RoleName": role_name("team-a"), "RoleId": "AROA123456789012345", "Arn": ROLE_ARN,
+                 "CreateDate": NOW}}
+PREPARED = {"agentId": "AGENT12345", "agentStatus": "PREPARING", "agentVersion": "DRAFT", "preparedAt": NOW}
+
+
+def make_provisioner(sleeps):
+    session = boto3.Session(region_name="us-east-1", aws_access_key_id="x", aws_secret_access_key="x")
+    return AgentProvisioner(session, backoff=Backoff(initial=1.0, maximum=4.0), sleep=sleeps.append)
+
+
+def test_provision_creates_everything_once():
+    sleeps = []
+    provisioner = make_provisioner(sleeps)
+    with Stubber(provisioner.bedrock) as bedrock, Stubber(provisioner.iam) as iam:
+        iam.add_client_error("get_role", "NoSuchEntity", http_status_code=404)
+        iam.add_response("create_role", ROLE, {"RoleName": role_name("team-a"), "AssumeRolePolicyDocument": ANY})
+        iam.add_response("put_role_policy", {}, {
+            "RoleName": role_name("team-a"), "PolicyName": ANY, "PolicyDocument": ANY,
+        })
+        bedrock.add_response("list_agents", {"agentSummaries": []})
+        # The new role is not assumable yet: retried, not fatal
+        bedrock.add_client_error("create_agent", "ValidationException", http_status_code=400,
+                                 service_message=f"Failed to validate agentResourceRoleArn: {ROLE_ARN} could not be assumed")
+        bedrock.add_response("create_agent", agent("CREATING"))
+        bedrock.add_response("get_agent", agent("CREATING"), {"agentId": "AGENT12345"})
+        bedrock.add_response("get_agent", agent("NOT_PREPARED"), {"agentId": "AGENT12345"})
+        bedrock.add_response("prepare_agent", PREPARED, {"agentId": "AGENT12345"})
+        bedrock.add_response("get_agent", agent("PREPARING"), {"agentId": "AGENT12345"})
+        bedrock.add_response("get_agent", agent("PREPARING"), {"agentId": "AGENT12345"})
+        bedrock.add_response("get_agent", agent("PREPARED"), {"agentId": "AGENT12345"})
+        bedrock.add_response("list_agent_aliases", {"agentAliasSummaries": []}, {"agentId": "AGENT12345"})
+        bedrock.add_response("create_agent_alias", alias("CREATING"), {
+            "agentAliasName": "team-a_alias", "agentId": "AGENT12345", "description": ANY,
+        })
+        bedrock.add_response("get_agent_alias", alias("PREPARED"), {"agentId": "AGENT12345", "agentAliasId": "ALIAS12345"})
+
+        result = provisioner.provision(AgentSpec("team-a"))
+        bedrock.assert_no_pending_responses()
+        iam.assert_no_pending_responses()
+
+    assert result == ("team-a", "AGENT12345", "ALIAS12345", "created")
+    # Exponential backoff with jitter instead of fixed sleeps
+    assert len(sleeps) == 4 and all(0.5 <= s <= 2.0 for s in sleeps)
+    assert sleeps[3] >= sleeps[2]
+
+
+def test_provision_many_only_updates_what_differs():
+    provisioner = make_provisioner([])
+    with Stubber(provisioner.bedrock) as bedrock, Stubber(provisioner.iam) as iam:
+        bedrock.add_response("list_agents", AGENTS)
+        # Up to date: read-only calls and no alias update
+        iam.add_response("get_role", ROLE, {"RoleName": role_name("team-a")})
+        iam.add_response("get_role_policy", {
+            "RoleName": role_name("team-a"), "PolicyName": "AmazonBedrockExecutionRoleForAgents",
+            "PolicyDocument": json.dumps(role_policy("amazon.titan-text-premier-v1:0")),
+        }, {"RoleName": role_name("team-a"), "PolicyName": ANY})
+        bedrock.add_response("get_agent", agent("PREPARED"), {"agentId": "AGENT12345"})
+        bedrock.add_response("list_agent_aliases", ALIASES, {"agentId": "AGENT12345"})
+        assert provisioner.provision_many([AgentSpec("team-a")])[0].action == "unchanged"
+        bedrock.assert_no_pending_responses()
+        iam.assert_no_pending_responses()
+
+        # Changed instruction: update, prepare, and point the alias at the new version
+        bedrock.add_response("list_agents", AGENTS)
+        iam.add_response("get_role", ROLE, {"RoleName": role_name("team-a")})
+        iam.add_client_error("get_role_policy", "NoSuchEntity", http_status_code=404)
+        iam.add_response("put_role_policy", {}, {"RoleName": role_name("team-a"), "PolicyName": ANY, "PolicyDocument": ANY})
+        bedrock.add_response("get_agent", agent("PREPARED", instruction="An older instruction that has since been rewritten."), {"agentId": "AGENT12345"})
+        bedrock.add_response("get_agent", agent("PREPARED", instruction="An older instruction that has since been rewritten."), {"agentId": "AGENT12345"})
+        bedrock.add_response("update_agent", agent("UPDATING"))
+        bedrock.add_response("get_agent", agent("NOT_PREPARED"), {"agentId": "AGENT12345"})
+        bedrock.add_response("prepare_agent", PREPARED, {"agentId": "AGENT12345"})
+        bedrock.add_response("get_agent", agent("PREPARED"), {"agentId": "AGENT12345"})
+        bedrock.add_response("list_agent_aliases", ALIASES, {"agentId": "AGENT12345"})
+        bedrock.add_response("update_agent_alias", alias("UPDATING"), {
+            "agentAliasId": "ALIAS12345", "agentAliasName": "team-a_alias", "agentId": "AGENT12345",
+        })
+        bedrock.add_response("get_agent_alias", alias("PREPARED"), {"agentId": "AGENT12345", "agentAliasId": "ALIAS12345"})
+        assert provisioner.provision_many([AgentSpec("team-a")])[0].action == "updated"
+        bedrock.assert_no_pending_responses()
+        iam.assert_no_pending_responses()
+
+
+
+def test_update_keeps_the_configured_alias():
+    provisioner = make_provisioner([])
+    configured = {"agentAlias": dict(alias("PREPARED")["agentAlias"], agentAliasId="ALIAS67890", agentAliasName="production")}
+    with Stubber(provisioner.bedrock) as bedrock, Stubber(provisioner.iam) as iam:
+        bedrock.add_response("list_agents", AGENTS)
+        iam.add_response("get_role", ROLE, {"RoleName": role_name("team-a")})
+        iam.add_response("get_role_policy", {
+            "RoleName": role_name("team-a"), "PolicyName": "AmazonBedrockExecutionRoleForAgents",
+            "PolicyDocument": json.dumps(role_policy("amazon.titan-text-premier-v1:0")),
+        }, {"RoleName": role_name("team-a"), "PolicyName": ANY})
+        bedrock.add_response("get_agent", agent("PREPARED", instruction="An older instruction that has since been rewritten."), {"agentId": "AGENT12345"})
+        bedrock.add_response("get_agent", agent("PREPARED", instruction="An older instruction that has since been rewritten."), {"agentId": "AGENT12345"})
+        bedrock.add_response("update_agent", agent("UPDATING"))
+        bedrock.add_response("get_agent", agent("NOT_PREPARED"), {"agentId": "AGENT12345"})
+        bedrock.add_response("prepare_agent", PREPARED, {"agentId": "AGENT12345"})
+        bedrock.add_response("get_agent", agent("PREPARED"), {"agentId": "AGENT12345"})
+        # The alias from .env is named "production", not "team-a_alias": it
+        # is updated in place and no second alias is created
+        bedrock.add_response("get_agent_alias", configured, {"agentId": "AGENT12345", "agentAliasId": "ALIAS67890"})
+        bedrock.add_response("update_agent_alias", configured, {
+            "agentAliasId": "ALIAS67890", "agentAliasName": "production", "agentId": "AGENT12345",
+        })
+        bedrock.add_response("get_agent_alias", configured, {"agentId": "AGENT12345", "agentAliasId": "ALIAS67890"})
+        result = provisioner.provision(AgentSpec("team-a", alias_id="ALIAS67890"))
+        bedrock.assert_no_pending_responses()
+        iam.assert_no_pending_responses()
+
+    assert result == ("team-a", "AGENT12345", "ALIAS67890", "updated")
+
+def test_existing_agent_keeps_its_role():
+    provisioner = make_provisioner([])
+    legacy = LEGACY_ROLE_ARN.rsplit("/", 1)[-1]
+    with Stubber(provisioner.bedrock) as bedrock, Stubber(provisioner.iam) as iam:
+        bedrock.add_response("list_agents", AGENTS)
+        bedrock.add_response("get_agent", agent("PREPARED", role_arn=LEGACY_ROLE_ARN), {"agentId": "AGENT12345"})
+        iam.add_response("get_role", {"Role": dict(ROLE["Role"], RoleName=legacy, Arn=LEGACY_ROLE_ARN)}, {"RoleName": legacy})
+        iam.add_response("get_role_policy", {
+            "RoleName": legacy, "PolicyName": "AmazonBedrockExecutionRoleForAgents",
+            "PolicyDocument": json.dumps(role_policy("amazon.titan-text-premier-v1:0")),
+        }, {"RoleName": legacy, "PolicyName": ANY})
+        bedrock.add_response("list_agent_aliases", ALIASES, {"agentId": "AGENT12345"})
+        assert provisioner.provision(AgentSpec("team-a")).action == "unchanged"
+        bedrock.assert_no_pending_responses()
+        iam.assert_no_pending_responses()
+
+
+def test_retry_only_waits_out_transient_validation_errors():
+    sleeps = []
+    provisioner = make_provisioner(sleeps)
+    errors = ["Update operation can't be performed on Agent when it is in Updating state.",
+              "1 validation error detected: Value 'x' at 'foundationModel' failed to satisfy constraint"]
+
+    def call():
+        raise ClientError({"Error": {"Code": "ValidationException", "Message": errors.pop(0)}}, "UpdateAgent")
+
+    try:
+        provisioner.retry(call)
+    except ClientError as e:
+        assert "foundationModel" in e.response["Error"]["Message"]
+    else:
+        raise AssertionError("expected the bad request to be raised")
+    assert len(sleeps) == 1 and not errors
@@ -0,0 +1,137 @@
+import asyncio
+import io
+import json
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+APP_DIR = os.path.join(os.path.dirname(__file__), "..", "old_src", "app")
+sys.path.insert(0, APP_DIR)
+
+from agent_client import AgentClient, AgentTimeout, Citation  # noqa: E402
+
+REFERENCE = {
+    "content": {"text": "University Crossing, Suite 360"},
+    "location": {"s3Location": {"uri": "s3://infobucket/registrar.txt"}},
+    "metadata": {"url": "https://www.uml.edu/registrar"},
+}
+
+
+class FakeRuntime:
+    def __init__(self, parts, delay=0.0):
+        self.parts = parts
+        self.delay = delay
+        self.calls = []
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    def invoke_agent(self, **kwargs):
+        self.calls.append(kwargs)
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+
+        def completion():
+            try:
+                yield {"trace": {"trace": {"orchestrationTrace": {}}}}
+                for part in self.parts:
+                    time.sleep(self.delay)
+                    yield {"chunk": {"bytes": part.encode()}}
+                attribution = {"citations": [{"retrievedReferences": [REFERENCE]}] * 2}
+                yield {"chunk": {"bytes": b"", "attribution": attribution}}
+            finally:
+                with self.lock:
+                    self.active -= 1
+
+        return {"completion": completion(), "sessionId": kwargs["sessionId"]}
+
+
+def test_stream_yields_deltas_citations_and_traces():
+    runtime = FakeRuntime(["The Registrar", "'s Office is in ", "University Crossing."])
+    client = AgentClient("AGENT", "ALIAS", client=runtime, coalesce_chars=1)
+    events = list(client.stream("Where is the registrar?", "s1", enable_trace=True))
+
+    assert [e.kind for e in events] == ["trace", "text", "text", "text", "citation"]
+    assert events[-1].data == Citation("https://www.uml.edu/registrar", "University Crossing, Suite 360",
+                                       "s3://infobucket/registrar.txt")
+    assert runtime.calls[0]["streamingConfigurations"] == {"streamFinalResponse": True}
+
+    # Small deltas are coalesced, and invoke() collects the whole answer
+    client = AgentClient("AGENT", "ALIAS", client=runtime, coalesce_chars=1000, coalesce_s=60)
+    answer = client.invoke("Where is the registrar?", "s1")
+    assert answer.text == "The Registrar's Office is in University Crossing."
+    assert len(answer.citations) == 1
+
+
+def test_requests_are_coalesced_per_session():
+    runtime = FakeRuntime(["a", "b", "c"], delay=0.05)
+    client = AgentClient("AGENT", "ALIAS", client=runtime)
+    results = {}
+
+    def ask(name, session, question):
+        results[name] = client.invoke(question, session).text
+
+    threads = [
+        threading.Thread(target=ask, args=("first", "s1", "hours?")),
+        threading.Thread(target=ask, args=("joined", "s1", "hours?")),
+        threading.Thread(target=ask, args=("queued", "s1", "parking?")),
+    ]
+    for t in threads:
+        t.start()
+        time.sleep(0.02)
+    for t in threads:
+        t.join()
+
+    assert results == {"first": "abc", "joined": "abc", "queued": "abc"}
+    # The identical question joined the first call; the other waited its turn
+    assert [c["inputText"] for c in runtime.calls] == ["hours?", "parking?"]
+    assert runtime.max_active == 1
+
+
+def test_timeout_and_async_stream():
+    client = AgentClient("AGENT", "ALIAS", client=FakeRuntime(["a", "b"], delay=0.2))
+    with pytest.raises(AgentTimeout):
+        client.invoke("slow", "s1", timeout=0.1)
+
+    async def collect():
+        fast = AgentClient("AGENT", "ALIAS", client=FakeRuntime(["x", "y"]), coalesce_chars=1)
+        return [e.data async for e in fast.astream("q", "s2") if e.kind == "text"]
+
+    assert asyncio.run(collect()) == ["x", "y"]
+
+
+def test_lambda_streams_server_sent_events(monkeypatch):
+    import llm
+    import main
+
+    client = AgentClient("AGENT", "ALIAS", client=FakeRuntime(["Go ", "River Hawks!"]), coalesce_chars=1)
+    monkeypatch.setattr(llm, "_agent", client)
+    body = json.dumps({"user_message": "hi", "session_id": "s3"}).encode()
+    statuses = []
+    chunks = list(main.stream(
+        {"CONTENT_LENGTH": str(len(body)), "wsgi.input": io.BytesIO(body)},
+        lambda status, headers: statuses.append(status),
+    ))
+
+    assert statuses == ["200 OK"]
+    assert [c.decode().split("\n")[0] for c in chunks] == [
+        "event: token", "event: token", "event: citation", "event: done",
+    ]
+    assert json.loads(main.handler({"body": body.decode()}, None)["body"])["message"] == \
+        "Go River Hawks!\nFind more information: https://www.uml.edu/registrar"
+
+
+def test_lambda_answers_429_when_bedrock_is_throttled(monkeypatch):
+    from botocore.exceptions import ClientError
+    import main
+
+    def throttled(msg, id):
+        raise ClientError({"Error": {"Code": "ThrottlingException", "Message": "Rate exceeded"}}, "InvokeAgent")
+
+    monkeypatch.setattr(main.llm, "invoke_llm", throttled)
+    response = main.handler({"body": json.dumps({"user_message": "hi", "session_id": "s4"})}, None)
+    assert response["statusCode"] == 429 and response["headers"]["Retry-After"] == "2"
@@ -0,0 +1,56 @@
+import asyncio
+import threading
+
+from langchain_core.documents import Document
+from langchain_core.runnables import RunnableGenerator
+from langchain_core.runnables.utils import AddableDict
+
+from rowdy.aio import AsyncRunner
+from rowdy.cache import SemanticCache, with_semantic_cache
+
+
+def make_slow_chain(state):
+    async def answer(inputs):
+        async for _ in inputs:
+            pass
+        state["running"] += 1
+        state["peak"] = max(state["peak"], state["running"])
+        yield AddableDict(context=[Document(page_content="c")])
+        for token in ["Go ", "River", "Hawks"]:
+            await asyncio.sleep(0.01)
+            yield AddableDict(response=token)
+        state["running"] -= 1
+    return RunnableGenerator(answer)
+
+
+def test_stream_bridges_to_sync_caller():
+    runner = AsyncRunner(max_concurrency=2)
+    chunks = list(runner.stream(make_slow_chain({"running": 0, "peak": 0}), {"question": "q"}))
+    assert "".join(c.get("response", "") for c in chunks) == "Go RiverHawks"
+    runner.close()
+
+
+def test_concurrency_is_bounded():
+    runner = AsyncRunner(max_concurrency=2)
+    state = {"running": 0, "peak": 0}
+    chain = make_slow_chain(state)
+    threads = [threading.Thread(target=lambda: list(runner.stream(chain, {"question": "q"}))) for _ in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert state["peak"] == 2
+    runner.close()
+
+
+def test_semantic_cache_async_path():
+    state = {"running": 0, "peak": 0}
+    chain = with_semantic_cache(make_slow_chain(state), SemanticCache())
+
+    async def turn():
+        return [c async for c in chain.astream({"question": "Go team?", "history": []})]
+
+    first = asyncio.run(turn())
+    second = asyncio.run(turn())
+    assert len(first) == 4 and len(second) == 2
+    assert second[1]["response"] == "Go RiverHawks"
@@ -0,0 +1,95 @@
+from langchain_core.documents import Document
+from langchain_core.runnables import RunnableLambda
+from langchain_core.runnables.utils import AddableDict
+
+from rowdy.cache import SemanticCache, with_semantic_cache
+from rowdy.lru import LRUCache
+from rowdy.resources import Resources
+
+
+def fake_embed(text):
+    # Bag of letters - enough to make rephrasings land close together
+    vector = [0.0] * 26
+    for ch in text:
+        if "a" <= ch <= "z":
+            vector[ord(ch) - ord("a")] += 1
+    return vector
+
+
+def make_chain(calls):
+    def answer(request):
+        calls.append(request["question"])
+        yield AddableDict(context=[Document(page_content="Add/drop ends Sept 10", metadata={"score": 0.9})])
+        yield AddableDict(response="Add/drop ")
+        yield AddableDict(response="ends Sept 10.")
+    return RunnableLambda(answer)
+
+
+def test_lru_cache_evicts_and_expires():
+    now = [0.0]
+    cache = LRUCache(maxsize=2, ttl=10, clock=lambda: now[0])
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert "b" not in cache and cache.get("a") == 1
+    now[0] = 11
+    assert cache.get("a") is None
+
+
+def test_exact_and_semantic_hits():
+    cache = SemanticCache(embed=fake_embed, threshold=0.9)
+    assert cache.get("When is add/drop?") is None
+    cache.put("When is add/drop?", "Sept 10", [])
+    assert cache.get("when is ADD DROP").response == "Sept 10"
+    assert cache.get("when is add drop ?").response == "Sept 10"
+    assert cache.get("when's add/drop").response == "Sept 10"
+    assert cache.get("where is the registrar") is None
+    assert cache.stats()["exact_hits"] == 2
+    assert cache.stats()["semantic_hits"] == 1
+    assert cache.stats()["misses"] == 2
+
+
+def test_cached_chain_replays_response_and_context():
+    calls = []
+    chain = with_semantic_cache(make_chain(calls), SemanticCache())
+
+    first = list(chain.stream({"question": "When is add/drop?", "history": []}))
+    second = list(chain.stream({"question": "when is add drop", "history": []}))
+
+    assert calls == ["When is add/drop?"]
+    assert "".join(c.get("response", "") for c in second) == "Add/drop ends Sept 10."
+    assert second[0]["context"] == first[0]["context"]
+    assert chain.invoke({"question": "when is add drop", "history": []})["response"] == "Add/drop ends Sept 10."
+
+
+def test_follow_ups_bypass_cache():
+    calls = []
+    chain = with_semantic_cache(make_chain(calls), SemanticCache())
+    chain.invoke({"question": "When is add/drop?", "history": []})
+    chain.invoke({"question": "When is add/drop?", "history": ["earlier turn"]})
+    assert len(calls) == 2
+
+
+def test_answers_are_scoped_by_namespace_and_generation():
+    calls = []
+    generation = ["1"]
+    cache = SemanticCache(generation=lambda: generation[0])
+    full = with_semantic_cache(make_chain(calls), cache, namespace="full")
+    factoid = with_semantic_cache(make_chain(calls), cache, namespace="factoid")
+    full.invoke({"question": "When is add/drop?", "history": []})
+    factoid.invoke({"question": "When is add/drop?", "history": []})
+    full.invoke({"question": "When is add/drop?", "history": []})
+    assert len(calls) == 2
+    # A knowledge base sync bumps the generation
+    generation[0] = "2"
+    full.invoke({"question": "When is add/drop?", "history": []})
+    assert len(calls) == 3
+
+
+def test_answer_cache_is_opt_in():
+    settings = {"MODEL": "ANTHROPIC", "KB_ID": "x", "AWS_ACCESS_KEY_ID": "a", "AWS_SECRET_ACCESS_KEY": "b"}
+    assert Resources(settings).answer_cache is None
+    cache = Resources({**settings, "ANSWER_CACHE": "true"}).answer_cache
+    assert cache.embed is None
+    assert cache.generation() != Resources({**settings, "ANSWER_CACHE": "true", "KB_GENERATION": "7"}).answer_cache.generation()
@@ -1,11 +1,21 @@
 import aws_cdk as core
 import aws_cdk.assertions as assertions
+import pytest
 
 from cdk.cdk_stack import CdkStack
 
+
+# Settings the stack reads from the deploy environment
+@pytest.fixture
+def stack_env(monkeypatch):
+    monkeypatch.setenv("PINECONE_URL", "https://rowdy-index.svc.pinecone.io")
+    monkeypatch.setenv("PINECONE_API_KEY", "arn:aws:secretsmanager:us-east-1:123456789012:secret:pinecone")
+    monkeypatch.setenv("APP_NAME", "chat")
+
+
 # example tests. To run these tests, uncomment this file along with the example
 # resource in cdk/cdk_stack.py
-def test_sqs_queue_created():
+def test_sqs_queue_created(stack_env):
     app = core.App()
     stack = CdkStack(app, "cdk")
     template = assertions.Template.from_stack(stack)
@@ -13,3 +23,40 @@ def test_sqs_queue_created():
 #     template.has_resource_properties("AWS::SQS::Queue", {
 #         "VisibilityTimeout": 300
 #     })
+
+
+def test_chat_lambda_with_snapstart(monkeypatch, stack_env):
+    monkeypatch.setenv("CHAT_LAMBDA", "zip")
+    monkeypatch.setenv("CHAT_LAMBDA_SNAPSTART", "true")
+    monkeypatch.setenv("CHAT_LAMBDA_RESERVED", "20")
+    app = core.App()
+    template = assertions.Template.from_stack(CdkStack(app, "chat"))
+
+    template.has_resource_properties("AWS::Lambda::Function", {
+        "Runtime": "python3.12",
+        "Handler": "main.handler",
+        "SnapStart": {"ApplyOn": "PublishedVersions"},
+        "ReservedConcurrentExecutions": 20,
+    })
+    template.has_resource_properties("AWS::Lambda::Alias", {"Name": "live"})
+    template.has_resource_properties("AWS::Lambda::Url", {"AuthType": "AWS_IAM", "InvokeMode": "BUFFERED"})
+
+
+def test_chat_lambda_with_provisioned_concurrency(monkeypatch, stack_env):
+    monkeypatch.setenv("CHAT_LAMBDA", "zip")
+    monkeypatch.setenv("CHAT_LAMBDA_PROVISIONED", "2")
+    app = core.App()
+    template = assertions.Template.from_stack(CdkStack(app, "chat"))
+
+    template.has_resource_properties("AWS::Lambda::Alias", {
+        "Name": "live",
+        "ProvisionedConcurrencyConfig": {"ProvisionedConcurrentExecutions": 2},
+    })
+
+
+def test_snapstart_and_provisioned_concurrency_are_rejected(monkeypatch, stack_env):
+    monkeypatch.setenv("CHAT_LAMBDA", "zip")
+    monkeypatch.setenv("CHAT_LAMBDA_SNAPSTART", "true")
+    monkeypatch.setenv("CHAT_LAMBDA_PROVISIONED", "2")
+    with pytest.raises(ValueError, match="cannot be combined"):
+        CdkStack(core.App(), "chat")
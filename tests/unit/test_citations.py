@@ -0,0 +1,38 @@
+import pickle
+
+from langchain_core.documents import Document
+
+from rowdy.citations import ChunkStore, Citation, compact_citations, snippet
+from rowdy.fakes import sample_documents
+
+
+def test_citations_are_deduplicated_by_url_with_lazy_full_text():
+    documents = [
+        Document(page_content="Suite 360 is on the third floor.", metadata={
+            "score": 0.61, "source_metadata": {"url": "https://www.uml.edu/registrar"}}),
+        Document(page_content="The Registrar's Office is in University Crossing. " * 10, metadata={
+            "score": 0.83, "source_metadata": {"url": "https://www.uml.edu/registrar"}}),
+        Document(page_content="Parking permits are sold online.", metadata={
+            "score": 0.44, "location": {"s3Location": {"uri": "s3://infobucket/parking.txt"}}}),
+    ]
+    store = ChunkStore()
+    citations = compact_citations(documents, store, snippet_chars=40)
+
+    assert [(c.url, c.score) for c in citations] == [
+        ("https://www.uml.edu/registrar", 0.83), ("s3://infobucket/parking.txt", 0.44),
+    ]
+    assert citations[0].snippet == "The Registrar's Office is in University…"
+    # Full text of every chunk for the URL, best first, only in the store
+    assert store.get(citations[0].chunk_id).endswith("Crossing. \n\nSuite 360 is on the third floor.")
+    assert compact_citations(documents, snippet_chars=40)[0] == citations[0] and len(store) == 2
+    assert isinstance(citations[0], tuple) and not hasattr(citations[0], "__dict__")
+
+
+def test_compact_citations_are_much_smaller_than_documents():
+    documents = sample_documents(12)
+    for d in documents:
+        d.page_content *= 20
+    citations = compact_citations(documents)
+    assert len(pickle.dumps(citations)) * 5 < len(pickle.dumps(documents))
+    assert snippet("a  b\nc") == "a b c"
+    assert Citation._fields == ("url", "score", "chunk_id", "snippet")
@@ -0,0 +1,184 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+
+from rowdy.chain import build_chain
+from rowdy.coalesce import SingleFlight, request_key, with_coalescing
+from rowdy.fakes import LatencyChatModel, LatencyRetriever, sample_documents
+
+ANSWER = "The Registrar's Office is in University Crossing, Suite 360."
+
+
+def make_chain(first_token_latency=0.1, token_latency=0.01):
+    retriever = LatencyRetriever(documents=sample_documents(3), latency=0.05)
+    model = LatencyChatModel(first_token_latency=first_token_latency, token_latency=token_latency)
+    return retriever, model, build_chain(retriever, model)
+
+
+def response(chunks):
+    return "".join(c.get("response", "") for c in chunks)
+
+
+def test_request_key_normalizes_question_and_history():
+    history = [HumanMessage("Where is the registrar?"), AIMessage("University Crossing.")]
+    assert request_key("Where is the Registrar?") == request_key("where is the registrar")
+    assert request_key("hours?", history) == request_key("Hours", [HumanMessage("where is the registrar"),
+                                                                     AIMessage("University crossing")])
+    assert request_key("hours?", history) != request_key("hours?")
+
+
+def test_concurrent_identical_requests_share_one_upstream_call():
+    retriever, model, chain = make_chain()
+    flights = SingleFlight()
+    coalesced = with_coalescing(chain, flights)
+
+    async def ask(question, first_token=None):
+        chunks = []
+        async for chunk in coalesced.astream({"question": question, "history": []}):
+            chunks.append(chunk)
+            if first_token is not None and "response" in chunk:
+                first_token.set()
+        return chunks
+
+    async def main():
+        # The answer is held after its first token until every caller has joined
+        model.gate = asyncio.Event()
+        first_token = asyncio.Event()
+        early = [asyncio.create_task(ask("Where is the registrar?", first_token)) for _ in range(10)]
+        early.append(asyncio.create_task(ask("where is the REGISTRAR")))
+        other = asyncio.create_task(ask("Where is the bursar?"))
+        await first_token.wait()
+        # Joins after tokens were emitted: gets the prefix replayed
+        late = asyncio.create_task(ask("Where is the registrar"))
+        while flights.stats()["joined"] + flights.stats()["late_joined"] < 11:
+            await asyncio.sleep(0.001)
+        model.gate.set()
+        return await asyncio.gather(*early, late, other)
+
+    results = asyncio.run(main())
+    assert all(response(r) == ANSWER for r in results)
+    assert all(sum("context" in c for c in r) == 1 for r in results)
+    assert model.calls == 2 and retriever.calls == 2
+    stats = flights.stats()
+    assert stats["flights"] == 2 and stats["joined"] + stats["late_joined"] == 11
+    assert stats["late_joined"] >= 1 and stats["in_flight"] == 0
+
+
+def test_slow_subscriber_is_detached_without_holding_the_others():
+    _, model, chain = make_chain(first_token_latency=0.0, token_latency=0.005)
+    flights = SingleFlight(buffer=2, stall_timeout=0.05)
+    coalesced = with_coalescing(chain, flights)
+    finished = {}
+
+    async def ask(name, pause):
+        chunks = []
+        async for chunk in coalesced.astream({"question": "q", "history": []}):
+            chunks.append(chunk)
+            await asyncio.sleep(pause)
+        finished[name] = asyncio.get_running_loop().time()
+        return chunks
+
+    async def main():
+        return await asyncio.gather(ask("fast", 0), ask("stalled", 0.1))
+
+    fast, stalled = asyncio.run(main())
+    assert response(fast) == response(stalled) == ANSWER
+    assert finished["stalled"] - finished["fast"] > 0.5
+    assert flights.stats()["detached"] == 1 and model.calls == 1
+
+
+def test_sync_callers_share_a_flight_and_errors_reach_everyone():
+    retriever, model, chain = make_chain()
+    coalesced = with_coalescing(chain, SingleFlight())
+    results = []
+
+    def ask():
+        results.append(response(coalesced.stream({"question": "Where is the registrar?", "history": []})))
+
+    threads = [threading.Thread(target=ask) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == [ANSWER] * 8 and model.calls == 1
+
+    model.error = "throttled"
+    errors = []
+
+    def fail():
+        with pytest.raises(RuntimeError) as e:
+            list(coalesced.stream({"question": "again", "history": []}))
+        errors.append(str(e.value))
+
+    threads = [threading.Thread(target=fail) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == ["throttled"] * 3 and model.calls == 2
+
+
+def test_cancelled_upstream_is_an_error_for_followers():
+    _, model, chain = make_chain()
+    flights = SingleFlight()
+    coalesced = with_coalescing(chain, flights)
+
+    async def ask():
+        return [c async for c in coalesced.astream({"question": "q", "history": []})]
+
+    async def main():
+        model.gate = asyncio.Event()
+        callers = [asyncio.create_task(ask()) for _ in range(2)]
+        while flights.stats()["joined"] < 1:
+            await asyncio.sleep(0.001)
+        (flight,) = flights._async_flights.values()
+        flight.task.cancel()
+        return await asyncio.gather(*callers, return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert [type(r) for r in results] == [RuntimeError, RuntimeError]
+
+
+def test_distinct_sync_requests_are_not_capped_by_a_pool():
+    # Every upstream waits until all of them are running at once
+    running = threading.Barrier(24, timeout=5)
+    flights = SingleFlight()
+    results = []
+
+    def upstream(i):
+        running.wait()
+        yield f"answer {i}"
+
+    def ask(i):
+        results.append(list(flights.stream(("question", i), lambda: upstream(i))))
+
+    threads = [threading.Thread(target=ask, args=(i,)) for i in range(24)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(results) == sorted([f"answer {i}"] for i in range(24))
+    assert flights.stats() == {"flights": 24, "joined": 0, "late_joined": 0, "detached": 0, "in_flight": 0}
+
+
+def test_followers_finish_when_the_leading_caller_leaves():
+    _, model, chain = make_chain(first_token_latency=0.0, token_latency=0.005)
+    flights = SingleFlight()
+    coalesced = with_coalescing(chain, flights)
+    results = []
+
+    def follow():
+        results.append(response(coalesced.stream({"question": "q", "history": []})))
+
+    leader = coalesced.stream({"question": "q", "history": []})
+    next(leader)
+    follower = threading.Thread(target=follow)
+    follower.start()
+    while flights.stats()["late_joined"] < 1:
+        time.sleep(0.001)
+    leader.close()
+    follower.join()
+    assert results == [ANSWER] and model.calls == 1 and flights.stats()["in_flight"] == 0
@@ -0,0 +1,71 @@
+import asyncio
+from typing import List
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from langchain_core.retrievers import BaseRetriever
+
+from rowdy.condense import QueryCondenser, condensed_retrieval, heuristic_condense, needs_condensing
+from rowdy.fakes import LatencyChatModel
+
+HISTORY = [
+    SystemMessage("Summary of the earlier conversation:\n- The student asked: where do I park?"),
+    HumanMessage("How do I apply for on-campus housing?"),
+    AIMessage("Returning students complete the housing application in February."),
+]
+
+
+class EchoRetriever(BaseRetriever):
+    queries: List[str] = []
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        self.queries.append(query)
+        return [Document(page_content=query)]
+
+
+def test_heuristic_condensing():
+    assert not needs_condensing("what about for grad students?", [])
+    assert not needs_condensing("Where is the Registrar's Office?", HISTORY)
+    assert needs_condensing("what about for grad students?", HISTORY)
+    assert needs_condensing("when is it due?", HISTORY)
+
+    assert heuristic_condense("what about for grad students?", HISTORY) == \
+        "How do I apply for on-campus housing for grad students"
+    assert heuristic_condense("when is it due?", HISTORY) == "when is it due apply on-campus housing"
+
+
+def test_rewrite_is_used_and_cached_per_turn():
+    retriever = EchoRetriever()
+    condenser = QueryCondenser()
+    retrieve = condensed_retrieval(retriever, condenser)
+    config = {"configurable": {"session_id": "s1"}}
+
+    documents = retrieve.invoke({"question": "what about for grad students?", "history": HISTORY}, config)
+    assert documents[0].page_content == "How do I apply for on-campus housing for grad students"
+    # The local rewrite is instant: only the standalone query is retrieved
+    assert retriever.queries == [documents[0].page_content]
+
+    retrieve.invoke({"question": "what about for grad students?", "history": HISTORY}, config)
+    assert condenser.stats() == {"condensed": 1, "cached": 1, "fallbacks": 0}
+
+    # Standalone questions skip the condenser
+    assert retrieve.invoke({"question": "Where is the Registrar?", "history": HISTORY})[0].page_content == \
+        "Where is the Registrar?"
+
+
+def test_slow_rewrite_falls_back_to_raw_question():
+    model = LatencyChatModel(response="graduate student housing application", first_token_latency=0.3)
+    condenser = QueryCondenser(model=model, deadline=0.05)
+    retrieve = condensed_retrieval(EchoRetriever(), condenser)
+    request = {"question": "what about for grad students?", "history": HISTORY}
+
+    assert retrieve.invoke(request)[0].page_content == "what about for grad students?"
+    assert condenser.stats()["fallbacks"] == 1
+
+    async def later():
+        await asyncio.sleep(0.35)
+        # Same turn: the finished rewrite is picked up from the cache
+        return await retrieve.ainvoke(request)
+
+    assert asyncio.run(later())[0].page_content == "graduate student housing application"
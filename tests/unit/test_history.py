@@ -0,0 +1,85 @@
+import threading
+import time
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+from rowdy.history import HISTORY_BUDGETS, WindowedChatMessageHistory
+from rowdy.resources import Resources
+from rowdy.sessions import MemorySessionStore, StoredChatMessageHistory
+
+
+def stored():
+    return StoredChatMessageHistory(MemorySessionStore(), "s1", window=None)
+
+
+def add_turns(history, count, start=0):
+    for i in range(start, start + count):
+        history.add_messages([HumanMessage(f"question {i}"), AIMessage(f"answer {i} " + "x" * 200)])
+
+
+def test_keeps_last_turns_and_summarizes_the_rest():
+    calls = []
+
+    def summarizer(summary, messages):
+        calls.append(len(messages))
+        return (summary + " " if summary else "") + ",".join(m.content for m in messages if m.type == "human")
+
+    window = WindowedChatMessageHistory(stored(), max_tokens=10000, max_turns=2, summarizer=summarizer)
+    add_turns(window, 5)
+    messages = window.messages
+    assert isinstance(messages[0], SystemMessage)
+    assert "question 0,question 1,question 2" in messages[0].content
+    assert [m.content for m in messages[1:] if m.type == "human"] == ["question 3", "question 4"]
+
+    # Only the turn that just left the window is summarized
+    add_turns(window, 1, start=5)
+    messages = window.messages
+    assert calls == [6, 2]
+    assert messages[0].content.endswith("question 3")
+
+
+def test_token_budget_bounds_the_window():
+    window = WindowedChatMessageHistory(stored(), max_tokens=200, max_turns=10)
+    add_turns(window, 8)
+    messages = window.messages
+    assert messages[1].type == "human"
+    assert sum(len(m.content) for m in messages[1:]) // 4 <= 200
+
+
+def test_clear_resets_summary():
+    window = WindowedChatMessageHistory(stored(), max_tokens=100, max_turns=1)
+    add_turns(window, 3)
+    assert window.messages[0].type == "system"
+    window.clear()
+    assert window.messages == []
+
+
+def test_budget_and_counter_follow_the_model():
+    assert HISTORY_BUDGETS["ANTHROPIC"] > HISTORY_BUDGETS["OPENAI"] == HISTORY_BUDGETS["ROUTER"]
+    window = Resources({"MODEL": "ANTHROPIC"}).history_window(stored())
+    assert window.max_tokens == HISTORY_BUDGETS["ANTHROPIC"]
+
+    # Two tokens per word instead of the 4-characters estimate
+    window = WindowedChatMessageHistory(stored(), max_tokens=100, max_turns=10,
+                                        count_tokens=lambda text: 2 * len(text.split()))
+    add_turns(window, 8)
+    # 10 tokens a turn: all 8 fit, where the estimate fits only one
+    assert len(window.messages) == 16
+
+
+def test_concurrent_reads_summarize_once():
+    calls = []
+
+    def summarizer(summary, messages):
+        calls.append(len(messages))
+        time.sleep(0.05)
+        return "earlier questions"
+
+    window = WindowedChatMessageHistory(stored(), max_tokens=10000, max_turns=1, summarizer=summarizer)
+    add_turns(window, 3)
+    threads = [threading.Thread(target=lambda: window.messages) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert calls == [4]
@@ -0,0 +1,157 @@
+import json
+
+import boto3
+import pytest
+from botocore.stub import ANY, Stubber
+
+from rowdy.ingest import HostRateLimiter, Manifest, chunk_text, crawl, sync
+from rowdy.text import estimate_tokens
+
+moto = pytest.importorskip("moto")
+
+
+def test_chunks_respect_budget_and_overlap():
+    text = " ".join(f"word{i}" for i in range(1000))
+    chunks = chunk_text(text, max_tokens=100, overlap=20)
+    assert all(estimate_tokens(c) <= 100 for c in chunks)
+    words = [c.split() for c in chunks]
+    assert words[0][0] == "word0" and words[-1][-1] == "word999"
+    for previous, current in zip(words, words[1:]):
+        # Each chunk starts a few words before the end of the previous one
+        assert current[0] in previous and previous.index(current[0]) > len(previous) // 2
+    assert chunk_text("") == []
+
+
+def write_page(source, name, url, body):
+    (source / name).write_text(f"<html><body><nav>menu</nav><h1>{name}</h1><p>{body}</p></body></html>")
+    (source / f"{name}.metadata.json").write_text(json.dumps({"metadataAttributes": {"url": url}}))
+
+
+def test_sync_uploads_only_changes(tmp_path):
+    source = tmp_path / "site"
+    source.mkdir()
+    write_page(source, "registrar.html", "https://www.uml.edu/registrar", "University Crossing, Suite 360. " * 80)
+    write_page(source, "dining.html", "https://www.uml.edu/dining", "Fox Dining Hall opens at 7am.")
+    (source / "notes.txt").write_text("Parking permits are sold online.")
+    manifest = str(tmp_path / "manifest.json")
+
+    with moto.mock_aws():
+        s3 = boto3.client("s3", region_name="us-east-1")
+        s3.create_bucket(Bucket="infobucket")
+        agent = boto3.client("bedrock-agent", region_name="us-east-1")
+
+        def run(processes=1):
+            return sync(str(source), "infobucket", manifest, s3, agent, "KB", "DS", prefix="uml/",
+                        base_url="https://www.uml.edu/", max_tokens=100, overlap=20, processes=processes)
+
+        def expect_job(stub, job_id):
+            stub.add_response("start_ingestion_job", {"ingestionJob": {
+                "ingestionJobId": job_id, "knowledgeBaseId": "KB", "dataSourceId": "DS", "status": "STARTING",
+                "startedAt": "2024-01-01T00:00:00Z", "updatedAt": "2024-01-01T00:00:00Z",
+            }}, {"knowledgeBaseId": "KB", "dataSourceId": "DS", "description": ANY})
+
+        with Stubber(agent) as stub:
+            expect_job(stub, "job-1")
+            first = run(processes=2)
+            stub.assert_no_pending_responses()
+        assert first["chunks"] > 3 and first["uploaded"] == first["chunks"] and first["ingestion_job"] == "job-1"
+        keys = {o["Key"] for o in s3.list_objects_v2(Bucket="infobucket")["Contents"]}
+        assert len(keys) == 2 * first["chunks"]
+        body = s3.get_object(Bucket="infobucket", Key="uml/dining.html/0000.txt")["Body"].read().decode()
+        assert body == "dining.html Fox Dining Hall opens at 7am."
+        sidecar = json.loads(s3.get_object(Bucket="infobucket", Key="uml/notes.txt/0000.txt.metadata.json")["Body"].read())
+        assert sidecar == {"metadataAttributes": {"url": "https://www.uml.edu/notes.txt"}}
+
+        # Nothing changed: no uploads and no ingestion job (the stubber has no responses left)
+        with Stubber(agent):
+            again = run()
+        assert again["uploaded"] == 0 and again["unchanged"] == first["chunks"] and again["ingestion_job"] is None
+
+        write_page(source, "dining.html", "https://www.uml.edu/dining", "Fox Dining Hall opens at 8am.")
+        (source / "notes.txt").unlink()
+        with Stubber(agent) as stub:
+            expect_job(stub, "job-2")
+            third = run()
+        assert third["uploaded"] == 1 and third["deleted"] == 1 and third["ingestion_job"] == "job-2"
+        keys = {o["Key"] for o in s3.list_objects_v2(Bucket="infobucket")["Contents"]}
+        assert not any(k.startswith("uml/notes.txt/") for k in keys)
+        assert set(Manifest(manifest, "infobucket", "uml/").objects) == {k for k in keys if k.endswith(".txt")}
+
+
+def test_crawl_stays_on_site(tmp_path):
+    pages = {
+        "https://www.uml.edu/": ("text/html", b'<a href="/registrar/">R</a><a href="https://example.com/">x</a>'),
+        "https://www.uml.edu/registrar/": ("text/html", b'<a href="hours.pdf#p1">Hours</a><a href="/">home</a>'
+                                                        b'<a href="news.aspx?page=1">1</a><a href="news.aspx?page=2">2</a>'),
+        "https://www.uml.edu/registrar/hours.pdf": ("application/pdf", b"%PDF-1.4"),
+        "https://www.uml.edu/registrar/news.aspx?page=1": ("text/html", b"First page"),
+        "https://www.uml.edu/registrar/news.aspx?page=2": ("text/html", b"Second page"),
+    }
+    fetched = []
+
+    def fetch(url):
+        if url not in pages:
+            raise OSError(f"404 {url}")
+        fetched.append(url)
+        return pages[url]
+
+    assert crawl("https://www.uml.edu/", str(tmp_path), fetch=fetch, delay=0) == 5
+    assert sorted(fetched) == sorted(pages)
+    assert (tmp_path / "registrar" / "hours.pdf").read_bytes() == b"%PDF-1.4"
+    sidecar = json.loads((tmp_path / "registrar" / "index.html.metadata.json").read_text())
+    assert sidecar["metadataAttributes"]["url"] == "https://www.uml.edu/registrar/"
+    # Pages that differ only by query string are saved separately
+    news = (tmp_path / "registrar").glob("news.aspx-*.html")
+    assert sorted(path.read_bytes() for path in news) == [b"First page", b"Second page"]
+
+
+def test_crawl_honors_robots_txt(tmp_path):
+    pages = {
+        "https://www.uml.edu/robots.txt": ("text/plain", b"User-agent: *\nDisallow: /private/\nCrawl-delay: 2\n"),
+        "https://www.uml.edu/": ("text/html", b'<a href="/private/grades">G</a><a href="/registrar/">R</a>'),
+        "https://www.uml.edu/registrar/": ("text/html", b"Registrar"),
+    }
+    fetched = []
+    sleeps = []
+
+    def fetch(url):
+        fetched.append(url)
+        return pages[url]
+
+    limiter = HostRateLimiter(delay=0.5, clock=lambda: 0.0, sleep=sleeps.append)
+    assert crawl("https://www.uml.edu/", str(tmp_path), fetch=fetch, limiter=limiter, workers=1) == 3
+    assert "https://www.uml.edu/private/grades" not in fetched
+    # The robots.txt Crawl-delay is longer than the configured delay
+    assert limiter.delay == 2 and sleeps == [2.0]
+
+
+def test_rate_limiter_spaces_requests_per_host():
+    now = [0.0]
+    sleeps = []
+    limiter = HostRateLimiter(delay=1.0, clock=lambda: now[0], sleep=sleeps.append)
+    for url in ["https://www.uml.edu/a", "https://www.uml.edu/b", "https://other.edu/", "https://www.uml.edu/c"]:
+        limiter.wait(url)
+    assert sleeps == [1.0, 2.0]
+    now[0] = 10.0
+    limiter.wait("https://www.uml.edu/d")
+    assert sleeps == [1.0, 2.0]
+
+
+def test_sync_skips_pdfs_without_pypdf(tmp_path, monkeypatch, caplog):
+    monkeypatch.setattr("rowdy.ingest.pdf_support", lambda: False)
+    source = tmp_path / "site"
+    source.mkdir()
+    (source / "catalog.pdf").write_bytes(b"%PDF-1.4")
+    (source / "notes.txt").write_text("Parking permits are sold online.")
+    manifest = Manifest(str(tmp_path / "manifest.json"), "infobucket")
+    # Chunks from a sync that could read the PDF
+    manifest.objects = {"catalog.pdf/0000.txt": "hash"}
+    manifest.save()
+
+    with moto.mock_aws():
+        s3 = boto3.client("s3", region_name="us-east-1")
+        s3.create_bucket(Bucket="infobucket")
+        result = sync(str(source), "infobucket", manifest.path, s3, processes=1)
+    assert result["uploaded"] == 1 and result["deleted"] == 0
+    assert "catalog.pdf/0000.txt" in Manifest(manifest.path, "infobucket").objects
+    assert "pypdf is not installed" in caplog.text
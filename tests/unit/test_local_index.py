@@ -0,0 +1,27 @@
+import json
+
+from rowdy.local_index import HashingEmbeddings, LocalIndex, LocalKnowledgeBaseRetriever, build_index, read_export
+
+
+def test_build_and_query_export(tmp_path):
+    export = tmp_path / "export"
+    export.mkdir()
+    (export / "registrar.txt").write_text("The Registrar's Office is in University Crossing, Suite 360.")
+    (export / "registrar.txt.metadata.json").write_text(
+        json.dumps({"metadataAttributes": {"url": "https://www.uml.edu/registrar"}})
+    )
+    (export / "dining.html").write_text("<h1>Dining</h1><script>x()</script><p>Fox Dining Hall opens at 7am.</p>")
+    (export / "logo.png").write_bytes(b"\x89PNG")
+
+    rows = list(read_export(str(export), "infobucket"))
+    assert len(rows) == 2
+    for dtype, lists in [("float32", 0), ("float16", 2)]:
+        index_dir = str(tmp_path / f"index-{dtype}")
+        build_index([t for t, _ in rows], [c for _, c in rows], HashingEmbeddings(), index_dir, dtype=dtype, ivf_lists=lists)
+
+        retriever = LocalKnowledgeBaseRetriever(index=LocalIndex(index_dir), embeddings=HashingEmbeddings(), k=2)
+        documents = retriever.invoke("Where is the Registrar's Office?")
+        assert documents[0].metadata["source_metadata"]["url"] == "https://www.uml.edu/registrar"
+        assert documents[0].page_content.startswith("The Registrar")
+        assert documents[1].metadata["location"]["s3Location"]["uri"] == "s3://infobucket/dining.html"
+        assert documents[1].page_content == "Dining\nFox Dining Hall opens at 7am."
@@ -0,0 +1,39 @@
+from langchain_core.documents import Document
+
+from rowdy.packing import ContextPacker
+
+
+def doc(text, score, url):
+    return Document(page_content=text, metadata={"score": score, "source_metadata": {"url": url}, "location": {}})
+
+
+REGISTRAR = (
+    "The Office of the Registrar is located in University Crossing, Suite 360. "
+    "Hours are Monday through Friday from 8:30 a.m. to 5 p.m. and you can reach them by phone."
+)
+
+
+def test_drops_near_duplicates_and_weak_hits():
+    documents = [
+        doc(REGISTRAR, 0.9, "https://www.uml.edu/registrar"),
+        doc(REGISTRAR.replace("by phone.", "by phone or email."), 0.85, "https://www.uml.edu/registrar/contact"),
+        doc("Add/drop ends on the fifth day of classes each semester.", 0.7, "https://www.uml.edu/registrar"),
+        doc("Parking permits are sold online.", 0.1, "https://www.uml.edu/parking"),
+    ]
+    packed = ContextPacker(min_score=0.2).pack(documents)
+
+    assert len(packed.documents) == 2
+    assert "parking" not in packed.text.lower()
+    # Both kept chunks share one URL header
+    assert packed.text.count("https://www.uml.edu/registrar") == 1
+    assert packed.text.startswith("[1] https://www.uml.edu/registrar\nThe Office")
+    assert packed.tokens_saved > 0
+
+
+def test_respects_token_budget():
+    documents = [doc(f"chunk {i} " + "word " * 100, 1 - i / 20, f"https://u/{i}") for i in range(12)]
+    packer = ContextPacker(max_tokens=400)
+    packed = packer.pack(documents)
+    assert packed.tokens <= 400
+    assert [d.page_content.split()[1] for d in packed.documents] == ["0", "1", "2"]
+    assert packer.stats()["requests"] == 1
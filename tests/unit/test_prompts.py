@@ -0,0 +1,65 @@
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+from rowdy.prompts import SYSTEM_PROMPT, PromptAssembler, build_prompt, supports_cache_markers, token_counter
+from rowdy.resources import Resources
+from rowdy.text import estimate_tokens
+
+HISTORY = [HumanMessage("Where is the registrar?"), AIMessage("University Crossing, Suite 360.")]
+
+
+def test_static_prefix_is_identical_across_requests():
+    prompt = build_prompt()
+    first = prompt.invoke({"question": "When is add/drop?", "history": [], "context": "Add/drop ends Friday."})
+    second = prompt.invoke({"question": "Parking?", "history": HISTORY, "context": "Permits are sold online."})
+
+    # Same system message object; context and question only in the last message
+    assert first.messages[0] is second.messages[0]
+    assert first.messages[0].content == SYSTEM_PROMPT
+    assert second.messages[1:3] == HISTORY
+    assert second.messages[-1].content == "Search results:\nPermits are sold online.\n\nQuestion: Parking?"
+
+
+def test_cache_markers_on_system_and_end_of_history():
+    assembler = PromptAssembler(cache_markers=True)
+    messages = assembler.messages({"question": "And parking?", "history": HISTORY, "context": "..."})
+
+    assert messages[0].content[0]["cache_control"] == {"type": "ephemeral"}
+    assert messages[2].content == [{"type": "text", "text": "University Crossing, Suite 360.",
+                                    "cache_control": {"type": "ephemeral"}}]
+    assert HISTORY[1].content == "University Crossing, Suite 360."
+    assert isinstance(messages[-1].content, str)
+
+    # The Bedrock Anthropic formatter keeps the markers, and the running
+    # summary merges into the system prompt after the marked block
+    from langchain_aws.chat_models.bedrock import _format_anthropic_messages
+    summary = SystemMessage("Summary of the earlier conversation:\n- The student asked: hours?")
+    system, formatted = _format_anthropic_messages(
+        assembler.messages({"question": "And parking?", "history": [summary, *HISTORY], "context": "..."})
+    )
+    assert system[0]["cache_control"] == {"type": "ephemeral"} and system[0]["text"] == SYSTEM_PROMPT
+    assert formatted[1]["content"][-1]["cache_control"] == {"type": "ephemeral"}
+
+
+def test_cache_markers_only_on_models_with_prompt_caching():
+    assert supports_cache_markers("ANTHROPIC", "anthropic.claude-3-7-sonnet-20250219-v1:0")
+    assert supports_cache_markers("ANTHROPIC", "us.anthropic.claude-sonnet-4-20250514-v1:0")
+    assert not supports_cache_markers("ANTHROPIC", "anthropic.claude-3-haiku-20240307-v1:0")
+    assert not supports_cache_markers("ROUTER", "anthropic.claude-3-7-sonnet-20250219-v1:0")
+
+    # The default model ID has no prompt caching: messages stay unmarked
+    prompt = Resources({"MODEL": "ANTHROPIC", "PROMPT_CACHE": "true"}).prompt
+    messages = prompt.invoke({"question": "And parking?", "history": HISTORY, "context": "..."}).messages
+    assert messages[0].content == SYSTEM_PROMPT and messages[2].content == HISTORY[1].content
+
+
+def test_token_counts_per_segment_and_model():
+    assembler = PromptAssembler()
+    inputs = {"question": "Parking?", "history": HISTORY, "context": "Permits are sold online."}
+    counts = assembler.token_counts(inputs, "ANTHROPIC")
+
+    assert counts["system"] == estimate_tokens(SYSTEM_PROMPT)
+    assert counts["cacheable"] == counts["system"] + counts["history"]
+    assert counts["total"] == sum(counts[k] for k in ("system", "history", "template", "context", "question"))
+    assert ("system", "ANTHROPIC") in assembler._counts
+    assert token_counter("OPENAI") is token_counter("OPENAI")
+    assert assembler.token_counts(inputs, "OPENAI")["question"] > 0
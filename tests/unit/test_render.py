@@ -0,0 +1,30 @@
+from rowdy.render import StreamRenderer
+
+
+class RecordingPlaceholder:
+    def __init__(self):
+        self.bodies = []
+
+    def markdown(self, body):
+        self.bodies.append(body)
+
+
+def test_flushes_on_size_and_time_and_close():
+    now = [0.0]
+    placeholder = RecordingPlaceholder()
+    renderer = StreamRenderer(placeholder, interval=0.05, min_chars=10, clock=lambda: now[0])
+
+    renderer.write("It costs ")
+    assert placeholder.bodies == []
+    renderer.write("$5")
+    assert placeholder.bodies == [r"It costs \$5"]
+
+    renderer.write(" a")
+    now[0] = 0.06
+    renderer.write(" day")
+    assert placeholder.bodies[-1] == r"It costs \$5 a day"
+
+    renderer.write(".")
+    assert renderer.close() == "It costs $5 a day."
+    assert placeholder.bodies[-1] == r"It costs \$5 a day."
+    assert renderer.flushes == 3
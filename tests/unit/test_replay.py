@@ -0,0 +1,48 @@
+import httpx
+
+from rowdy.fakes import sample_documents
+from rowdy.replay import (
+    Cassette,
+    RecordingBedrockClient,
+    RecordingTransport,
+    ReplayBedrockClient,
+    ReplayTransport,
+    install_replay,
+    retrieval_results,
+    synthetic_cassette,
+)
+from rowdy.resources import Resources
+
+ANSWER = "Go River Hawks!"
+
+
+def make_cassette():
+    return synthetic_cassette(ANSWER, retrieval_results(sample_documents(3)), retrieval_ms=0, first_token_ms=0, token_ms=0)
+
+
+def test_replayed_backends_drive_the_real_chain():
+    for model in ["ANTHROPIC", "OPENAI"]:
+        resources = Resources({"MODEL": model, "KB_ID": "x", "OPENAI_API_KEY": "sk-x"})
+        install_replay(resources, make_cassette())
+        chunks = list(resources.chain.stream({"question": f"go {model}", "history": []}))
+        assert "".join(c.get("response", "") for c in chunks) == ANSWER
+        context = [c["context"] for c in chunks if "context" in c][0]
+        assert context[0].metadata["source_metadata"]["url"] == "https://www.uml.edu/page-0.aspx"
+
+
+def test_recording_round_trips():
+    source = make_cassette()
+    recorded = Cassette()
+    bedrock = RecordingBedrockClient(ReplayBedrockClient(source), recorded)
+    bedrock.retrieve(retrievalQuery={"text": "registrar"}, knowledgeBaseId="x")
+    events = list(bedrock.invoke_model_with_response_stream(body="{}", modelId="m")["body"])
+    with httpx.Client(transport=RecordingTransport(recorded, ReplayTransport(source))) as client:
+        client.get("https://api.openai.com/v1/chat/completions").read()
+
+    assert recorded.data["retrieve"][0]["query"] == "registrar"
+    assert [e[1] for e in recorded.data["bedrock"][0]["events"]] == [e[1] for e in source.data["bedrock"][0]["events"]]
+    assert len(events) == len(source.data["bedrock"][0]["events"])
+    assert "".join(e[1] for e in recorded.data["openai"][0]["events"]) == \
+        "".join(e[1] for e in source.data["openai"][0]["events"])
+    replayed = ReplayBedrockClient(recorded).retrieve(retrievalQuery={"text": "registrar"})
+    assert len(replayed["retrievalResults"]) == 3
@@ -0,0 +1,62 @@
+import time
+
+from langchain_core.documents import Document
+
+from rowdy.fakes import LatencyRetriever
+from rowdy.packing import ContextPacker
+from rowdy.rerank import BM25Reranker, RerankingRetriever
+
+
+def doc(text, score):
+    return Document(page_content=text, metadata={"score": score})
+
+
+DOCUMENTS = [
+    doc("Campus shuttle schedule and stops.", 0.61),
+    doc("Dining hall hours for Fox and Inn & Conference Center.", 0.60),
+    doc("Parking permits for commuter students are sold online.", 0.58),
+]
+
+
+def test_bm25_promotes_lexical_match():
+    retriever = RerankingRetriever(
+        retriever=LatencyRetriever(documents=DOCUMENTS, latency=0),
+        reranker=BM25Reranker(),
+        top_n=2,
+    )
+    documents = retriever.invoke("How do commuter students get a parking permit?")
+    assert documents[0].page_content.startswith("Parking permits")
+    assert len(documents) == 2 and retriever.stats()["reranked"] == 1
+
+
+def test_over_budget_keeps_original_order():
+    class SlowReranker:
+        def score(self, query, documents, deadline=None):
+            time.sleep(0.02)
+            return [0.0, 0.0, 1.0]
+
+    retriever = RerankingRetriever(
+        retriever=LatencyRetriever(documents=DOCUMENTS, latency=0),
+        reranker=SlowReranker(),
+        top_n=2,
+        latency_budget=0.005,
+    )
+    documents = retriever.invoke("parking")
+    assert [d.metadata["score"] for d in documents] == [0.61, 0.60]
+    assert retriever.stats()["fallbacks"] == 1
+
+
+def test_packer_keeps_the_rerank_order():
+    retriever = RerankingRetriever(
+        retriever=LatencyRetriever(documents=DOCUMENTS, latency=0),
+        reranker=BM25Reranker(alpha=1.0),
+        top_n=3,
+    )
+    documents = retriever.invoke("How do commuter students get a parking permit?")
+    # Rerank order disagrees with the vector scores
+    assert documents[0].metadata["score"] == 0.58 and "rerank_score" in documents[0].metadata
+    packed = ContextPacker(max_tokens=1000).pack(documents)
+    assert [d.page_content for d in packed.documents] == [d.page_content for d in documents]
+    assert packed.text.startswith("[1]\nParking permits")
+    # The cached originals are left as they were
+    assert "rerank_score" not in DOCUMENTS[2].metadata
@@ -0,0 +1,36 @@
+import threading
+
+from rowdy.resources import Resources
+
+SETTINGS = {
+    "MODEL": "ANTHROPIC",
+    "KB_ID": "TESTKBID",
+    "AWS_ACCESS_KEY_ID": "AKIATEST",
+    "AWS_SECRET_ACCESS_KEY": "test",
+    "BOTO_MAX_POOL_CONNECTIONS": "7",
+}
+
+
+def test_resources_are_built_once():
+    resources = Resources(SETTINGS)
+    chains = []
+    threads = [threading.Thread(target=lambda: chains.append(resources.chain)) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert all(chain is chains[0] for chain in chains)
+    assert resources.retriever is resources.retriever
+    assert resources.model.client is resources.bedrock_runtime
+    assert resources.bedrock_runtime.meta.config.max_pool_connections == 7
+
+
+def test_optional_stages_follow_settings():
+    resources = Resources({**SETTINGS, "RERANKER": "bm25", "SPECULATIVE_RETRIEVAL": "true"})
+    assert type(resources.retriever).__name__ == "SpeculativeRetriever"
+    assert type(resources.retriever.retriever).__name__ == "RerankingRetriever"
+    assert not resources.async_mode
+
+    resources = Resources({**SETTINGS, "COALESCE": "true"})
+    assert resources.chain.name == "coalesce" and resources.flights.buffer == 64
+    assert Resources(SETTINGS).flights is None
@@ -0,0 +1,94 @@
+from typing import List
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from rowdy.adaptive import AdaptiveRetriever
+from rowdy.resources import Resources
+from rowdy.retrieval import CachingRetriever, RetrievalCache, retriever_scope
+
+
+class CountingRetriever(BaseRetriever):
+    calls: List[str] = []
+    retrieval_config: dict = {"vectorSearchConfiguration": {"numberOfResults": 12}}
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        self.calls.append(query)
+        return [Document(page_content=f"about {query}", metadata={"score": 0.5, "source_metadata": {"url": "u"}})]
+
+
+class DepthRetriever(BaseRetriever):
+    k: int = 12
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        return [Document(page_content=f"{query} {i}", metadata={"score": 0.5}) for i in range(self.k)]
+
+
+def test_memory_tier_and_generation_bump():
+    inner = CountingRetriever(calls=[])
+    cache = RetrievalCache()
+    retriever = CachingRetriever(retriever=inner, cache=cache)
+
+    retriever.invoke("Where is the Registrar?")
+    retriever.invoke("where is the registrar")
+    assert len(inner.calls) == 1
+
+    cache.bump_generation()
+    retriever.invoke("where is the registrar")
+    assert len(inner.calls) == 2
+
+
+def test_sqlite_tier_survives_restart(tmp_path):
+    path = str(tmp_path / "retrieval.db")
+    inner = CountingRetriever(calls=[])
+    CachingRetriever(retriever=inner, cache=RetrievalCache(path=path)).invoke("dining hours")
+
+    restarted = CachingRetriever(retriever=inner, cache=RetrievalCache(path=path, generation_ttl=0))
+    documents = restarted.invoke("Dining hours?")
+    assert len(inner.calls) == 1
+    assert documents[0].metadata["source_metadata"]["url"] == "u"
+
+    # Another process bumps the generation after a sync
+    RetrievalCache(path=path).bump_generation()
+    restarted.invoke("dining hours")
+    assert len(inner.calls) == 2
+
+
+def test_triage_paths_share_the_cache_without_mixing_depths(monkeypatch):
+    monkeypatch.setattr(Resources, "build_base_retriever", lambda self, n=None: DepthRetriever(k=n or 12))
+    resources = Resources({"MODEL": "ANTHROPIC", "RETRIEVER": "LOCAL", "TRIAGE": "true"})
+    for _ in range(2):
+        assert len(resources.retriever.invoke("library hours")) == 12
+        assert len(resources.factoid_retriever.invoke("library hours")) == 3
+    assert (resources.retrieval_cache.hits, resources.retrieval_cache.misses) == (2, 2)
+
+    # Same namespace, different depth: still separate
+    cache = RetrievalCache()
+    assert cache.key("q", "", *retriever_scope(DepthRetriever(k=3))) != \
+        cache.key("q", "", *retriever_scope(DepthRetriever(k=12)))
+
+
+def test_adaptive_cut_offs_are_part_of_the_scope():
+    def scope(**settings):
+        return retriever_scope(AdaptiveRetriever(pager=lambda *args: None, **settings))
+
+    assert scope()[:2] == ["AdaptiveRetriever", "adaptive"] and retriever_scope(DepthRetriever())[1] == "fixed"
+    assert scope() == scope(drop_off=0.1, min_score=0.5)
+    assert scope(drop_off=0.2) != scope()
+    assert scope(min_score=0.7) != scope()
+
+
+def test_generation_is_reread_after_its_ttl(tmp_path):
+    path = str(tmp_path / "retrieval.db")
+    now = [0.0]
+    cache = RetrievalCache(path=path, clock=lambda: now[0])
+    assert cache.generation == "0.0"
+    RetrievalCache(path=path).bump_generation()
+    assert cache.generation == "0.0"
+    now[0] += 1
+    assert cache.generation == "0.1"
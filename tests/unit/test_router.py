@@ -0,0 +1,106 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from langchain_core.messages import AIMessageChunk
+from langchain_core.outputs import ChatGenerationChunk
+
+from rowdy.fakes import LatencyChatModel
+from rowdy.resources import Resources
+from rowdy.router import Backend, CircuitBreaker, RoutingChatModel
+
+
+def model(response, first_token=0.0, error=None):
+    return LatencyChatModel(response=response, first_token_latency=first_token, token_latency=0, error=error)
+
+
+def test_hedges_slow_backend_and_cancels_it():
+    slow, fast = model("slow answer", first_token=0.5), model("fast answer")
+    router = RoutingChatModel(backends=[Backend("slow", slow), Backend("fast", fast)], hedge_after=0.05)
+    start = time.perf_counter()
+    text = "".join(chunk.text for chunk in router.stream("hi"))
+    assert text == "fast answer"
+    assert time.perf_counter() - start < 0.4
+    assert router.stats()["hedges"] == 1 and router.stats()["hedge_wins"] == 1
+    time.sleep(0.6)
+    # The loser was cancelled, so it counts neither as a success nor a failure
+    assert router.stats()["backends"]["slow"] == {"state": "closed", "in_flight": 0, "ttft_p50_ms": None, "error_rate": 0.0}
+
+
+class StuckChatModel(LatencyChatModel):
+    # Blocks before its first token until `release` is set, like a call
+    # that is still waiting on the provider
+    release: threading.Event
+    closed: threading.Event
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        try:
+            self.release.wait()
+            while True:
+                yield ChatGenerationChunk(message=AIMessageChunk(content="stuck "))
+        finally:
+            self.closed.set()
+
+
+def test_loser_that_never_yields_frees_its_slot_and_is_closed():
+    stuck = StuckChatModel(response="", release=threading.Event(), closed=threading.Event())
+    router = RoutingChatModel(backends=[Backend("stuck", stuck, max_concurrency=1), Backend("fast", model("fast answer"))],
+                              hedge_after=0.05)
+    assert "".join(chunk.text for chunk in router.stream("hi")) == "fast answer"
+    # The slot is free while the call is still blocked
+    assert router.stats()["backends"]["stuck"]["in_flight"] == 0
+    assert router.backends[0].acquire()
+    router.backends[0].release()
+    # and the stream is closed as soon as the call returns, not read to the end
+    stuck.release.set()
+    assert stuck.closed.wait(1)
+    assert router.stats()["backends"]["stuck"] == {"state": "closed", "in_flight": 0, "ttft_p50_ms": None, "error_rate": 0.0}
+
+
+def test_fails_over_and_opens_the_breaker():
+    broken, backup = model("x", error="throttled"), model("backup answer")
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    router = RoutingChatModel(backends=[Backend("broken", broken, breaker=breaker), Backend("backup", backup)])
+    for _ in range(3):
+        assert router.invoke("hi").content == "backup answer"
+    assert broken.calls == 2
+    assert breaker.state == "open"
+    assert router.stats()["failovers"] == 2
+
+    router = RoutingChatModel(backends=[Backend("broken", model("x", error="throttled"))])
+    with pytest.raises(RuntimeError, match="throttled"):
+        router.invoke("hi")
+
+
+def test_concurrency_cap_spills_over():
+    primary, secondary = model("primary", first_token=0.2), model("secondary")
+    router = RoutingChatModel(backends=[Backend("primary", primary, max_concurrency=1), Backend("secondary", secondary)])
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(router.invoke("hi").content)) for _ in range(2)]
+    for t in threads:
+        t.start()
+        time.sleep(0.05)
+    for t in threads:
+        t.join()
+    assert sorted(results) == ["primary", "secondary"]
+
+
+def test_async_hedging():
+    slow, fast = model("slow answer", first_token=0.5), model("fast answer")
+    router = RoutingChatModel(backends=[Backend("slow", slow), Backend("fast", fast)], hedge_after=0.05)
+
+    async def run():
+        return "".join([chunk.text async for chunk in router.astream("hi")])
+
+    start = time.perf_counter()
+    assert asyncio.run(run()) == "fast answer"
+    assert time.perf_counter() - start < 0.4
+
+
+def test_router_from_settings():
+    resources = Resources({"MODEL": "ROUTER", "OPENAI_API_KEY": "sk-test", "AWS_ACCESS_KEY_ID": "a",
+                           "AWS_SECRET_ACCESS_KEY": "b", "ROUTER_HEDGE_MS": "800"})
+    assert [b.name for b in resources.model.backends] == ["ANTHROPIC", "OPENAI"]
+    assert resources.model.hedge_after == 0.8
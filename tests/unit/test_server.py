@@ -0,0 +1,63 @@
+import json
+
+from fastapi.testclient import TestClient
+
+from rowdy.chain import build_chain
+from rowdy.fakes import LatencyChatModel, LatencyRetriever, sample_documents
+from rowdy.server import create_app
+
+
+def make_client():
+    chain = build_chain(
+        LatencyRetriever(documents=sample_documents(3), latency=0),
+        LatencyChatModel(first_token_latency=0, token_latency=0),
+    )
+    return TestClient(create_app(chain=chain))
+
+
+def events(response):
+    parsed = []
+    for block in response.text.strip().split("\n\n"):
+        event, data = block.split("\n")
+        parsed.append((event[len("event: "):], json.loads(data[len("data: "):])))
+    return parsed
+
+
+def test_chat_streams_tokens_and_citations():
+    with make_client() as client:
+        assert client.get("/healthz").status_code == 200
+        assert client.get("/readyz").json()["ready"]
+        response = client.post("/chat", json={"question": "Where is the registrar?"})
+    assert response.headers["content-type"].startswith("text/event-stream")
+    parsed = events(response)
+    assert parsed[0][0] == "session"
+    assert parsed[-1] == ("done", {})
+    citations = [data for event, data in parsed if event == "citations"]
+    assert sorted(c["url"] for c in citations[0]) == [f"https://www.uml.edu/page-{i}.aspx" for i in range(3)]
+    # Compact form: a snippet and chunk id, not the page content
+    assert set(citations[0][0]) == {"url", "score", "chunk_id", "snippet"}
+    text = "".join(data["text"] for event, data in parsed if event == "token")
+    assert text == "The Registrar's Office is in University Crossing, Suite 360."
+
+
+def test_history_is_kept_per_session():
+    with make_client() as client:
+        session = events(client.post("/chat", json={"question": "first"}))[0][1]["session_id"]
+        client.post("/chat", json={"question": "second", "session_id": session})
+        parsed = events(client.post("/chat", json={"question": "other"}))
+        history = client.app.state.get_session_history
+    new_session = parsed[0][1]["session_id"]
+    assert new_session != session
+    assert [m.content for m in history(session).messages][::2] == ["first", "second"]
+    assert len(history(new_session).messages) == 2
+
+
+def test_client_chosen_session_ids_are_rejected():
+    with make_client() as client:
+        session = events(client.post("/chat", json={"question": "first"}))[0][1]["session_id"]
+        forged = session.split(".")[0] + "." + "0" * 64
+        for session_id in ["a", session.split(".")[0], forged]:
+            response = client.post("/chat", json={"question": "second", "session_id": session_id})
+            assert response.status_code == 403
+        history = client.app.state.get_session_history
+    assert len(history(session).messages) == 2
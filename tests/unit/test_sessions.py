@@ -0,0 +1,139 @@
+import threading
+import time
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+
+from rowdy.history import WindowedChatMessageHistory
+from rowdy.resources import Resources
+from rowdy.sessions import (
+    MemorySessionStore, RedisSessionStore, SessionStore, SQLiteSessionStore, StoredChatMessageHistory,
+)
+
+
+def turn(i):
+    return [HumanMessage(f"question {i}"), AIMessage(f"answer {i}")]
+
+
+@pytest.fixture(params=["memory", "sqlite", "redis"])
+def store(request, tmp_path):
+    match request.param:
+        case "memory":
+            return MemorySessionStore()
+        case "sqlite":
+            return SQLiteSessionStore(str(tmp_path / "sessions.db"))
+        case "redis":
+            fakeredis = pytest.importorskip("fakeredis")
+            return RedisSessionStore(fakeredis.FakeRedis())
+
+
+def test_store_appends_and_loads_recent_window(store):
+    for i in range(5):
+        store.append("s1", turn(i))
+    store.append("s2", turn(99))
+    assert [m.content for m in store.load("s1", 3)] == ["answer 3", "question 4", "answer 4"]
+    assert isinstance(store.load("s1", 3)[1], HumanMessage)
+    assert len(store.load("s1")) == 10
+    store.clear("s1")
+    assert store.load("s1") == []
+    assert [m.content for m in store.load("s2")] == ["question 99", "answer 99"]
+
+
+def test_history_loads_once_and_writes_through(store):
+    store.append("s", turn(0))
+    loads = []
+    load = store.load
+    store.load = lambda *args: loads.append(args) or load(*args)
+    history = StoredChatMessageHistory(store, "s", window=4)
+    history.add_messages(turn(1))
+    assert len(history.messages) == 4
+    history.add_messages(turn(2))
+    assert [m.content for m in history.messages][-2:] == ["question 2", "answer 2"]
+    assert loads == [("s", 4)]
+    assert len(load("s")) == 6
+    # Only the window stays in memory
+    assert history.offset == 2 and store.length("s") == 6
+
+
+def test_window_keeps_summarizing_over_a_trimmed_history(store):
+    folded = []
+
+    def summarizer(summary, messages):
+        folded.extend(m.content for m in messages if m.type == "human")
+        return ",".join(folded)
+
+    window = WindowedChatMessageHistory(StoredChatMessageHistory(store, "s", window=6),
+                                        max_turns=2, summarizer=summarizer)
+    for i in range(8):
+        window.add_messages(turn(i))
+        messages = window.messages
+        recent = [f"question {j}" for j in range(max(0, i - 1), i + 1)]
+        assert [m.content for m in messages if m.type == "human"] == recent
+    assert folded == [f"question {i}" for i in range(6)]
+    assert len(window.store.messages) == 6 and window.summarized == 12
+
+
+def test_sqlite_sessions_expire(tmp_path):
+    now = [1000.0]
+    store = SQLiteSessionStore(str(tmp_path / "sessions.db"), ttl=60, clock=lambda: now[0])
+    store.append("old", turn(0))
+    now[0] += 30
+    store.append("new", turn(0))
+    now[0] += 45
+    assert store.load("old") == []
+    assert len(store.load("new")) == 2
+    store.expire()
+    now[0] += 100
+    store.expire()
+    assert store._db.execute("SELECT COUNT(*) FROM session_messages").fetchone()[0] == 0
+
+
+def test_resources_keep_sessions_apart(tmp_path):
+    resources = Resources({"MODEL": "ANTHROPIC", "SESSION_STORE": "sqlite",
+                           "SESSION_DB_PATH": str(tmp_path / "sessions.db")})
+    resources.session_history("a").add_messages(turn(0))
+    assert resources.session_history("a") is resources.session_history("a")
+    assert resources.session_history("b").messages == []
+    resources.open_sessions.clear()
+    assert [m.content for m in resources.session_history("a").messages] == ["question 0", "answer 0"]
+
+
+def test_concurrent_requests_share_one_session_history(monkeypatch):
+    resources = Resources({"MODEL": "ANTHROPIC"})
+    build = resources.history_window
+
+    def slow_build(store):
+        time.sleep(0.05)
+        return build(store)
+
+    monkeypatch.setattr(resources, "history_window", slow_build)
+    histories = []
+    threads = [threading.Thread(target=lambda: histories.append(resources.session_history("a"))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len({id(h) for h in histories}) == 1
+    with pytest.raises(TypeError):
+        SessionStore()
+
+
+def test_summary_outlives_the_open_session(store):
+    def open_window():
+        return WindowedChatMessageHistory(StoredChatMessageHistory(store, "s", window=6), max_turns=2)
+
+    window = open_window()
+    for i in range(5):
+        window.messages
+        window.add_messages(turn(i))
+    assert "question 2" in window.messages[0].content and window.summarized == 6
+
+    # Another process (or this one after SESSION_CACHE_TTL) opens the session
+    reopened = open_window()
+    reopened.add_messages(turn(5))
+    messages = reopened.messages
+    assert all(f"question {i}" in messages[0].content for i in range(4))
+    assert [m.content for m in messages if m.type == "human"] == ["question 4", "question 5"]
+    assert store.load_summary("s") == (reopened.summary, 8)
+    store.clear("s")
+    assert store.load_summary("s") is None
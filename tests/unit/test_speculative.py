@@ -0,0 +1,87 @@
+import ast
+import time
+from pathlib import Path
+
+from langchain_core.runnables.history import RunnableWithMessageHistory
+
+from rowdy.fakes import LatencyChatModel, LatencyRetriever, sample_documents
+from rowdy.resources import Resources
+from rowdy.speculative import SpeculativeRetriever
+
+
+def test_prefetched_result_is_used_once():
+    base = LatencyRetriever(documents=sample_documents(3), latency=0.05)
+    retriever = SpeculativeRetriever(retriever=base)
+
+    retriever.prefetch("Where is the Registrar?")
+    start = time.perf_counter()
+    time.sleep(0.05)
+    documents = retriever.invoke("where is the registrar")
+    assert time.perf_counter() - start < 0.09
+    assert len(documents) == 3 and base.calls == 1
+
+    retriever.invoke("where is the registrar")
+    assert base.calls == 2
+    assert retriever.stats()["used"] == 1
+
+
+def test_mismatched_prefetch_is_not_used():
+    base = LatencyRetriever(documents=sample_documents(3), latency=0)
+    retriever = SpeculativeRetriever(retriever=base, ttl=0.01)
+    retriever.prefetch("dining hours")
+    retriever.invoke("parking permits")
+    time.sleep(0.02)
+    retriever.invoke("dining hours")
+    assert base.calls == 3 and retriever.stats()["used"] == 0
+
+
+
+def app_resources(**settings):
+    resources = Resources({"MODEL": "ANTHROPIC", "SPECULATIVE_RETRIEVAL": "true", **settings})
+    base = LatencyRetriever(documents=sample_documents(3), latency=0)
+    resources.__dict__.update(
+        retriever=SpeculativeRetriever(retriever=base),
+        model=LatencyChatModel(response="Apply on the housing portal.", first_token_latency=0, token_latency=0),
+    )
+    chain = RunnableWithMessageHistory(resources.chain, resources.session_history, input_messages_key="question",
+                                       history_messages_key="history", output_messages_key="response")
+    return resources, chain, base
+
+
+def ask(resources, chain, question):
+    resources.prefetch(question, "s1")
+    list(chain.stream({"question": question}, {"configurable": {"session_id": "s1"}}))
+
+
+def test_follow_up_is_prefetched_as_its_standalone_rewrite():
+    resources, chain, base = app_resources()
+    ask(resources, chain, "How do I apply for on-campus housing?")
+    ask(resources, chain, "what about for grad students?")
+    # Both turns found their prefetch: one Retrieve call each
+    assert base.calls == 2 and resources.retriever.stats()["used"] == 2
+
+
+def test_follow_up_is_not_prefetched_before_a_model_rewrite():
+    resources, chain, base = app_resources(CONDENSE="model")
+    resources.__dict__["condenser"].model = LatencyChatModel(response="graduate housing application",
+                                                             first_token_latency=0, token_latency=0)
+    ask(resources, chain, "How do I apply for on-campus housing?")
+    ask(resources, chain, "what about for grad students?")
+    assert resources.retriever.stats()["prefetched"] == 1
+
+
+def test_app_prefetches_before_rendering_messages():
+    # rowdy_stream.py: inside the admitted turn, the prefetch is the first
+    # call made, ahead of the history render and the echo of the question
+    tree = ast.parse(Path(__file__).parents[2].joinpath("rowdy_stream.py").read_text())
+    admitted = next(
+        node for node in ast.walk(tree)
+        if isinstance(node, ast.With) and ast.unparse(node.items[0].context_expr).startswith("resources.admit(")
+    )
+    calls = sorted(
+        (node for statement in admitted.body for node in ast.walk(statement) if isinstance(node, ast.Call)),
+        key=lambda node: (node.lineno, node.col_offset),
+    )
+    names = [ast.unparse(call.func) for call in calls]
+    render = [i for i, name in enumerate(names) if name in ("show_messages", "st.chat_message", "st.write")]
+    assert names.index("resources.prefetch") < min(render)
@@ -0,0 +1,75 @@
+import json
+
+import pytest
+
+pytest.importorskip("opentelemetry.sdk")
+pytest.importorskip("prometheus_client")
+
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+from prometheus_client import CollectorRegistry
+
+from rowdy.chain import build_chain
+from rowdy.fakes import LatencyChatModel, LatencyRetriever, sample_documents
+from rowdy.retrieval import CachingRetriever, RetrievalCache
+from rowdy.telemetry import NoopTelemetry, Telemetry, build_telemetry
+
+
+def make_telemetry(caches=None):
+    exporter = InMemorySpanExporter()
+    provider = TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    registry = CollectorRegistry()
+    return Telemetry(provider.get_tracer("test"), registry, caches), exporter, registry
+
+
+def test_turn_emits_stage_spans_and_metrics():
+    cache = RetrievalCache()
+    telemetry, exporter, registry = make_telemetry({"retrieval": lambda: {"hits": cache.hits, "misses": cache.misses}})
+    retriever = CachingRetriever(retriever=LatencyRetriever(documents=sample_documents(5), latency=0.02), cache=cache)
+    chain = build_chain(retriever, LatencyChatModel(first_token_latency=0.03, token_latency=0.001))
+    for _ in range(2):
+        list(chain.stream({"question": "where is the registrar", "history": []}, {"callbacks": telemetry.callbacks()}))
+
+    spans = exporter.get_finished_spans()
+    assert [s.name for s in spans].count("chat_turn") == 2
+    turn = [s for s in spans if s.name == "chat_turn"][0]
+    retrieval = [s for s in spans if s.name == "retrieval"][0]
+    model = [s for s in spans if s.name == "model"][0]
+    assert [s.name for s in spans].count("retrieval") == 2
+    assert retrieval.parent.span_id == turn.context.span_id
+    assert model.parent.span_id == turn.context.span_id
+    assert retrieval.attributes["documents"] == 5
+    assert model.attributes["prompt_tokens"] > 0
+    assert model.attributes["ttft_ms"] >= 30
+
+    assert registry.get_sample_value("rowdy_stage_seconds_count", {"stage": "retrieval"}) == 2
+    assert registry.get_sample_value("rowdy_stage_seconds_sum", {"stage": "retrieval"}) >= 0.02
+    assert registry.get_sample_value("rowdy_ttft_seconds_count", {"model": "latency-fake"}) == 2
+    assert registry.get_sample_value("rowdy_cache_hits_total", {"cache": "retrieval"}) == 1
+    assert not telemetry.handler._runs and not telemetry.handler._parents
+
+    with telemetry.stage("render"):
+        pass
+    assert registry.get_sample_value("rowdy_stage_seconds_count", {"stage": "render"}) == 1
+
+
+def test_disabled_telemetry_adds_nothing():
+    telemetry = build_telemetry({})
+    assert isinstance(telemetry, NoopTelemetry)
+    assert telemetry.callbacks() == []
+    with telemetry.stage("render"):
+        telemetry.observe_stage("render", 1.0)
+
+
+def test_file_exporter_writes_json_lines(tmp_path):
+    path = tmp_path / "spans.jsonl"
+    telemetry = build_telemetry({"TELEMETRY": "file", "TELEMETRY_FILE": str(path)})
+    with telemetry.stage("render", chars=10):
+        pass
+    telemetry.shutdown()
+    span = json.loads(path.read_text().splitlines()[0])
+    assert span["name"] == "render"
+    assert span["attributes"] == {"chars": 10}
+    assert span["duration_ms"] >= 0
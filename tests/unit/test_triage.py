@@ -0,0 +1,72 @@
+import asyncio
+
+from rowdy.chain import build_chain
+from rowdy.fakes import LatencyChatModel, LatencyRetriever, sample_documents
+from rowdy.resources import Resources
+from rowdy.triage import CANNED, FACTOID, FULL, QueryTriage, with_triage
+
+
+def test_classify_routes():
+    triage = QueryTriage()
+    assert triage.classify("Hi!").route == CANNED
+    assert "welcome" in triage.classify("thanks so much").response
+    assert triage.classify("Tell me a joke").route == CANNED
+    assert triage.classify("What's the registrar's phone number?").route == FACTOID
+    assert triage.classify("When is spring break?").route == FACTOID
+    assert triage.classify("Why should I pick the honors college over regular admission?").route == FULL
+    assert triage.classify("How do I appeal a grade and what are the steps?").route == FULL
+    # Multi-step answers would be cut off by the factoid output cap
+    assert triage.classify("What is the process to transfer credits from another university?").route == FULL
+    assert triage.classify("What are the admission requirements for the nursing program?").route == FULL
+    assert triage.classify("What are the steps to declare a minor?").route == FULL
+    assert triage.classify("Where do I apply for on-campus housing?").route == FULL
+    assert triage.classify("How do I get a parking permit?").route == FULL
+    # "plan" is only complex as planning, not as a named plan
+    assert triage.classify("What is the meal plan price?").route == FACTOID
+    assert triage.classify("Where is the parking plan?").route == FACTOID
+    assert triage.classify("When is the best time to plan my schedule?").route == FULL
+    # Out-of-scope lookalikes that mention the university are not refused
+    assert triage.classify("What is the capital campaign at UMass Lowell?").route != CANNED
+    # Follow-ups need the conversation
+    assert triage.classify("When is it open?", history=["earlier turn"]).route == FULL
+
+
+def make_chain():
+    full_model = LatencyChatModel(response="A long and careful answer.", first_token_latency=0, token_latency=0)
+    factoid_model = LatencyChatModel(response="978-934-2000", first_token_latency=0, token_latency=0)
+    full = build_chain(LatencyRetriever(documents=sample_documents(12), latency=0), full_model)
+    factoid = build_chain(LatencyRetriever(documents=sample_documents(3), latency=0), factoid_model)
+    triage = QueryTriage()
+    return with_triage(full, factoid, triage), triage, full_model, factoid_model
+
+
+def test_with_triage_streams_each_route():
+    chain, triage, full_model, factoid_model = make_chain()
+
+    def ask(question):
+        chunks = list(chain.stream({"question": question, "history": []}))
+        context = [c["context"] for c in chunks if "context" in c][0]
+        return "".join(c.get("response", "") for c in chunks), len(context)
+
+    assert ask("hello") == ("Hi, I'm Rowdy the Riverhawk! Ask me anything about UMass Lowell.", 0)
+    assert ask("What is the registrar's phone number?") == ("978-934-2000", 3)
+    assert ask("Can you explain how transfer credits are evaluated?") == ("A long and careful answer.", 12)
+    assert full_model.calls == 1 and factoid_model.calls == 1
+
+    async def aask(question):
+        return "".join([c.get("response", "") async for c in chain.astream({"question": question, "history": []})])
+
+    assert asyncio.run(aask("good morning")).startswith("Hi")
+    stats = triage.stats()
+    assert stats["requests"] == 4
+    assert stats["routes"][CANNED]["share"] == 0.5
+    assert stats["saved_ms"] >= 0
+
+
+def test_resources_build_triaged_chain():
+    resources = Resources({"MODEL": "ANTHROPIC", "KB_ID": "x", "AWS_ACCESS_KEY_ID": "a",
+                           "AWS_SECRET_ACCESS_KEY": "b", "TRIAGE": "true"})
+    assert resources.chain.name == "triage"
+    assert resources.factoid_retriever.retriever.retrieval_config.vectorSearchConfiguration.numberOfResults == 3
+    assert resources.factoid_model.max_tokens == 256
+    assert resources.model.max_tokens == 2048
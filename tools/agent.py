@@ -3,307 +3,404 @@ import os
 from dotenv import load_dotenv
 import json
 from botocore.exceptions import ClientError
-from logging import *
 import random
-import string
+import re
 import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, NamedTuple, Optional, Sequence
 
 load_dotenv()
 
 AWS_ID = os.getenv('AWS_ACCESS_KEY_ID')
 AWS_KEY = os.getenv('AWS_SECRET_ACCESS_KEY')
+REGION = 'us-east-1'
+
+# ------------------------------------------------------
+# Agent provisioning
+#
+# An AgentProvisioner owns one boto3 session and its bedrock-agent and IAM
+# clients. provision() is idempotent: the execution role, agent and alias
+# are looked up by name, created if missing, and only updated when the
+# desired settings differ from what is deployed. Status changes are
+# polled with exponential backoff instead of fixed sleeps, and the role
+# and prompts are prepared concurrently. provision_many() runs one
+# provisioning per agent (e.g. one per team) on a thread pool.
+
+PROMPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'prompts')
+MODEL_ID = 'amazon.titan-text-premier-v1:0'
+ROLE_PREFIX = 'AmazonBedrockExecutionRoleForAgents_'
+POLICY_NAME = 'AmazonBedrockExecutionRoleForAgents'
+
+# Status values that mean an agent or alias is done changing
+AGENT_READY = {'NOT_PREPARED', 'PREPARED'}
+ALIAS_READY = {'PREPARED'}
+FAILED = {'FAILED', 'DELETING'}
+
+# ValidationException messages that clear up on their own: a new role that
+# Bedrock cannot assume yet, or an agent still changing state
+TRANSIENT = re.compile(r"assum|\b(creating|updating|preparing|versioning) state", re.IGNORECASE)
+
+
+class ProvisioningError(Exception):
+    pass
+
+
+class Backoff(NamedTuple):
+    initial: float = 0.5
+    factor: float = 2.0
+    maximum: float = 10.0
+    timeout: float = 300.0
+
+    # Delays with full jitter in [delay / 2, delay]
+    def delays(self):
+        delay = self.initial
+        while True:
+            yield random.uniform(delay / 2, delay)
+            delay = min(delay * self.factor, self.maximum)
+
+
+class AgentSpec(NamedTuple):
+    name: str
+    alias_name: Optional[str] = None
+    # An existing alias to update (AGENT_ALIAS in .env), whatever its name
+    alias_id: Optional[str] = None
+    model_id: str = MODEL_ID
+    description: str = 'Testing'
+    idle_ttl: int = 123
+    prompts_dir: str = PROMPTS_DIR
+
+
+class ProvisionResult(NamedTuple):
+    name: str
+    agent_id: str
+    alias_id: str
+    action: str  # "created", "updated" or "unchanged"
+
+
+def load_prompts(prompts_dir=PROMPTS_DIR):
+    prompts = {}
+    for key, name in [('base', 'base_prompt.txt'), ('kb', 'knowledge_base.txt'), ('instruction', 'instructions.txt')]:
+        with open(os.path.join(prompts_dir, name), 'r') as file:
+            prompts[key] = file.read()
+    return prompts
+
+
+def prompt_configurations(prompts):
+    def configuration(template, prompt_type):
+        return {
+            'basePromptTemplate': template,
+            'inferenceConfiguration': {
+                'maximumLength': 256,
+                'temperature': 0,
+                'topK': 123,
+                'topP': 0.1
+            },
+            'parserMode': 'DEFAULT',
+            'promptCreationMode': 'OVERRIDDEN',
+            'promptState': 'ENABLED',
+            'promptType': prompt_type
+        }
 
-# Prompts
-
-with open('prompts/base_prompt.txt', 'r') as file:
-    prompt = file.read()
-
-with open('prompts/knowledge_base.txt', 'r') as file:
-    kb = file.read()
-
-with open('prompts/instructions.txt', 'r') as file:
-    instruction = file.read()
-
-bedrock = boto3.client(
-    service_name='bedrock-agent', 
-    region_name='us-east-1',
-    aws_access_key_id=AWS_ID,
-    aws_secret_access_key=AWS_KEY
-)
-
-def generate_random_string(length):
-    letters = string.ascii_letters + string.digits
-    return ''.join(random.choice(letters) for _ in range(length))
-
-def create_agent_role(model_id, policy_name):
-    role_name = f"AmazonBedrockExecutionRoleForAgents_{generate_random_string(10)}"
-    model_arn = f"arn:aws:bedrock:us-east-1::foundation-model/{model_id}*"
-
-    print("Creating an an execution role for the agent...")
-
-    iam_resource=boto3.resource(
-        service_name="iam",
-        region_name='us-east-1',
-        aws_access_key_id=AWS_ID,
-        aws_secret_access_key=AWS_KEY           
-    )
-
-    try:
-        role = iam_resource.create_role(
-            RoleName=role_name,
-            AssumeRolePolicyDocument=json.dumps(
-                {
-                    "Version": "2012-10-17",
-                    "Statement": [
-                        {
-                            "Effect": "Allow",
-                            "Principal": {"Service": "bedrock.amazonaws.com"},
-                            "Action": "sts:AssumeRole",
-                        }
-                    ],
-                }
-            ),
+    return {'promptConfigurations': [
+        configuration(prompts['base'], 'ORCHESTRATION'),
+        configuration(prompts['kb'], 'KNOWLEDGE_BASE_RESPONSE_GENERATION'),
+    ]}
+
+
+def role_policy(model_id):
+    return {
+        "Version": "2012-10-17",
+        "Statement": [
+            {
+                "Effect": "Allow",
+                "Action": "bedrock:InvokeModel",
+                "Resource": f"arn:aws:bedrock:{REGION}::foundation-model/{model_id}*",
+            },
+            {
+                "Effect": "Allow",
+                "Action": "bedrock:Retrieve",
+                "Resource": "*"
+            }
+        ],
+    }
+
+
+ASSUME_ROLE_POLICY = {
+    "Version": "2012-10-17",
+    "Statement": [
+        {
+            "Effect": "Allow",
+            "Principal": {"Service": "bedrock.amazonaws.com"},
+            "Action": "sts:AssumeRole",
+        }
+    ],
+}
+
+
+# True if any value set in desired is missing or different in current.
+# Fields the service adds (timestamps, ARNs, defaults) are ignored.
+def differs(desired, current):
+    if isinstance(desired, dict):
+        return not isinstance(current, dict) or any(differs(v, current.get(k)) for k, v in desired.items())
+    if isinstance(desired, list):
+        if not isinstance(current, list):
+            return True
+        # Prompt configurations are matched by type: GetAgent returns every
+        # prompt type, not only the ones that are overridden
+        if desired and all(isinstance(d, dict) and 'promptType' in d for d in desired):
+            by_type = {c.get('promptType'): c for c in current if isinstance(c, dict)}
+            return any(differs(d, by_type.get(d['promptType'])) for d in desired)
+        return len(desired) != len(current) or any(differs(d, c) for d, c in zip(desired, current))
+    return desired != current
+
+
+def role_name(agent_name):
+    return (ROLE_PREFIX + re.sub(r'[^\w+=,.@-]', '-', agent_name))[:64]
+
+
+class AgentProvisioner:
+    def __init__(self, session=None, backoff=Backoff(), sleep: Callable[[float], None] = time.sleep,
+                 max_workers=8):
+        self.session = session or boto3.Session(
+            aws_access_key_id=AWS_ID,
+            aws_secret_access_key=AWS_KEY,
+            region_name=REGION
+        )
+        # boto3 clients are thread-safe once created; create them up front
+        self.bedrock = self.session.client('bedrock-agent')
+        self.iam = self.session.client('iam')
+        self.backoff = backoff
+        self.sleep = sleep
+        self.max_workers = max_workers
+        self._agents = None
+
+    def wait_for(self, describe: Callable[[], str], ready, what):
+        deadline = time.monotonic() + self.backoff.timeout
+        for delay in self.backoff.delays():
+            status = describe()
+            if status in ready:
+                return status
+            if status in FAILED:
+                raise ProvisioningError(f"{what} is {status}")
+            if time.monotonic() + delay > deadline:
+                raise ProvisioningError(f"Timed out waiting for {what} (last status {status})")
+            self.sleep(delay)
+
+    def wait_for_agent(self, agent_id, ready=AGENT_READY):
+        return self.wait_for(
+            lambda: self.bedrock.get_agent(agentId=agent_id)['agent']['agentStatus'], ready, f"agent {agent_id}"
         )
 
-        role.Policy(policy_name).put(
-            PolicyDocument=json.dumps(
-                {
-                    "Version": "2012-10-17",
-                    "Statement": [
-                        {
-                            "Effect": "Allow",
-                            "Action": "bedrock:InvokeModel",
-                            "Resource": model_arn,
-                        },
-                        {
-                            "Effect": "Allow",
-                            "Action": "bedrock:Retrieve",
-                            "Resource": "*"
-                        }
-                    ],
-                }
-            )
+    def wait_for_alias(self, agent_id, alias_id):
+        return self.wait_for(
+            lambda: self.bedrock.get_agent_alias(agentId=agent_id, agentAliasId=alias_id)['agentAlias']['agentAliasStatus'],
+            ALIAS_READY, f"alias {alias_id}"
         )
-    except ClientError as e:
-        print(f"Couldn't create role {role_name}. Here's why: {e}")
-        raise
-
-    sts_client = boto3.client(
-        service_name='sts', 
-        region_name='us-east-1',
-        aws_access_key_id=AWS_ID,
-        aws_secret_access_key=AWS_KEY
-    )
-    
-    caller_identity = sts_client.get_caller_identity()
-    account_id = caller_identity['Account']
 
-    returnStr = f"arn:aws:iam::{account_id}:role/{role_name}"
-    return returnStr
+    # A role created a moment ago is not yet assumable by Bedrock; retry
+    # the call with backoff while the service rejects it for that reason.
+    # Any other validation error is a bad request and raised at once.
+    def retry(self, call, *args, **kwargs):
+        deadline = time.monotonic() + self.backoff.timeout
+        for delay in self.backoff.delays():
+            try:
+                return call(*args, **kwargs)
+            except ClientError as e:
+                error = e.response['Error']
+                if (error['Code'] != 'ValidationException' or not TRANSIENT.search(error.get('Message', ''))
+                        or time.monotonic() + delay > deadline):
+                    raise
+            self.sleep(delay)
+
+    # Agent summaries by name, listed once per provisioner
+    def agents(self, refresh=False):
+        if self._agents is None or refresh:
+            agents = {}
+            for page in self.bedrock.get_paginator('list_agents').paginate():
+                for summary in page['agentSummaries']:
+                    agents[summary['agentName']] = summary
+            self._agents = agents
+        return self._agents
+
+    def ensure_role(self, spec, name=None):
+        name = name or role_name(spec.name)
+        policy = role_policy(spec.model_id)
+        try:
+            role = self.iam.get_role(RoleName=name)['Role']
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'NoSuchEntity':
+                raise
+            print(f"Creating execution role {name}...")
+            role = self.iam.create_role(RoleName=name, AssumeRolePolicyDocument=json.dumps(ASSUME_ROLE_POLICY))['Role']
+            current = None
+        else:
+            try:
+                current = self.iam.get_role_policy(RoleName=name, PolicyName=POLICY_NAME)['PolicyDocument']
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'NoSuchEntity':
+                    raise
+                current = None
+        if isinstance(current, str):
+            current = json.loads(current)
+        if current != policy:
+            self.iam.put_role_policy(RoleName=name, PolicyName=POLICY_NAME, PolicyDocument=json.dumps(policy))
+        return role['Arn']
+
+    def desired_agent(self, spec, role_arn, prompts):
+        return {
+            'agentName': spec.name,
+            'agentResourceRoleArn': role_arn,
+            'description': spec.description,
+            'foundationModel': spec.model_id,
+            'idleSessionTTLInSeconds': spec.idle_ttl,
+            'instruction': prompts['instruction'],
+            'promptOverrideConfiguration': prompt_configurations(prompts),
+        }
 
-# Create Amazon Bedrock Agent
-def create_agent(agent_name):
-    response = bedrock.create_agent(
-        agentName=agent_name,
-        agentResourceRoleArn=create_agent_role('amazon.titan-text-premier-v1:0', 'AmazonBedrockExecutionRoleForAgents'),
-        description='Testing',
-        foundationModel='amazon.titan-text-premier-v1:0',
-        idleSessionTTLInSeconds=123,
-        instruction=instruction,
-        promptOverrideConfiguration={
-            'promptConfigurations': [
-                {
-                    'basePromptTemplate': prompt,
-                    'inferenceConfiguration': {
-                        'maximumLength': 256,
-                        'temperature': 0, 
-                        'topK': 123,
-                        'topP': 0.1
-                    },
-                    'parserMode': 'DEFAULT',
-                    'promptCreationMode': 'OVERRIDDEN',
-                    'promptState': 'ENABLED',
-                    'promptType': 'ORCHESTRATION'
-                },
-
-                {
-                    'basePromptTemplate': kb,
-                    'inferenceConfiguration': {
-                        'maximumLength': 256,
-                        'temperature': 0,
-                        'topK': 123,
-                        'topP': 0.1
-                    },
-                    'parserMode': 'DEFAULT',
-                    'promptCreationMode': 'OVERRIDDEN',
-                    'promptState': 'ENABLED',
-                    'promptType': 'KNOWLEDGE_BASE_RESPONSE_GENERATION'
-                }
+    def ensure_alias(self, agent_id, alias_name, changed, alias_id=None):
+        if alias_id is not None:
+            alias = self.bedrock.get_agent_alias(agentId=agent_id, agentAliasId=alias_id)['agentAlias']
+        else:
+            aliases = [
+                summary
+                for page in self.bedrock.get_paginator('list_agent_aliases').paginate(agentId=agent_id)
+                for summary in page['agentAliasSummaries']
             ]
-        },
-        tags={
-            'string': 'string'
-        }
-    )
+            alias = next((a for a in aliases if a['agentAliasName'] == alias_name), None)
+        if alias is None:
+            alias_id = self.bedrock.create_agent_alias(
+                agentAliasName=alias_name,
+                agentId=agent_id,
+                description='Automatic CI/CD Alias'
+            )['agentAlias']['agentAliasId']
+        else:
+            alias_id = alias['agentAliasId']
+            if changed:
+                # Without a routing configuration, this points the alias at a new version
+                self.bedrock.update_agent_alias(agentAliasId=alias_id, agentAliasName=alias['agentAliasName'],
+                                                agentId=agent_id)
+        if alias is None or changed:
+            self.wait_for_alias(agent_id, alias_id)
+        return alias_id
+
+    def provision(self, spec, pool=None):
+        own_pool = pool is None
+        pool = pool or ThreadPoolExecutor(max_workers=2)
+        try:
+            prompts = pool.submit(load_prompts, spec.prompts_dir)
+            existing = self.agents().get(spec.name)
+            current = self.bedrock.get_agent(agentId=existing['agentId'])['agent'] if existing else None
+            # An existing agent keeps the role it runs as, so agents created
+            # before roles were named after them are not moved to a new role
+            name = current['agentResourceRoleArn'].rsplit('/', 1)[-1] if current else None
+            role = pool.submit(self.ensure_role, spec, name)
+            desired = self.desired_agent(spec, role.result(), prompts.result())
+        finally:
+            if own_pool:
+                pool.shutdown()
+
+        if existing is None:
+            print(f"Creating agent {spec.name}...")
+            agent = self.retry(self.bedrock.create_agent, **desired)['agent']
+            agent_id, action = agent['agentId'], 'created'
+            self.wait_for_agent(agent_id)
+        else:
+            agent_id = existing['agentId']
+            if differs(desired, current):
+                print(f"Updating agent {spec.name}...")
+                self.wait_for_agent(agent_id)
+                self.retry(self.bedrock.update_agent, agentId=agent_id, **desired)
+                self.wait_for_agent(agent_id)
+                action = 'updated'
+            else:
+                action = 'unchanged'
+
+        changed = action != 'unchanged'
+        if changed:
+            self.bedrock.prepare_agent(agentId=agent_id)
+            self.wait_for_agent(agent_id, ready={'PREPARED'})
+        alias_id = self.ensure_alias(agent_id, spec.alias_name or f"{spec.name}_alias", changed, spec.alias_id)
+        return ProvisionResult(spec.name, agent_id, alias_id, action)
+
+    def provision_many(self, specs: Sequence[AgentSpec]) -> List[ProvisionResult]:
+        self.agents(refresh=True)
+        # Role and prompt steps get their own pool, so agent threads blocked
+        # on them can never take all the workers
+        with ThreadPoolExecutor(max_workers=self.max_workers) as steps, \
+                ThreadPoolExecutor(max_workers=self.max_workers) as agents:
+            return list(agents.map(lambda spec: self.provision(spec, steps), specs))
+
+
+_provisioner = None
+
+
+def provisioner():
+    global _provisioner
+    if _provisioner is None:
+        _provisioner = AgentProvisioner()
+    return _provisioner
 
-    time.sleep(5)
-    prepare_agent(response['agent']['agentId'])
 
-    time.sleep(3)
-    alias_response = create_alias(response['agent']['agentId'], f"{agent_name}_alias")
+# Create Amazon Bedrock Agent
+def create_agent(agent_name):
+    result = provisioner().provision(AgentSpec(agent_name))
 
     # Add AGENT_ID = response['agent']['agentId'] to .env file. If the files doesn't exit create one
-    write_agent_id(response['agent']['agentId'])
-    write_agent_alias(alias_response['agentAlias']['agentAliasId'])
+    write_agent_id(result.agent_id)
+    write_agent_alias(result.alias_id)
 
-    return f"Agent Information: https://us-east-1.console.aws.amazon.com/bedrock/home?region=us-east-1#/agents/{response['agent']['agentId']}/"
+    return f"Agent Information: https://us-east-1.console.aws.amazon.com/bedrock/home?region=us-east-1#/agents/{result.agent_id}/"
 
-def write_agent_id(agent_id):
+def write_env(key, value):
     env_path = '.env'
-    agent_id_line = f"AGENT_ID = {agent_id}\n"
+    env_line = f"{key} = {value}\n"
     try:
         with open(env_path, 'r') as file:
             lines = file.readlines()
-        
-        with open(env_path, 'w') as file:
-            agent_id_found = False
-            for line in lines:
-                if line.startswith('AGENT_ID'):
-                    file.write(agent_id_line)
-                    agent_id_found = True
-                else:
-                    file.write(line)
-            if not agent_id_found:
-                file.write(agent_id_line)
-    except FileNotFoundError:
-        with open(env_path, 'w') as file:
-            file.write(agent_id_line)
 
-def write_agent_alias(agent_id):
-    env_path = '.env'
-    agent_id_line = f"AGENT_ALIAS = {agent_id}\n"
-    try:
-        with open(env_path, 'r') as file:
-            lines = file.readlines()
-        
         with open(env_path, 'w') as file:
-            agent_id_found = False
+            found = False
             for line in lines:
-                if line.startswith('AGENT_ALIAS'):
-                    file.write(agent_id_line)
-                    agent_id_found = True
+                if line.startswith(key):
+                    file.write(env_line)
+                    found = True
                 else:
                     file.write(line)
-            if not agent_id_found:
-                file.write(agent_id_line)
+            if not found:
+                file.write(env_line)
     except FileNotFoundError:
         with open(env_path, 'w') as file:
-            file.write(agent_id_line)
-
-def list_agents():
-    response = bedrock.list_agents(
-        maxResults=123,
-    )
-
-    for summary in response['agentSummaries']:
-        print(f"Agent Name: {summary['agentName']}, Agent ID: {summary['agentId']}")
+            file.write(env_line)
 
-def prepare_agent(agent_id):
-
-    preparation = bedrock.prepare_agent(
-        agentId=agent_id
-    )
-
-def update_agent(agent_id, agent_name):
-
-    ARN = response = bedrock.get_agent(agentId=agent_id).get('agent').get('agentResourceRoleArn')
+def write_agent_id(agent_id):
+    write_env('AGENT_ID', agent_id)
 
-    response = bedrock.update_agent(
-        agentId=agent_id,
-        agentName=agent_name,
-        agentResourceRoleArn=ARN,
-        description='Testing',
-        foundationModel='amazon.titan-text-premier-v1:0',
-        idleSessionTTLInSeconds=123,
-        instruction=instruction,
-        promptOverrideConfiguration={
-            'promptConfigurations': [
-                {
-                    'basePromptTemplate': prompt,
-                    'inferenceConfiguration': {
-                        'maximumLength': 256,
-                        'temperature': 0, 
-                        'topK': 123,
-                        'topP': 0.1
-                    },
-                    'parserMode': 'DEFAULT',
-                    'promptCreationMode': 'OVERRIDDEN',
-                    'promptState': 'ENABLED',
-                    'promptType': 'ORCHESTRATION'
-                },
-
-                {
-                    'basePromptTemplate': kb,
-                    'inferenceConfiguration': {
-                        'maximumLength': 256,
-                        'temperature': 0,
-                        'topK': 123,
-                        'topP': 0.1
-                    },
-                    'parserMode': 'DEFAULT',
-                    'promptCreationMode': 'OVERRIDDEN',
-                    'promptState': 'ENABLED',
-                    'promptType': 'KNOWLEDGE_BASE_RESPONSE_GENERATION'
-                }
-            ]
-        },
-    )
+def write_agent_alias(agent_id):
+    write_env('AGENT_ALIAS', agent_id)
 
+def list_agents():
+    for name, summary in provisioner().agents(refresh=True).items():
+        print(f"Agent Name: {name}, Agent ID: {summary['agentId']}")
 
-def delete_agent():
-    list_agents()
+def update_agent(agent_id, alias_id=None):
+    agent_name = provisioner().bedrock.get_agent(agentId=agent_id)['agent']['agentName']
+    return provisioner().provision(AgentSpec(agent_name, alias_id=alias_id or None))
 
-    agent_id = input("Enter the agent ID you want to delete: ")
+def delete_agent(agent_id=None):
+    if agent_id is None:
+        list_agents()
+        agent_id = input("Enter the agent ID you want to delete: ")
 
-    response = bedrock.delete_agent(
+    response = provisioner().bedrock.delete_agent(
         agentId=agent_id,
         skipResourceInUseCheck=True
     )
 
 def list_agent_aliases(agentId):
-    response = bedrock.list_agent_aliases(
+    response = provisioner().bedrock.list_agent_aliases(
         agentId=agentId,
         maxResults=123
     )
 
     for summary in response['agentAliasSummaries']:
         print(f"Alias Name: {summary['agentAliasName']}, Alias ID: {summary['agentAliasId']}")
-
-def create_alias(agentId, alias_name):
-    response = bedrock.create_agent_alias(
-        agentAliasName=alias_name,
-        agentId=agentId,
-        description='Automatic CI/CD Alias'
-    )
-
-    return response
-
-def update_alias(agent_alias_id, agent_id):
-    response = bedrock.get_agent_alias(
-        agentAliasId=agent_alias_id,
-        agentId=agent_id
-    )
-
-    # version = response = bedrock.get_agent(agentId=agent_id).get('agent').get('agentVersion')
-    # print(version)
-
-    update_response = bedrock.update_agent_alias (
-        agentAliasId=agent_alias_id,
-        agentAliasName=response['agentAlias']['agentAliasName'],
-        agentId=agent_id
-    )
-
-# if __name__ == "__main__":
-#     update_alias('D4SKTGD7AO', 'P7XE1HDAQG')
-
-    
\ No newline at end of file
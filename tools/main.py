@@ -8,13 +8,6 @@ load_dotenv()
 AGENT_ID = os.getenv("AGENT_ID")
 AGENT_ALIAS = os.getenv("AGENT_ALIAS")
 
-bedrock = boto3.client(
-    service_name='bedrock-agent', 
-    region_name='us-east-1',
-    aws_access_key_id=AWS_ID,
-    aws_secret_access_key=AWS_KEY
-)
-
 
 if __name__ == "__main__":
     # Initialize the parser
@@ -37,6 +30,11 @@ if __name__ == "__main__":
     # Update subcommand
     update_parser = subparsers.add_parser("update", help="Update an existing agent")
 
+    # Provision subcommand
+    provision_parser = subparsers.add_parser("provision", help="Create or update several agents, e.g. one per team")
+    provision_parser.add_argument("agent_names", nargs="+", help="Names of the agents to create or update")
+    provision_parser.add_argument("--workers", type=int, default=8, help="Agents provisioned at the same time")
+
     # Test subcommand
     test_parser = subparsers.add_parser("test", help="Test the agent")
 
@@ -53,10 +51,11 @@ if __name__ == "__main__":
         case "list":
             list_agents()
         case "update":
-            name = bedrock.get_agent(agentId=AGENT_ID)['agent']['agentName']
-            update_agent(AGENT_ID, name)
-            time.sleep(5)
-            update_alias(AGENT_ALIAS, AGENT_ID)
+            print(update_agent(AGENT_ID, AGENT_ALIAS))
+        case "provision":
+            engine = AgentProvisioner(max_workers=args.workers)
+            for result in engine.provision_many([AgentSpec(name) for name in args.agent_names]):
+                print(f"{result.name}: {result.action} (agent {result.agent_id}, alias {result.alias_id})")
         case "test":
             url = f"https://us-east-1.console.aws.amazon.com/bedrock/home?region=us-east-1#/agents/{AGENT_ID}/alias/{AGENT_ALIAS}"
             print(f"Test the Agent at {url}")